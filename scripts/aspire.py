@@ -19,7 +19,7 @@ from aspire.aspire.class_averaging import ClassAverages
 from aspire.aspire.preprocessor import PreProcessor
 from aspire.aspire.utils.compare_stacks import compare_stack_files
 from aspire.aspire.utils.data_utils import load_stack_from_file
-from aspire.aspire.utils.helpers import yellow, requires_binaries, set_output_name, red
+from aspire.aspire.utils.helpers import yellow, set_output_name, red
 from aspire.aspire.utils.viewstack import view_stack
 
 
@@ -89,7 +89,6 @@ def abinitio_cmd(stack_file, output):
 @click.option("--classification_nn", default=100,
               help=("Number of nearest neighbors to find for each "
                     "image during initial classification. (default=100)"))
-@requires_binaries('bessel.npy')
 def classify_cmd(stack_file, output, avg_nn, classification_nn):
     """ \b
         ############################
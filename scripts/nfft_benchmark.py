@@ -0,0 +1,25 @@
+from aspire.nfft.benchmark import benchmark
+from aspire.utils.config import ConfigArgumentParser
+
+
+if __name__ == '__main__':
+
+    parser = ConfigArgumentParser(description='Benchmark NUFFT backends and save a profile used to pick the fastest.')
+    parser.add_argument('--dims', default=[2, 3], type=int, nargs='+', help='Dimensions to benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        help='Image/volume sizes to benchmark. If unspecified, a default set of sizes is used.')
+    parser.add_argument('--epsilons', default=[1e-6, 1e-12], type=float, nargs='+', help='Precisions to benchmark')
+    parser.add_argument('--backends', nargs='+', help='Backends to benchmark. If unspecified, all usable backends.')
+    parser.add_argument('--repeat', default=3, type=int, help='No. of times each operation is timed')
+    parser.add_argument('--output', help='Path of the JSON profile. If unspecified, config.nfft.profile is used.')
+
+    with parser.parse_args() as args:
+
+        benchmark(
+            dims=args.dims,
+            sizes=args.sizes,
+            epsilons=args.epsilons,
+            backends=args.backends,
+            repeat=args.repeat,
+            path=args.output
+        )
@@ -13,12 +13,11 @@ setup(
         'importlib_resources>=1.0.2',
         'mrcfile',
         'python-box',
-        'finufftpy',
         'console_progressbar',
         'pyfftw',
         'click',
         'matplotlib',
-        'numpy',
+        'numpy>=1.17',
         'pandas>=0.23.4',
         'scipy==0.19.1',
         'tqdm',
@@ -26,6 +25,13 @@ setup(
         'scikit-image'
     ],
 
+    # Faster NUFFT backends; without these, the pure NumPy/SciPy 'gridding' backend is used
+    # (threadpoolctl lets their OpenMP threads be limited to the NUFFT thread budget)
+    extras_require={
+        'finufft': ['finufftpy', 'threadpoolctl>=3.0'],
+        'pynfft': ['pynfft', 'threadpoolctl>=3.0']
+    },
+
     package_dir={'': 'src'},
     packages=find_namespace_packages(where='src'),
     package_data={'aspire': ['config.ini']},
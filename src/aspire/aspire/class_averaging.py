@@ -13,7 +13,7 @@ from console_progressbar import ProgressBar
 
 from numpy.polynomial.legendre import leggauss
 
-from aspire.aspire.common.config import ClassAveragesConfig
+from aspire.basis.basis_func import besselj_zeros_table
 from aspire.aspire.utils.data_utils import mat_to_npy, mat_to_npy_vec, load_stack_from_file, c_to_fortran
 from aspire.aspire.utils.array_utils import estimate_snr, image_grid, cfft2, icfft2
 from aspire.aspire.common.logger import logger
@@ -599,9 +599,20 @@ def lgwt(n, a, b):
     return SamplePoints(x, w)
 
 
+def bessel_table(bound):
+    """
+    Tabulate the zeros R_nk of the Bessel functions J_n of integer orders n with R_n(k+1) <= bound, from the table of
+    Bessel zeros shared with the bases in aspire.basis.
+    :param bound: The bound on the zeros.
+    :return: An array with one row [n, k, R_nk, R_n(k+1)] per zero (k starting at 1), ordered by n, then k.
+    """
+    k_max, zeros = besselj_zeros_table(0, np.nextafter(bound, np.inf))
+    n, k = np.nonzero(np.arange(1, zeros.shape[0] + 1)[np.newaxis, :] < k_max[:, np.newaxis])
+    return np.column_stack((n, k + 1, zeros[k, n], zeros[k + 1, n]))
+
+
 def bessel_ns_radial(bandlimit, support_size, x):
-    bessel = np.load(ClassAveragesConfig.bessel_file)
-    bessel = bessel[bessel[:, 3] <= 2 * np.pi * bandlimit * support_size, :]
+    bessel = bessel_table(2 * np.pi * bandlimit * support_size)
     angular_freqs = bessel[:, 0]
     max_ang_freq = int(np.max(angular_freqs))
     n_theta = int(np.ceil(16 * bandlimit * support_size))
@@ -827,8 +838,7 @@ def ift_fb(support_size, bandlimit):
     theta = theta[inside_circle]
     r = r[inside_circle]
 
-    bessel = np.load(ClassAveragesConfig.bessel_file)
-    bessel = bessel[bessel[:, 3] <= 2 * np.pi * bandlimit * support_size, :]
+    bessel = bessel_table(2 * np.pi * bandlimit * support_size)
     k_max = int(np.max(bessel[:, 0]))
     fn = []
 
@@ -6,7 +6,7 @@ class AspireConfig:
 
 
 class ClassAveragesConfig(AspireConfig):
-    bessel_file = "./binaries/bessel.npy"
+    pass
 
 
 class AbinitioConfig(AspireConfig):
@@ -1,11 +1,14 @@
+import os
 import logging
+from threading import Lock
 import numpy as np
-from scipy.sparse.linalg import LinearOperator, cg
 
+from aspire import config
 from aspire.utils import ensure
 from aspire.utils.matrix import mdim_mat_fun_conj, roll_dim, unroll_dim
-from aspire.utils.matlab_compat import m_reshape
-from aspire.basis.basis_func import num_besselj_zeros
+from aspire.utils.optimize import block_cg
+from aspire.basis.basis_func import besselj_zeros_table
+from aspire.basis.precomp_cache import load_precomp, precomp_key, save_precomp
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +19,19 @@ class Basis:
     and 3D structure volumes.
 
     """
+    # Shared instances of bases, as returned by `shared`, keyed by class, size and maximum order
+    _shared = {}
+    _shared_lock = Lock()
 
     def __init__(self, size, ell_max=None):
+        """
+        :param size: The size of the domain of the basis, as a tuple.
+        :param ell_max: The maximum order of the basis functions. If None, there is no maximum.
+            If `config.basis.cache_dir` is set, precomputations of bases are cached on disk there, keyed by the
+            class, size and maximum order of the basis, so that they are computed once per machine. The arrays of
+            bases loaded from the cache are read-only.
+        """
+        key = precomp_key(type(self), size, ell_max)
         if ell_max is None:
             ell_max = np.inf
 
@@ -29,38 +43,46 @@ class Basis:
         self.ell_max = ell_max
         self.d = d
 
-        self._build()
+        cache_dir = config.basis.cache_dir and os.path.expanduser(config.basis.cache_dir)
+        state = cache_dir and load_precomp(cache_dir, key)
+        if state:
+            logger.debug(f'Loaded precomputed basis {key} from {cache_dir}')
+            self.__dict__.update(state)
+        else:
+            self._build()
+            if cache_dir:
+                save_precomp(cache_dir, key, self.__dict__)
+
+    @classmethod
+    def shared(cls, size, ell_max=None):
+        """
+        Get an instance of this basis shared by all callers in this process, built (or loaded from its on-disk cache)
+        on first use. Shared bases must not be modified.
+        :param size: The size of the domain of the basis, as a tuple.
+        :param ell_max: The maximum order of the basis functions. If None, there is no maximum.
+        :return: An instance of this class.
+        """
+        key = cls, tuple(size), ell_max
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(size, ell_max)
+            return cls._shared[key]
 
     def _getfbzeros(self):
 
         # get upper_bound of zeros of Bessel functions
         upper_bound = min(self.ell_max + 1, 2 * self.N + 1)
 
-        # List of number of zeros
-        n = []
-        # List of zero values (each entry is an ndarray; all of possibly different lengths)
-        zeros = []
-
-        # generate zeros of Bessel functions for each ell
-        for ell in range(upper_bound):
-            _n, _zeros = num_besselj_zeros(ell + (self.d - 2) / 2, self.N * np.pi / 2)
-            if _n == 0:
-                break
-            else:
-                n.append(_n)
-                zeros.append(_zeros)
+        # generate zeros of Bessel functions for all ell at once, from a table shared by all bases of this kind and size
+        k_max, r0 = besselj_zeros_table((self.d - 2) / 2, self.N * np.pi / 2, n_orders=int(upper_bound))
 
         #  get maximum number of ell
-        self.ell_max = len(n) - 1
+        self.ell_max = len(k_max) - 1
 
         #  set the maximum of k for each ell
-        self.k_max = np.array(n, dtype=int)
+        self.k_max = np.array(k_max, dtype=int)
 
-        max_num_zeros = max(len(z) for z in zeros)
-        for i, z in enumerate(zeros):
-            zeros[i] = np.hstack((z, np.zeros(max_num_zeros - len(z))))
-
-        self.r0 = m_reshape(np.hstack(zeros), (-1, self.ell_max + 1))
+        self.r0 = np.array(r0)
 
     def _build(self):
         raise NotImplementedError('subclasses must implement this')
@@ -122,7 +144,7 @@ class Basis:
         """
         return mdim_mat_fun_conj(X, len(self.sz), 1, self.evaluate_t)
 
-    def expand(self, v):
+    def expand(self, v, warm_start=False):
         """
         Expand array in basis
 
@@ -133,8 +155,13 @@ class Basis:
 
         where the rows of `B` and columns of `x` are read as vectorized arrays.
 
+        The normal equations of all arrays are solved together by conjugate gradient iterations (see `block_cg`), each
+        of which evaluates the basis (and its adjoint) once for all arrays that have not converged yet.
+
         :param v: An array whose first few dimensions are to be expanded in this basis.
             These dimensions must equal `self.sz`.
+        :param warm_start: If True, start the iterations from `self.evaluate_t(v)` (a good guess for bases that are
+            close to orthonormal), rather than from zero.
         :return: The coefficients of `v` expanded in this basis. If more than one array of size `self.sz` is found in
             `v`, the second and higher dimensions of the return value correspond to those higher dimensions of `v`.
 
@@ -144,15 +171,13 @@ class Basis:
 
         v, sz_roll = unroll_dim(v, self.d + 1)
         b = self.evaluate_t(v)
-        operator = LinearOperator(
-            shape=(self.basis_count, self.basis_count),
-            matvec=lambda x: self.evaluate_t(self.evaluate(x))
-        )
 
         # TODO: (from MATLAB implementation) - Check that this tolerance make sense for multiple columns in v
         tol = 10 * np.finfo(v.dtype).eps
         logger.info('Expanding array in basis')
-        v, info = cg(operator, b, tol=tol)
+        v, info = block_cg(
+            lambda x: self.evaluate_t(self.evaluate(x)), b, x0=b if warm_start else None, tol=tol
+        )
 
         if info != 0:
             raise RuntimeError('Unable to converge!')
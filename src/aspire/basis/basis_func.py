@@ -5,6 +5,7 @@ Define functions for Fourier-Bessel (2D), Spherical Fourier-Bessel (3D) objects.
 import sys
 
 import logging
+from functools import lru_cache
 import numpy as np
 from numpy import pi, log, exp, diff
 from scipy.special import jv, lpmv
@@ -191,13 +192,98 @@ def besselj_zeros(nu, k):
 
 
 def num_besselj_zeros(ell, r):
-    k = 4
-    r0 = besselj_zeros(ell, k)
-    while all(r0 < r):
-        k *= 2
-        r0 = besselj_zeros(ell, k)
-    r0 = r0[r0 < r]
-    return len(r0), r0
+    k_max, zeros = besselj_zeros_table(ell, r, n_orders=1)
+    if len(k_max) == 0:
+        return 0, np.zeros(0)
+    return k_max[0], zeros[:k_max[0], 0]
+
+
+def besselj_zeros_table(nu0, r, n_orders=None):
+    """
+    Compute the zeros below r of the Bessel functions J_nu of orders nu = nu0, nu0 + 1, nu0 + 2, ..., up to the first
+    order with no zeros below r (as J_nu has no zeros below nu, these are orders below r).
+    Tables are cached, so that all bases of the same kind and size are served from a single table.
+    :param nu0: The lowest order, such as 0 for Fourier-Bessel bases, or 1/2 for spherical Bessel functions.
+    :param r: The bound on the zeros.
+    :param n_orders: The max. no. of orders (None for all orders with zeros below r).
+    :return: A tuple (k_max, zeros), where k_max is a read-only array of the no. of zeros of each order, and zeros is a
+        read-only max(k_max)-by-len(k_max) array whose column ell holds the k_max[ell] zeros of order nu0 + ell, in
+        increasing order, padded with zeros.
+    """
+    k_max, zeros = _besselj_zeros_table(float(nu0), float(r))
+    if n_orders is not None and n_orders < len(k_max):
+        k_max = k_max[:n_orders]
+        zeros = zeros[:max(k_max, default=0), :n_orders]
+    return k_max, zeros
+
+
+@lru_cache(maxsize=32)
+def _besselj_zeros_table(nu0, r):
+    nus = nu0 + np.arange(max(int(np.ceil(r - nu0)), 0))
+
+    # Consecutive zeros of J_nu are more than 3 apart, so sign changes of J_nu on a grid of step 2 bracket each of its
+    # zeros. As J_nu has no zeros below nu, the grid of each order starts at nu.
+    x = np.floor(nus)[:, np.newaxis] + 2 * np.arange(int(np.ceil((r - nu0) / 2)) + 2)
+    f = np.zeros(x.shape)
+    in_grid = x - 2 <= r
+    f[in_grid] = jv(np.broadcast_to(nus[:, np.newaxis], x.shape)[in_grid], x[in_grid])
+    i_nu, i_x = np.nonzero(f[:, :-1] * f[:, 1:] < 0)
+
+    nu = nus[i_nu]
+    a, b = x[i_nu, i_x], x[i_nu, i_x + 1]
+    fa, fb = f[i_nu, i_x], f[i_nu, i_x + 1]
+
+    # Refine the zeros of all orders at once by Newton iterations, starting from linear interpolation in each bracket.
+    # Iterates leaving their bracket are replaced by its midpoint, the bracket shrinking on each iteration.
+    z = a - fa * (b - a) / (fb - fa)
+    active = np.arange(len(z))
+    c = 8
+    for i in range(64):
+        za, nua = z[active], nu[active]
+        f_z = jv(nua, za)
+        fp_z = jv(nua - 1, za) - nua * f_z / za
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dz = - f_z / fp_z
+
+        # Iterates converge as in besselj_newton
+        converged = np.abs(dz) < c * np.spacing(za)
+        z[active[converged]] = (za + dz)[converged]
+        if np.all(converged):
+            break
+        not_converged = ~converged
+        active, za, dz, f_z = active[not_converged], za[not_converged], dz[not_converged], f_z[not_converged]
+
+        left = np.sign(f_z) == np.sign(fa[active])
+        a[active[left]], fa[active[left]] = za[left], f_z[left]
+        b[active[~left]] = za[~left]
+
+        z_new = za + dz
+        outside = ~((z_new >= a[active]) & (z_new <= b[active]))
+        z_new[outside] = (a[active] + b[active])[outside] / 2
+        z[active] = z_new
+
+        # If we're not converging yet, start relaxing convergence criterion
+        if i >= 6:
+            c *= 2
+
+    below = z < r
+    i_nu, z = i_nu[below], z[below]
+
+    # Truncate the table at the first order with no zeros below r
+    k_max = np.bincount(i_nu, minlength=len(nus))
+    n_ell = np.argmax(k_max == 0) if np.any(k_max == 0) else len(k_max)
+    k_max = k_max[:n_ell]
+    i_nu, z = i_nu[i_nu < n_ell], z[i_nu < n_ell]
+
+    # The zeros are ordered by order, then value, so that their index within their order is their position in the run
+    # of zeros of that order
+    k = np.arange(len(i_nu)) - np.concatenate(([0], np.cumsum(k_max)[:-1]))[i_nu]
+    zeros = np.zeros((max(k_max, default=0), n_ell))
+    zeros[k, i_nu] = z
+
+    k_max.setflags(write=False)
+    zeros.setflags(write=False)
+    return k_max, zeros
 
 
 def unique_coords_nd(N, ndim):
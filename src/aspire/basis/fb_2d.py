@@ -1,11 +1,11 @@
 import logging
 import numpy as np
 from scipy.special import jv
-from scipy.sparse.linalg import LinearOperator, cg
 
 from aspire.utils import ensure
 from aspire.utils.matrix import roll_dim, unroll_dim, im_to_vec, vec_to_im
 from aspire.utils.matlab_compat import m_flatten, m_reshape
+from aspire.utils.optimize import block_cg
 from aspire.basis.basis_func import unique_coords_nd
 from aspire.basis import Basis
 
@@ -214,15 +214,10 @@ class FBBasis2D(Basis):
         v, sz_roll = unroll_dim(v, 2)
         b = im_to_vec(self.evaluate(v))
 
-        operator = LinearOperator(
-            shape=(self.N**2, self.N**2),
-            matvec=lambda x: im_to_vec(self.evaluate(self.evaluate_t(vec_to_im(x))))
-        )
-
         # TODO: (from MATLAB implementation) - Check that this tolerance make sense for multiple columns in v
         tol = 10 * np.finfo(v.dtype).eps
         logger.info('Expanding array in dual basis')
-        v, info = cg(operator, b, tol=tol)
+        v, info = block_cg(lambda x: im_to_vec(self.evaluate(self.evaluate_t(vec_to_im(x)))), b, tol=tol)
 
         if info != 0:
             raise RuntimeError('Unable to converge!')
@@ -1,10 +1,10 @@
 import logging
 import numpy as np
-from scipy.sparse.linalg import LinearOperator, cg
 
 from aspire.utils import ensure
 from aspire.utils.matrix import roll_dim, unroll_dim, vol_to_vec, vec_to_vol
 from aspire.utils.matlab_compat import m_flatten, m_reshape
+from aspire.utils.optimize import block_cg
 from aspire.basis.basis_func import unique_coords_nd, sph_bessel, real_sph_harmonic
 from aspire.basis import Basis
 
@@ -201,15 +201,10 @@ class FBBasis3D(Basis):
         v, sz_roll = unroll_dim(v, 2)
         b = vol_to_vec(self.evaluate(v))
 
-        operator = LinearOperator(
-            shape=(self.N**3, self.N**3),
-            matvec=lambda x: vol_to_vec(self.evaluate(self.evaluate_t(vec_to_vol(x))))
-        )
-
         # TODO: (from MATLAB implementation) - Check that this tolerance make sense for multiple columns in v
         tol = 10 * np.finfo(v.dtype).eps
         logger.info('Expanding array in dual basis')
-        v, info = cg(operator, b, tol=tol)
+        v, info = block_cg(lambda x: vol_to_vec(self.evaluate(self.evaluate_t(vec_to_vol(x)))), b, tol=tol)
 
         if info != 0:
             raise RuntimeError('Unable to converge!')
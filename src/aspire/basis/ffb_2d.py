@@ -3,11 +3,9 @@ import numpy as np
 from numpy import pi
 from scipy.special import jv
 from scipy.fftpack import ifft, fft
-from scipy.sparse.linalg import LinearOperator, cg
 
 from aspire.nfft import anufft3, nufft3
 
-from aspire.utils import ensure
 from aspire.utils.matlab_compat import m_reshape
 from aspire.basis.basis_func import lgwt
 from aspire.basis.fb_2d import FBBasis2D
@@ -79,10 +77,26 @@ class FFBBasis2D(FBBasis2D):
         freqs_y = m_reshape(r, (n_r, 1)) @ m_reshape(np.sin(np.arange(n_theta) * 2 * pi / (2 * n_theta)), (1, n_theta))
         freqs = np.vstack((freqs_x[np.newaxis, ...], freqs_y[np.newaxis, ...]))
 
+        # The radial functions of each ell, weighted by the quadrature weights (w * r) of the radial integrals, padded
+        # with zeros to k_max[0] functions per ell, so that the radial parts of all ells are applied in a single batched
+        # matmul. The positions of their coefficients in coefficient vectors are padded with `basis_count`.
+        radial_blocks = np.zeros((self.ell_max + 1, n_r, self.k_max[0]))
+        coeff_pos = np.full((self.ell_max + 1, self.k_max[0]), self.basis_count)
+        coeff_neg = np.full((self.ell_max + 1, self.k_max[0]), self.basis_count)
+        ells, ks = self._indices['ells'].astype(int), self._indices['ks'].astype(int)
+        sgns = self._indices['sgns']
+        ind_radial = np.cumsum(np.concatenate(([0], self.k_max[:-1])))
+        radial_blocks[ells, :, ks] = (radial[:, ind_radial[ells] + ks] * (w * r)[:, np.newaxis]).T
+        coeff_pos[ells[sgns == 1], ks[sgns == 1]] = np.flatnonzero(sgns == 1)
+        coeff_neg[ells[sgns == -1], ks[sgns == -1]] = np.flatnonzero(sgns == -1)
+
         return {
             'gl_nodes': r,
             'gl_weights': w,
             'radial': radial,
+            'radial_blocks': radial_blocks,
+            'coeff_pos': coeff_pos,
+            'coeff_neg': coeff_neg,
             'freqs': freqs
         }
 
@@ -98,65 +112,43 @@ class FFBBasis2D(FBBasis2D):
         """
         # make should the first dimension of v is self.basis_count
         v = m_reshape(v, (self.basis_count, -1))
+        complex_dtype = np.result_type(v.dtype, np.complex64)
 
         # get information on polar grids from precomputed data
         n_theta = np.size(self._precomp["freqs"], 2)
         n_r = np.size(self._precomp["freqs"], 1)
+        radial = self._precomp["radial_blocks"].astype(v.dtype, copy=False)
 
         # number of 2D image samples
         n_data = np.size(v, 1)
 
-        # go through  each basis function and find corresponding coefficient
-        pf = np.zeros((n_r, 2 * n_theta, n_data), dtype=np.complex)
-        mask = self._indices["ells"] == 0
-
-        ind = 0
-
-        idx = ind + np.arange(self.k_max[0])
-
-        pf[:, 0, :] = self._precomp["radial"][:, idx] @ v[mask, ...]
-
-        ind = ind + np.size(idx)
-
-        ind_pos = ind
-
-        for ell in range(1, self.ell_max + 1):
-            idx = ind + np.arange(self.k_max[ell])
-            idx_pos = ind_pos + np.arange(self.k_max[ell])
-            idx_neg = idx_pos + self.k_max[ell]
-
-            v_ell = (v[idx_pos, :] - 1j * v[idx_neg, :]) / 2.0
+        # gather the coefficients of the cosine (sgn = 1) and sine (sgn = -1) basis functions of each ell, as
+        # (ell_max + 1)-by-k_max[0]-by-n_data arrays padded with zeros, and apply their radial parts in batched matmuls
+        v = np.concatenate((v, np.zeros((1, n_data), dtype=v.dtype)))
+        pf_pos = radial @ v[self._precomp["coeff_pos"]]
+        pf_neg = radial @ v[self._precomp["coeff_neg"]]
 
-            if np.mod(ell, 2) == 1:
-                v_ell = 1j * v_ell
+        # combine them into the angular Fourier coefficients of each ell on the polar grid, with angles along the first
+        # axis (so that the "positive" half of the grid below is contiguous, and ordered as the NUFFT points)
+        ells = np.arange(self.ell_max + 1)
+        phases = (np.where(ells % 2 == 0, 1, 1j) / np.where(ells == 0, 1, 2)).astype(complex_dtype)
+        pf_ell = (pf_pos - 1j * pf_neg) * phases[:, np.newaxis, np.newaxis]
 
-            pf_ell = self._precomp["radial"][:, idx] @ v_ell
-            pf[:, ell, :] = pf_ell
-
-            if np.mod(ell, 2) == 0:
-                pf[:, 2 * n_theta - ell, :] = pf_ell.conjugate()
-            else:
-                pf[:, 2 * n_theta - ell, :] = -pf_ell.conjugate()
-
-            ind = ind + np.size(idx)
-            ind_pos = ind_pos + 2 * self.k_max[ell]
+        pf = np.zeros((2 * n_theta, n_r, n_data), dtype=complex_dtype)
+        pf[ells] = pf_ell
+        signs = np.where(ells[1:] % 2 == 0, 1, -1).astype(v.dtype)
+        pf[2 * n_theta - ells[1:]] = signs[:, np.newaxis, np.newaxis] * pf_ell[1:].conjugate()
 
         # 1D inverse FFT in the degree of polar angle
-        pf = 2 * pi * ifft(pf, axis=1, overwrite_x=True)
+        pf = 2 * pi * ifft(pf, axis=0, overwrite_x=True)
 
         # Only need "positive" frequencies.
-        hsize = int(np.size(pf, 1) / 2)
-        pf = pf[:, 0:hsize, :]
-
-        for i_r in range(0, n_r):
-            pf[i_r, ...] = pf[i_r, ...] * (self._precomp["gl_weights"][i_r] * self._precomp["gl_nodes"][i_r])
-        pf = m_reshape(pf, (n_r * n_theta, n_data))
+        pf = pf[:n_theta].reshape((n_theta * n_r, n_data))
 
         # perform inverse non-uniformly FFT transform back to 2D coordinate basis
         freqs = m_reshape(self._precomp["freqs"], (2, n_r * n_theta))
-        x = np.zeros((self.sz[0], self.sz[1], n_data), dtype=v.dtype)
-        for isample in range(0, n_data):
-            x[..., isample] = 2*np.real(anufft3(pf[:, isample], 2 * pi * freqs, self.sz))
+        x = 2 * anufft3(pf, 2 * pi * freqs, self.sz, real=True)
+        x = x.astype(v.dtype, copy=False)
 
         # return the x with the first two dimensions of self.sz
 
@@ -179,95 +171,35 @@ class FFBBasis2D(FBBasis2D):
         n_theta = np.size(self._precomp["freqs"], 2)
         n_r = np.size(self._precomp["freqs"], 1)
         freqs = m_reshape(self._precomp["freqs"], new_shape=(2, n_r * n_theta))
+        radial = self._precomp["radial_blocks"].astype(x.dtype, copy=False)
 
         # number of 2D image samples
         n_data = np.size(x, 2)
 
-        pf = np.zeros((n_r*n_theta, n_data), dtype=complex)
-        # resamping x in a polar Fourier gird using nonuniform discrete Fourier transform
-        for isample in range(0, n_data):
-            pf[..., isample] = nufft3(x[..., isample], 2 * pi * freqs, self.sz)
-        pf = m_reshape(pf, new_shape=(n_r, n_theta, n_data))
+        # resamping x in a polar Fourier gird using nonuniform discrete Fourier transform, with angles along the first
+        # axis
+        pf = nufft3(x, 2 * pi * freqs, self.sz)
+        pf = pf.reshape((n_theta, n_r, n_data))
 
         # Recover "negative" frequencies from "positive" half plane.
-        pf = np.concatenate((pf, pf.conjugate()), axis=1)
-
-        # evaluate radial integral using the Gauss-Legendre quadrature rule
-        for i_r in range(0, n_r):
-            pf[i_r, ...] = pf[i_r, ...] * (self._precomp["gl_weights"][i_r] * self._precomp["gl_nodes"][i_r])
+        pf = np.concatenate((pf, pf.conjugate()), axis=0)
 
         #  1D FFT on the angular dimension for each concentric circle
-        pf = 2 * pi / (2 * n_theta) * fft(pf, 2*n_theta, 1)
-
-        # This only makes it easier to slice the array later.
-        v = np.zeros((self.basis_count, n_data), dtype=x.dtype)
-
-        # go through each basis function and find the corresponding coefficient
-        ind = 0
-        idx = ind + np.arange(self.k_max[0])
-        mask = self._indices["ells"] == 0
-
-        v[mask, :] = self._precomp["radial"][:, idx].T @ pf[:, 0, :].real
-        v = m_reshape(v, (self.basis_count, -1))
-        ind = ind + np.size(idx)
-
-        ind_pos = ind
-        for ell in range(1, self.ell_max + 1):
-            idx = ind + np.arange(self.k_max[ell])
-            idx_pos = ind_pos + np.arange(self.k_max[ell])
-            idx_neg = idx_pos + self.k_max[ell]
-
-            v_ell = self._precomp["radial"][:, idx].T @ pf[:, ell, :]
-
-            if np.mod(ell, 2) == 0:
-                v_pos = np.real(v_ell)
-                v_neg = -np.imag(v_ell)
-            else:
-                v_pos = np.imag(v_ell)
-                v_neg = np.real(v_ell)
-
-            v[idx_pos, :] = v_pos
-            v[idx_neg, :] = v_neg
-
-            ind = ind + np.size(idx)
-
-            ind_pos = ind_pos + 2 * self.k_max[ell]
-
-        # return v coefficients with the first dimension of self.basis_count
-        return v
-
-    def expand(self, x):
-        """
-        Obtain expansion coefficients in Fourier Bessel basis from those in standard 2D coordinate basis.
-
-        This is a similar function to evaluate_t but with more accuracy by using the cg optimizing of linear
-        equation, Ax=b.
-
-        :param x: An array whose first two dimensions are to be expanded in FB basis.
-             These dimensions must equal `self.sz`.
-        :return : The coefficients of `v` expanded in FB basis. The first dimension of `v` is with size of `basis_count`
-             and the second and higher dimensions of the return value correspond to those higher dimensions of `x`.
-
-        """
-        ensure(x.shape[:self.d] == self.sz, f'First {self.d} dimensions of x must match {self.sz}.')
-
-        operator = LinearOperator(shape=(self.basis_count, self.basis_count),
-                                  matvec=lambda v: self.evaluate_t(self.evaluate(v)))
+        pf = 2 * pi / (2 * n_theta) * fft(pf, 2*n_theta, 0, overwrite_x=True)
 
-        # TODO: (from MATLAB implementation) - Check that this tolerance make sense for multiple columns in v
-        tol = 10*np.finfo(x.dtype).eps
-        logger.info('Expanding array in basis')
+        # evaluate radial integrals of all ells in a single batched matmul, using the Gauss-Legendre quadrature rule
+        # (whose weights are included in the radial table), applied to the real and imaginary parts of pf at once
+        pf = np.ascontiguousarray(pf[:self.ell_max + 1])
+        v_ell = (radial.transpose((0, 2, 1)) @ pf.view(x.dtype)).view(pf.dtype)
 
-        # number of image samples
-        n_data = np.size(x, self.d)
-        v = np.zeros((self.basis_count, n_data), dtype=x.dtype)
+        ells = np.arange(self.ell_max + 1)[:, np.newaxis, np.newaxis]
+        v_pos = np.where(ells % 2 == 0, v_ell.real, v_ell.imag)
+        v_neg = np.where(ells % 2 == 0, -v_ell.imag, v_ell.real)
 
-        for isample in range(0, n_data):
-            b = self.evaluate_t(x[..., isample])
-            # TODO: need check the initial condition x0 can improve the results or not.
-            v[..., isample], info = cg(operator, b, tol=tol)
-            if info != 0:
-                raise RuntimeError('Unable to converge!')
+        # scatter the coefficients of each ell into coefficient vectors (padding goes to an extra row, dropped below)
+        v = np.zeros((self.basis_count + 1, n_data), dtype=x.dtype)
+        v[self._precomp["coeff_neg"]] = v_neg
+        v[self._precomp["coeff_pos"]] = v_pos
 
         # return v coefficients with the first dimension of self.basis_count
-        return v
+        return v[:self.basis_count]
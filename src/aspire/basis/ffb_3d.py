@@ -1,10 +1,8 @@
 import logging
 import numpy as np
 from numpy import pi
-from scipy.sparse.linalg import LinearOperator, cg
 
 from aspire.nfft import anufft3, nufft3
-from aspire.utils import ensure
 from aspire.utils.matlab_compat import m_flatten, m_reshape
 from aspire.basis.basis_func import sph_bessel, norm_assoc_legendre, lgwt
 from aspire.basis.fb_3d import FBBasis3D
@@ -225,10 +223,8 @@ class FFBBasis3D(FBBasis3D):
         pf = m_reshape(pf, (n_theta*n_phi*n_r, n_data))
 
         # perform inverse non-uniformly FFT transformation back to 3D rectangular coordinates
-        freqs = m_reshape(self._precomp['fourier_pts'], (3, n_r * n_theta*n_phi, -1))
-        x = np.zeros((self.sz[0], self.sz[1], self.sz[2], n_data), dtype=v.dtype)
-        for isample in range(0, n_data):
-            x[..., isample] = np.real(anufft3(pf[:, isample], freqs, self.sz))
+        x = anufft3(pf, self._precomp['fourier_pts'], self.sz, real=True)
+        x = x.astype(v.dtype, copy=False)
 
         # return the x with the first three dimensions of self.sz
         return x
@@ -252,9 +248,7 @@ class FFBBasis3D(FBBasis3D):
         n_theta = np.size(self._precomp['ang_theta_wtd'], 0)
 
         # resamping x in a polar Fourier gird using nonuniform discrete Fourier transform
-        pf = np.zeros((n_theta*n_phi*n_r, n_data), dtype=complex)
-        for isample in range(0, n_data):
-            pf[..., isample] = nufft3(x[..., isample], self._precomp['fourier_pts'], self.sz)
+        pf = nufft3(x, self._precomp['fourier_pts'], self.sz)
 
         pf = m_reshape(pf, (n_theta, n_phi*n_r*n_data))
 
@@ -326,42 +320,3 @@ class FFBBasis3D(FBBasis3D):
             v[ind, :] = v_ell
 
         return v
-
-    def expand(self, x):
-
-        """
-        Obtain expansion coefficients in Fourier Bessel basis from those in standard 3D coordinate basis.
-
-        This is a similar function to evaluate_t but with more accuracy by using the cg optimizing of linear
-        equation, Ax=b.
-
-        :param x: An array whose first three dimensions are to be expanded in FB basis.
-             These dimensions must equal `self.sz`.
-        :return : The coefficients of `v` expanded in FB basis. The first dimension of `v` is with size of `basis_count`
-             and the second and higher dimensions of the return value correspond to those higher dimensions of `x`.
-
-        """
-        # TODO: this is function could be move to base class if all standard and fast versions of 2d and 3d are using
-        #       the same data structures of x and v.
-        ensure(x.shape[:self.d] == self.sz, f'First {self.d} dimensions of x must match {self.sz}.')
-
-        operator = LinearOperator(shape=(self.basis_count, self.basis_count),
-                                  matvec=lambda v: self.evaluate_t(self.evaluate(v)))
-
-        # TODO: (from MATLAB implementation) - Check that this tolerance make sense for multiple columns in v
-        tol = 10*np.finfo(x.dtype).eps
-        logger.info('Expanding array in basis')
-
-        # number of image samples
-        n_data = np.size(x, self.d)
-        v = np.zeros((self.basis_count, n_data), dtype=x.dtype)
-
-        for isample in range(0, n_data):
-            b = self.evaluate_t(x[..., isample])
-            # TODO: need check the initial condition x0 can improve the results or not.
-            v[..., isample], info = cg(operator, b, tol=tol)
-            if info != 0:
-                raise RuntimeError('Unable to converge!')
-
-        # return v coefficients with the first dimension of self.basis_count
-        return v
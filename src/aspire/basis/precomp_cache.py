@@ -0,0 +1,127 @@
+"""
+A persistent on-disk cache of the precomputations of bases (Bessel zeros, radial and angular tables, quadrature nodes
+and so on), so that a basis of a given kind and size is only built once per machine.
+
+Each cached basis is a directory holding a pickle of the state of the basis, in which large arrays are replaced by
+references to .npy files stored alongside. These arrays are loaded as read-only memory maps, so that processes using
+the same basis share a single copy of them in memory. Caches are written to a temporary directory and moved into place
+once complete, so that concurrent processes building the same basis never see a partial cache.
+"""
+import os
+import pickle
+import shutil
+import logging
+import tempfile
+import numpy as np
+
+from aspire.io.image_cache import content_digest
+
+logger = logging.getLogger(__name__)
+
+# Version of the cached precomputations. Bump this whenever the precomputations of any basis change.
+VERSION = 2
+
+STATE = 'state.pkl'
+
+# Arrays smaller than this (in bytes) are stored in the pickle itself, rather than memory-mapped from .npy files
+MIN_MMAP_NBYTES = 2**20
+
+
+def precomp_key(cls, size, ell_max):
+    """
+    :param cls: A Basis subclass.
+    :param size: The size of the basis.
+    :param ell_max: The maximum order of the basis, as requested (None for no maximum).
+    :return: A string digest identifying the precomputations of the basis.
+    """
+    if ell_max is not None and np.isinf(ell_max):
+        ell_max = None
+    return content_digest((VERSION, cls.__module__, cls.__qualname__, tuple(int(n) for n in size), ell_max))
+
+
+class _StatePickler(pickle.Pickler):
+    def __init__(self, f, path):
+        super().__init__(f, protocol=4)
+        self.path = path
+        self.n_arrays = 0
+
+    def persistent_id(self, obj):
+        if isinstance(obj, np.ndarray) and obj.dtype != object and obj.nbytes >= MIN_MMAP_NBYTES:
+            filename = f'array_{self.n_arrays:04d}.npy'
+            np.save(os.path.join(self.path, filename), obj)
+            self.n_arrays += 1
+            return filename
+        return None
+
+
+class _StateUnpickler(pickle.Unpickler):
+    def __init__(self, f, path):
+        super().__init__(f)
+        self.path = path
+
+    def persistent_load(self, pid):
+        return np.load(os.path.join(self.path, pid), mmap_mode='r')
+
+
+def _read_only(obj):
+    """
+    Mark all arrays in a (nested) state as read-only, so that state shared between bases cannot be modified.
+    """
+    if isinstance(obj, np.ndarray):
+        obj.setflags(write=False)
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            _read_only(v)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            _read_only(v)
+    return obj
+
+
+def load_precomp(cache_dir, key):
+    """
+    Load the cached state of a basis.
+    :param cache_dir: The directory of the cache.
+    :param key: The key of the basis, as returned by `precomp_key`.
+    :return: A dict of the attributes of the basis, whose arrays are read-only, or None if the basis is not cached.
+    """
+    path = os.path.join(cache_dir, key)
+    if not os.path.exists(os.path.join(path, STATE)):
+        return None
+    try:
+        with open(os.path.join(path, STATE), 'rb') as f:
+            state = _StateUnpickler(f, path).load()
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
+        logger.warning(f'Ignoring unreadable basis cache {path}: {e}')
+        return None
+    return _read_only(state)
+
+
+def save_precomp(cache_dir, key, state):
+    """
+    Cache the state of a basis. Failures to save are logged, but otherwise ignored.
+    :param cache_dir: The directory of the cache.
+    :param key: The key of the basis, as returned by `precomp_key`.
+    :param state: A dict of the attributes of the basis.
+    """
+    path = os.path.join(cache_dir, key)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+        try:
+            with open(os.path.join(tmp_path, STATE), 'wb') as f:
+                _StatePickler(f, tmp_path).dump(state)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Another process got there first - its cache is just as good as ours
+                if not os.path.exists(os.path.join(path, STATE)):
+                    raise
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+    except OSError as e:
+        logger.warning(f'Could not cache basis at {path}: {e}')
+        return
+    logger.info(f'Cached basis at {path}')
@@ -3,18 +3,29 @@ import numpy as np
 from functools import partial
 from scipy.sparse.linalg import LinearOperator, cg
 from tqdm import tqdm
+from aspire.nfft import nfft_precision
 from aspire.estimation.kernel import FourierKernel
 
 logger = logging.getLogger(__name__)
 
 
 class Estimator:
-    def __init__(self, src, basis, as_type='single', batch_size=512, preconditioner='circulant'):
+    def __init__(self, src, basis, as_type='single', batch_size=512, preconditioner='circulant', nfft_epsilon=None):
+        """
+        :param src: The ImageSource to estimate from.
+        :param basis: The Basis in which the estimate is expressed.
+        :param as_type: The dtype of the estimate.
+        :param batch_size: The no. of images processed at a time.
+        :param preconditioner: The preconditioner of the conjugate gradient method, 'circulant' or None.
+        :param nfft_epsilon: The precision of the NUFFTs computing the kernel and the estimate. If None, the current
+            precision policy is used (see `aspire.nfft.nfft_precision`).
+        """
         self.src = src
         self.basis = basis
         self.as_type = as_type
         self.batch_size = batch_size
         self.preconditioner = preconditioner
+        self.nfft_epsilon = nfft_epsilon
 
         self.L = src.L
         self.n = src.n
@@ -33,7 +44,8 @@ class Estimator:
 
         if name == 'kernel':
             logger.info('Computing kernel')
-            kernel = self.kernel = self.compute_kernel()
+            with nfft_precision(self.nfft_epsilon):
+                kernel = self.kernel = self.compute_kernel()
             return kernel
 
         elif name == 'precond_kernel':
@@ -50,10 +62,11 @@ class Estimator:
         raise NotImplementedError('Subclasses must implement the compute_kernel method')
 
     def estimate(self, b_coeff=None):
-        if b_coeff is None:
-            b_coeff = self.src_backward()
-        est_coeff = self.conj_grad(b_coeff)
-        est = self.basis.evaluate(est_coeff)
+        with nfft_precision(self.nfft_epsilon):
+            if b_coeff is None:
+                b_coeff = self.src_backward()
+            est_coeff = self.conj_grad(b_coeff)
+            est = self.basis.evaluate(est_coeff)
 
         return est
 
@@ -66,8 +79,7 @@ class Estimator:
         """
         mean_b = np.zeros((self.L, self.L, self.L), dtype=self.as_type)
 
-        for i in range(0, self.n, self.batch_size):
-            im = self.src.images(i, self.batch_size)
+        for i, im in self.src.iter_batches(self.batch_size):
             batch_mean_b = self.src.im_backward(im, i) / self.n
             mean_b += batch_mean_b.astype(self.as_type)
 
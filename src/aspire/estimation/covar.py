@@ -8,13 +8,12 @@ from tqdm import tqdm
 from functools import partial
 
 from aspire import config
-from aspire.volume import rotated_grids
-from aspire.nfft import anufft3
+from aspire.nfft import Plan, nfft_precision, real_dtype
 from aspire.utils.fft import mdim_ifftshift
 from aspire.utils import ensure
 from aspire.utils.matrix import vol_to_vec, vecmat_to_volmat, volmat_to_vecmat, symmat_to_vec_iso, vec_to_symmat_iso, \
     make_symmat
-from aspire.utils.matlab_compat import m_reshape
+from aspire.utils.matlab_compat import m_reshape, m_flatten
 from aspire.estimation import Estimator
 from aspire.estimation.mean import MeanEstimator
 from aspire.estimation.kernel import FourierKernel
@@ -33,7 +32,8 @@ class CovarianceEstimator(Estimator):
         """Lazy attributes instantiated on first-access"""
 
         if name == 'mean_kernel':
-            mean_kernel = self.mean_kernel = MeanEstimator(self.src, self.basis).kernel
+            mean_estimator = MeanEstimator(self.src, self.basis, nfft_epsilon=self.nfft_epsilon)
+            mean_kernel = self.mean_kernel = mean_estimator.kernel
             return mean_kernel
         return super(CovarianceEstimator, self).__getattr__(name)
 
@@ -44,12 +44,10 @@ class CovarianceEstimator(Estimator):
         _2L = 2 * self.L
 
         kernel = np.zeros((_2L, _2L, _2L, _2L, _2L, _2L), dtype=self.as_type)
-        filters_f = self.src.filters.evaluate_grid(L)
-        sq_filters_f = np.array(filters_f ** 2, dtype=self.as_type)
 
         for i in tqdm(range(0, n, self.batch_size)):
-            pts_rot = rotated_grids(L, self.src.rots[:, :, i:i+self.batch_size])
-            weights = sq_filters_f[:, :, self.src.filters.indices[i:i+self.batch_size]]
+            pts_rot = self.src.rotated_grids(i, self.batch_size)
+            weights = np.array(self.src.filters.image_grids(L, i, self.batch_size) ** 2, dtype=self.as_type)
             weights *= self.src.amplitudes[i:i+self.batch_size] ** 2
 
             if L % 2 == 0:
@@ -57,15 +55,13 @@ class CovarianceEstimator(Estimator):
                 weights[:, 0, :] = 0
 
             # TODO: This is where this differs from MeanEstimator
-            pts_rot = m_reshape(pts_rot, (3, L**2, -1))
-            weights = m_reshape(weights, (L**2, -1))
-
+            # Each image contributes its own factor, the adjoint NUFFT of its weights, computed in a single batch
             batch_n = weights.shape[-1]
-            factors = np.zeros((_2L, _2L, _2L, batch_n), dtype=self.as_type)
+            pts_rot = m_reshape(pts_rot, (3, -1))
+            weights = m_flatten(weights)
 
-            # TODO: Numpy has got to have a functional shortcut to avoid looping like this!
-            for j in range(batch_n):
-                factors[:, :, :, j] = anufft3(weights[:, j], pts_rot[:, :, j], (_2L, _2L, _2L), real=True)
+            plan = Plan((_2L, _2L, _2L), pts_rot, dtype=real_dtype(weights.dtype), cache=False)
+            factors = np.real(plan.adjoint_batch(weights, batch_n)).astype(self.as_type, copy=False)
 
             factors = vol_to_vec(factors)
             kernel += vecmat_to_volmat(factors @ factors.T) / (n * L**8)
@@ -88,9 +84,10 @@ class CovarianceEstimator(Estimator):
 
     def estimate(self, mean_vol, noise_variance):
         logger.info('Running Covariance Estimator')
-        b_coeff = self.src_backward(mean_vol, noise_variance)
-        est_coeff = self.conj_grad(b_coeff)
-        covar_est = self.basis.mat_evaluate(est_coeff)
+        with nfft_precision(self.nfft_epsilon):
+            b_coeff = self.src_backward(mean_vol, noise_variance)
+            est_coeff = self.conj_grad(b_coeff)
+            covar_est = self.basis.mat_evaluate(est_coeff)
         covar_est = vecmat_to_volmat(
             make_symmat(
                 volmat_to_vecmat(covar_est)
@@ -155,14 +152,10 @@ class CovarianceEstimator(Estimator):
         """
         covar_b = np.zeros((self.L, self.L, self.L, self.L, self.L, self.L), dtype=self.as_type)
 
-        for i in range(0, self.n, self.batch_size):
-            im = self.src.images(i, self.batch_size)
-            batch_n = im.shape[-1]
+        for i, im in self.src.iter_batches(self.batch_size):
             im_centered = im - self.src.vol_forward(mean_vol, i, self.batch_size)
 
-            im_centered_b = np.zeros((self.L, self.L, self.L, batch_n), dtype=self.as_type)
-            for j in range(batch_n):
-                im_centered_b[:, :, :, j] = self.src.im_backward(im_centered[:, :, j], i+j)
+            im_centered_b = self.src.im_backward(im_centered, i, individual=True).astype(self.as_type, copy=False)
             im_centered_b = vol_to_vec(im_centered_b)
 
             covar_b += vecmat_to_volmat(im_centered_b @ im_centered_b.T) / self.n
@@ -2,7 +2,6 @@ import logging
 import numpy as np
 from scipy.fftpack import fft2
 
-from aspire.volume import rotated_grids
 from aspire.nfft import anufft3
 from aspire.utils.fft import mdim_ifftshift
 from aspire.utils.matlab_compat import m_reshape, m_flatten
@@ -17,12 +16,10 @@ class MeanEstimator(Estimator):
     def compute_kernel(self):
         _2L = 2 * self.L
         kernel = np.zeros((_2L, _2L, _2L), dtype=self.as_type)
-        filters_f = self.src.filters.evaluate_grid(self.L)
-        sq_filters_f = np.array(filters_f ** 2, dtype=self.as_type)
 
         for i in range(0, self.n, self.batch_size):
-            pts_rot = rotated_grids(self.L, self.src.rots[:, :, i:i+self.batch_size])
-            weights = sq_filters_f[:, :, self.src.filters.indices[i:i+self.batch_size]]
+            pts_rot = self.src.rotated_grids(i, self.batch_size)
+            weights = np.array(self.src.filters.image_grids(self.L, i, self.batch_size) ** 2, dtype=self.as_type)
             weights *= self.src.amplitudes[i:i+self.batch_size] ** 2
 
             if self.L % 2 == 0:
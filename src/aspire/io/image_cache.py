@@ -0,0 +1,206 @@
+"""
+A persistent, chunked on-disk store of preprocessed image stacks.
+
+Each cache is a directory holding a small JSON manifest, a pickle of any metadata needed to restore the state of the
+source the images came from (such as a whitening filter), and the images themselves in a sequence of .npy chunk files
+of (up to) `chunk_size` images each. Chunks are stored in Fortran order, so that a contiguous range of images of an
+L-by-L-by-n stack is a contiguous range of bytes, and are read through memory maps, so that only requested images are
+read from disk and stacks larger than memory can be cached.
+
+Caches are written to a temporary directory and moved into place once complete, so that an interrupted run (or a
+concurrent one) never leaves a partial cache behind.
+"""
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import logging
+import tempfile
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Version of the on-disk layout. Caches written with a different version are ignored.
+VERSION = 1
+
+MANIFEST = 'manifest.json'
+METADATA = 'metadata.pkl'
+
+
+def content_digest(obj):
+    """
+    Compute a digest of the contents of a (picklable) object, such as a tuple describing an image source and the
+    operations applied to it.
+    :param obj: A picklable object. Arrays contained in it are digested by their shape, dtype and contents.
+    :return: A string digest.
+    """
+    h = hashlib.sha1()
+    h.update(pickle.dumps(obj, protocol=4))
+    return h.hexdigest()
+
+
+class DiskImageCache:
+    """
+    A read-only view of a complete on-disk cache of an L-by-L-by-n stack of images.
+    Images are accessed by slicing along the last axis, as in `cache[:, :, start:end]`, which returns an ndarray.
+    """
+    def __init__(self, path):
+        """
+        :param path: The directory of the cache.
+        """
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != VERSION:
+            raise RuntimeError(f'Image cache {path} has unsupported version {manifest.get("version")}')
+
+        self.path = path
+        self.L = manifest['L']
+        self.n = manifest['n']
+        self.dtype = np.dtype(manifest['dtype'])
+        self.chunk_size = manifest['chunk_size']
+        self.chunks = manifest['chunks']
+
+        with open(os.path.join(path, METADATA), 'rb') as f:
+            self.metadata = pickle.load(f)
+
+        self._memmaps = [None] * len(self.chunks)
+
+    def __str__(self):
+        return f'DiskImageCache ({self.n} images of size {self.L}x{self.L} at {self.path})'
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def shape(self):
+        return self.L, self.L, self.n
+
+    @classmethod
+    def load(cls, path):
+        """
+        Open an existing cache.
+        :param path: The directory of the cache.
+        :return: A DiskImageCache object, or None if there is no usable cache at `path`.
+        """
+        if not os.path.exists(os.path.join(path, MANIFEST)):
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError, KeyError, RuntimeError, pickle.UnpicklingError) as e:
+            logger.warning(f'Ignoring unreadable image cache {path}: {e}')
+            return None
+
+    @classmethod
+    def build(cls, path, L, n, batches, dtype=None, chunk_size=1024, metadata=None):
+        """
+        Write a cache of images, streaming them to disk in batches.
+        :param path: The directory of the cache. Its parent directory is created if needed.
+        :param L: The resolution of the (square) images.
+        :param n: The total no. of images.
+        :param batches: An iterable of (start, images) tuples, where images is an L-by-L-by-num array of the images with
+            indices start, ..., start+num-1, together covering all n images (as returned by `ImageSource.iter_batches`).
+        :param dtype: The dtype in which images are stored. If None, the dtype of the first batch is used.
+        :param chunk_size: The no. of images in each chunk file.
+        :param metadata: A picklable object stored alongside the images, available as the `metadata` attribute of the
+            cache when it is loaded.
+        :return: A DiskImageCache object for the newly written cache.
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+
+        try:
+            chunks = [f'chunk_{k:05d}.npy' for k in range(int(np.ceil(n / chunk_size)))]
+            memmaps = []
+
+            written = 0
+            for start, im in batches:
+                if not memmaps:
+                    dtype = np.dtype(dtype or im.dtype)
+                    memmaps = [
+                        np.lib.format.open_memmap(
+                            os.path.join(tmp_path, chunk),
+                            mode='w+',
+                            dtype=dtype,
+                            shape=(L, L, min(chunk_size, n - k * chunk_size)),
+                            fortran_order=True
+                        )
+                        for k, chunk in enumerate(chunks)
+                    ]
+                for k, chunk_slice, batch_slice in _chunk_slices(start, start + im.shape[-1], chunk_size):
+                    memmaps[k][:, :, chunk_slice] = im[:, :, batch_slice]
+                written += im.shape[-1]
+            if written != n:
+                raise RuntimeError(f'Expected {n} images to cache, got {written}')
+
+            for memmap in memmaps:
+                memmap.flush()
+            del memmaps
+
+            with open(os.path.join(tmp_path, METADATA), 'wb') as f:
+                pickle.dump(metadata, f, protocol=4)
+
+            # The manifest is written last, marking the cache as complete
+            manifest = {
+                'version': VERSION,
+                'L': int(L),
+                'n': int(n),
+                'dtype': np.dtype(dtype or 'float64').str,
+                'chunk_size': int(chunk_size),
+                'chunks': chunks
+            }
+            with open(os.path.join(tmp_path, MANIFEST), 'w') as f:
+                json.dump(manifest, f, indent=2)
+
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Another process got there first - its cache is just as good as ours
+                if cls.load(path) is None:
+                    raise
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        logger.info(f'Cached {n} images at {path}')
+        return cls(path)
+
+    def _chunk(self, k):
+        if self._memmaps[k] is None:
+            self._memmaps[k] = np.load(os.path.join(self.path, self.chunks[k]), mmap_mode='r')
+        return self._memmaps[k]
+
+    def read(self, start=0, num=None):
+        """
+        Read a range of images.
+        :param start: The index of the first image to read.
+        :param num: The no. of images to read. If None, all images from `start` onwards are read.
+        :return: An L-by-L-by-num ndarray of images.
+        """
+        end = self.n if num is None else min(start + num, self.n)
+        im = np.empty((self.L, self.L, max(end - start, 0)), dtype=self.dtype, order='F')
+        for k, chunk_slice, batch_slice in _chunk_slices(start, end, self.chunk_size):
+            im[:, :, batch_slice] = self._chunk(k)[:, :, chunk_slice]
+        return im
+
+    def __getitem__(self, item):
+        contiguous = isinstance(item, tuple) and len(item) == 3 and all(isinstance(s, slice) for s in item)
+        if not contiguous or item[:2] != (slice(None), slice(None)) or item[2].step not in (None, 1):
+            raise IndexError('Image caches only support slicing of contiguous images, as in cache[:, :, start:end]')
+        start, end, _ = item[2].indices(self.n)
+        return self.read(start, max(end - start, 0))
+
+
+def _chunk_slices(start, end, chunk_size):
+    """
+    Split a range of images into the parts falling into each chunk.
+    :return: A generator of (chunk index, slice within the chunk, slice within the range) tuples.
+    """
+    pos = start
+    while pos < end:
+        k = pos // chunk_size
+        chunk_end = min((k + 1) * chunk_size, end)
+        yield k, slice(pos - k * chunk_size, chunk_end - k * chunk_size), slice(pos - start, chunk_end - start)
+        pos = chunk_end
@@ -0,0 +1,167 @@
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+import numpy as np
+import mrcfile
+
+from aspire import config
+
+logger = logging.getLogger(__name__)
+
+
+class MrcsHandlePool:
+    """
+    A thread-safe LRU pool of memory-mapped .mrcs files, so that reading a few images from many stacks (as when
+    iterating over a star file in batches) only touches the requested images, without re-opening files every batch.
+    Files in use by a reader are never closed, so the pool may temporarily exceed its size under heavy concurrency.
+    """
+    def __init__(self, max_open=64):
+        """
+        :param max_open: The maximum no. of files to keep open.
+        """
+        self.max_open = max_open
+        self._handles = OrderedDict()
+        self._in_use = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._handles)
+
+    @contextmanager
+    def open(self, filepath):
+        """
+        Open a memory-mapped .mrcs file, or reuse an already open one.
+        :param filepath: The path of the file.
+        :return: A context manager yielding an open (read-only) mrcfile.mmap object.
+        """
+        with self._lock:
+            mrc = self._handles.get(filepath)
+            if mrc is None:
+                mrc = mrcfile.mmap(filepath, mode='r')
+                self._handles[filepath] = mrc
+            self._handles.move_to_end(filepath)
+            self._in_use[filepath] = self._in_use.get(filepath, 0) + 1
+            self._evict()
+
+        try:
+            yield mrc
+        finally:
+            with self._lock:
+                self._in_use[filepath] -= 1
+                if self._in_use[filepath] == 0:
+                    del self._in_use[filepath]
+                self._evict()
+
+    def _evict(self):
+        for filepath in list(self._handles):
+            if len(self._handles) <= self.max_open:
+                break
+            if filepath not in self._in_use:
+                self._handles.pop(filepath).close()
+
+    def close(self):
+        """
+        Close all files not currently in use.
+        """
+        with self._lock:
+            for filepath in list(self._handles):
+                if filepath not in self._in_use:
+                    self._handles.pop(filepath).close()
+
+
+# Process-wide pool of open .mrcs files
+mrcs_pool = MrcsHandlePool(max_open=config.starfile.max_open_files)
+
+
+def read_mrcs_images(filepath, indices):
+    """
+    Read selected images from an .mrcs stack, reading only those images from disk.
+    :param filepath: The path of the .mrcs file.
+    :param indices: An array of 0-indexed indices of the images to read.
+    :return: An ndarray of shape (len(indices), L, L), in the order of `indices`.
+    """
+    indices = np.asarray(indices)
+    with mrcs_pool.open(filepath) as mrc:
+        data = mrc.data
+        if data.ndim == 2:
+            data = data[np.newaxis]
+        # Read in file order, for sequential access, and restore the requested order afterwards
+        order = np.argsort(indices, kind='stable')
+        images = np.empty((len(indices),) + data.shape[1:], dtype=data.dtype)
+        images[order] = data[indices[order]]
+    return images
+
+
+class MrcsStackWriter:
+    """
+    Write a stack of images, batch by batch, to a sequence of (memory-mapped) .mrcs files of up to `images_per_file`
+    images each, so that stacks larger than memory can be written. Each file is closed as soon as it is complete.
+    """
+    def __init__(self, prefix, L, n, images_per_file=10000, overwrite=False):
+        """
+        :param prefix: The path of the files, without extension. Files are named `<prefix>_00000.mrcs`, ...
+        :param L: The resolution of the (square) images.
+        :param n: The total no. of images.
+        :param images_per_file: The max. no. of images in each file.
+        :param overwrite: Whether to overwrite existing files.
+        """
+        self.L = L
+        self.n = n
+        self.images_per_file = images_per_file
+        self.overwrite = overwrite
+        self.filepaths = [f'{prefix}_{k:05d}.mrcs' for k in range(int(np.ceil(n / images_per_file)))]
+
+        self._mrcs = {}
+        self._written = [0] * len(self.filepaths)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def location(self, i):
+        """
+        :param i: The (0-indexed) index of an image in the stack.
+        :return: A tuple of the path of the file holding the image, and the (0-indexed) index of the image in it.
+        """
+        return self.filepaths[i // self.images_per_file], i % self.images_per_file
+
+    def _file(self, k):
+        if k not in self._mrcs:
+            shape = (min(self.images_per_file, self.n - k * self.images_per_file), self.L, self.L)
+            # Mode 2 is 32-bit float
+            self._mrcs[k] = mrcfile.new_mmap(self.filepaths[k], shape=shape, mrc_mode=2, overwrite=self.overwrite)
+        return self._mrcs[k]
+
+    def write(self, start, im):
+        """
+        Write a batch of images.
+        :param start: The index of the first image of the batch in the stack.
+        :param im: An L-by-L-by-num array of the images with indices start, ..., start+num-1.
+        """
+        end = start + im.shape[-1]
+        pos = start
+        while pos < end:
+            k = pos // self.images_per_file
+            offset = k * self.images_per_file
+            file_end = min(offset + self.images_per_file, end)
+
+            mrc = self._file(k)
+            # Images are stored transposed, as read by `read_mrcs_images`
+            mrc.data[pos-offset:file_end-offset] = im[:, :, pos-start:file_end-start].T
+            self._written[k] += file_end - pos
+            if self._written[k] == mrc.data.shape[0]:
+                mrc.update_header_stats()
+                self._mrcs.pop(k).close()
+            pos = file_end
+
+    def close(self):
+        """
+        Close all open files, complete or not.
+        """
+        for mrc in self._mrcs.values():
+            mrc.close()
+        self._mrcs = {}
@@ -0,0 +1,193 @@
+"""
+Reading and writing of STAR files.
+
+STAR files consist of data blocks (`data_<name>`), each holding either a table (a `loop_` of column labels followed
+by one row per record) or a list of label-value pairs. RELION 3.1 star files, for example, hold a `data_optics` table
+of optics groups and a `data_particles` table of particles.
+
+Parsing a large star file is slow, so parsed copies of star files (such as pickles of their DataFrames) can be kept
+in `config.starfile.parsed_cache_dir` with `save_parsed`, keyed by the path, size and modification time of each star
+file, and loaded instead of parsing star files again with `load_parsed` while they are unchanged.
+"""
+import io
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+from collections import OrderedDict
+
+import pandas as pd
+
+from aspire import config
+from aspire.io.image_cache import content_digest
+
+logger = logging.getLogger(__name__)
+
+# Version of the parsed copies of star files. Copies written with a different version are ignored.
+VERSION = 1
+
+
+def parse_star(filepath, column_mappings=None):
+    """
+    Parse all data blocks of a STAR file.
+    :param filepath: The path of the .star file.
+    :param column_mappings: A dict mapping labels (without their leading underscore) to the types of their values.
+        Values of labels not found here are read as strings.
+    :return: An OrderedDict mapping the names of data blocks (as in 'data_<name>') to pandas DataFrames, with one row
+        per row of a table, or a single row of the values of a list of label-value pairs.
+    """
+    column_mappings = column_mappings or {}
+    with open(filepath, 'rb') as f:
+        data = f.read()
+
+    # Data blocks start at lines beginning with 'data_'
+    starts = [0] if data.startswith(b'data_') else []
+    pos = data.find(b'\ndata_')
+    while pos >= 0:
+        starts.append(pos + 1)
+        pos = data.find(b'\ndata_', pos + 1)
+
+    blocks = OrderedDict()
+    if not starts:
+        # Be lenient with files holding a single table without a 'data_' line
+        blocks[''] = _parse_block(filepath, data, 0, len(data), column_mappings)
+    for start, end in zip(starts, starts[1:] + [len(data)]):
+        name_end = data.find(b'\n', start, end)
+        if name_end < 0:
+            name_end = end
+        name = data[start+len(b'data_'):name_end].decode().strip()
+        blocks[name] = _parse_block(filepath, data, name_end + 1, end, column_mappings)
+    return blocks
+
+
+def _parse_block(filepath, data, start, end, column_mappings):
+    """
+    Parse a single data block, held in bytes data[start:end] of a star file.
+    Only the header of a table is parsed line by line; its rows are parsed in a single pass by pandas.
+    """
+    columns = []
+    values = OrderedDict()
+    is_loop = False
+
+    pos = start
+    while pos < end:
+        line_end = data.find(b'\n', pos, end)
+        if line_end < 0:
+            line_end = end
+        line = data[pos:line_end].decode().strip()
+
+        if line == 'loop_':
+            is_loop = True
+        elif line.startswith('_'):
+            name, *value = line[1:].split(None, 1)
+            if is_loop:
+                # Labels of a table may be followed by their (1-indexed) column no., as in '_rlnImageName #1'
+                columns.append(name)
+            else:
+                values[name] = value[0].split()[0] if value else ''
+        elif line and not line.startswith('#'):
+            # The first row of a table
+            break
+        pos = line_end + 1
+
+    if not is_loop:
+        return pd.DataFrame({
+            name: [column_mappings.get(name, str)(value)] for name, value in values.items()
+        })
+
+    dtypes = {name: column_mappings.get(name, str) for name in columns}
+    if not data[pos:end].strip():
+        return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in dtypes.items()})
+
+    kwargs = dict(delim_whitespace=True, header=None, names=columns, dtype=dtypes, comment='#')
+    if end < len(data):
+        return pd.read_csv(io.BytesIO(data[pos:end]), **kwargs)
+    # Tables at the end of the file (typically the large table of particles) are read directly, without a copy
+    with open(filepath, 'rb') as f:
+        f.seek(pos)
+        return pd.read_csv(f, **kwargs)
+
+
+def _parsed_path(filepath):
+    """
+    :return: The path of the parsed copy of a star file, or None if parsed copies are not kept.
+    """
+    parsed_dir = config.starfile.parsed_cache_dir
+    if not parsed_dir:
+        return None
+    name = hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()
+    return os.path.join(os.path.expanduser(parsed_dir), f'{name}.pkl')
+
+
+def _parsed_key(filepath, key):
+    stat = os.stat(filepath)
+    return content_digest((VERSION, os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns, key))
+
+
+def load_parsed(filepath, key=None):
+    """
+    Load the parsed copy of a star file, if it is up to date.
+    :param filepath: The path of the .star file.
+    :param key: A picklable description of how the star file was parsed (such as the types of its columns).
+    :return: The object saved by `save_parsed` for this star file and key, or None if there is no such object, or the
+        star file has changed since.
+    """
+    path = _parsed_path(filepath)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            parsed_key, obj = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
+        logger.warning(f'Ignoring unreadable parsed copy {path} of starfile {filepath}: {e}')
+        return None
+    if parsed_key != _parsed_key(filepath, key):
+        return None
+    logger.debug(f'Loaded parsed copy {path} of starfile {filepath}')
+    return obj
+
+
+def save_parsed(filepath, obj, key=None):
+    """
+    Save a parsed copy of a star file (if parsed copies are kept), replacing any earlier copy.
+    Failures to save are logged, but otherwise ignored.
+    :param filepath: The path of the .star file.
+    :param obj: A picklable object, such as a DataFrame of the contents of the star file.
+    :param key: A picklable description of how the star file was parsed, as for `load_parsed`.
+    """
+    path = _parsed_path(filepath)
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file moved into place once complete, so that concurrent readers never see partial copies
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((_parsed_key(filepath, key), obj), f, protocol=4)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError as e:
+        logger.warning(f'Could not save parsed copy of starfile {filepath}: {e}')
+        return
+    logger.debug(f'Saved parsed copy {path} of starfile {filepath}')
+
+
+def write_star(filepath, df, block_name=''):
+    """
+    Write a DataFrame to a STAR file, as a single data block with a loop of one row per DataFrame row.
+    :param filepath: The path of the .star file.
+    :param df: A pandas DataFrame, whose columns are named after STAR labels without their leading underscore
+        (such as 'rlnImageName').
+    :param block_name: The name of the data block (as in 'data_<block_name>').
+    """
+    with open(filepath, 'w') as f:
+        f.write(f'\ndata_{block_name}\n\nloop_\n')
+        for i, column in enumerate(df.columns):
+            f.write(f'_{column} #{i + 1}\n')
+        df.to_csv(f, sep=' ', header=False, index=False, float_format='%.10g')
+
+    logger.info(f'Wrote {len(df)} records to starfile {filepath}')
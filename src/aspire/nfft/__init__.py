@@ -1,7 +1,12 @@
 import logging
+import threading
 from collections import OrderedDict
+from contextlib import contextmanager
 import numpy as np
 from aspire import config
+from aspire.utils import ensure
+from aspire.nfft.cache import PlanCache, fourier_pts_digest
+from aspire.nfft.threads import thread_budget
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +16,13 @@ logger = logging.getLogger(__name__)
 backends = None
 # Default preferred Plan subclass
 default_plan_class = None
+# Process-wide cache of Plan objects, shared by all callers constructing a Plan
+plan_cache = PlanCache(
+    max_entries=config.nfft.plan_cache_size,
+    max_memory=config.nfft.plan_cache_memory
+)
+# Stacks of precisions set by nested 'nfft_precision' blocks (the innermost last), one per thread
+_precision = threading.local()
 
 
 def check_backends(raise_errors=True):
@@ -31,6 +43,8 @@ def check_backends(raise_errors=True):
             'pynfft'
                 The Python wrapper for the Chemnitz NFFT library
                 https://www-user.tu-chemnitz.de/~potts/nfft/
+            'gridding'
+                A pure NumPy/SciPy gridding implementation, always available (see aspire.nfft.gridding)
         :return: The proper Plan-subclass if the backend is expected to work or None otherwise.
 
         It's important to keep these checks lightweight since all usable backend classes are cached on module load.
@@ -55,6 +69,10 @@ def check_backends(raise_errors=True):
             except ImportError:
                 pass
 
+        elif backend == "gridding":
+            from aspire.nfft.gridding import GriddingPlan
+            plan_class = GriddingPlan
+
         if plan_class is None:
             logger.info(f"NFFT backend {backend} not usable")
         else:
@@ -89,38 +107,252 @@ def all_backends():
 def backend_available(backend):
     """
     Whether a particular NFFT backend is available
-    :param backend: String representing the NFFT backend, e.g. 'finufft' or 'pynfft'
+    :param backend: String representing the NFFT backend, e.g. 'finufft', 'pynfft' or 'gridding'
     :return: Boolean on whether the backend is available
     """
     return backend in all_backends()
 
 
-class Plan:
+def _precision_stack():
+    """
+    :return: The stack of precisions set by the 'nfft_precision' blocks of the calling thread.
+    """
+    if not hasattr(_precision, 'stack'):
+        _precision.stack = []
+    return _precision.stack
+
+
+def nfft_epsilon():
+    """
+    The precision used by NUFFT plans that are not given an explicit epsilon.
+    :return: The precision of the innermost active `nfft_precision` block of the calling thread, or
+        `config.nfft.epsilon` outside of any.
+    """
+    stack = _precision_stack()
+    if stack:
+        return stack[-1]
+    return config.nfft.epsilon
+
+
+@contextmanager
+def nfft_precision(epsilon):
+    """
+    A context manager setting the precision of all NUFFT plans created within it without an explicit epsilon,
+    including those created by projections, backprojections, estimators and bases. For example:
+
+        with nfft_precision(1e-7):
+            mean_est = estimator.estimate()
+
+    Note that the precision is set for the calling thread only, so that blocks in concurrent threads do not affect
+    each other. Work handed to other threads (such as batches of images loaded by `ImageSource.iter_batches`) must
+    set the precision of its caller in those threads.
+    :param epsilon: The desired precision of the NUFFT. If None, the current precision is left unchanged.
+    """
+    if epsilon is None:
+        yield
+        return
+
+    logger.info(f'Setting NUFFT precision to {epsilon}')
+    stack = _precision_stack()
+    stack.append(epsilon)
+    try:
+        yield
+    finally:
+        stack.pop()
+        logger.info(f'Restored NUFFT precision to {nfft_epsilon()}')
+
+
+class _PlanMeta(type):
+    """
+    Metaclass for Plan objects, so that constructing a Plan transparently goes through the process-wide plan cache.
+    A plan is only created (and any precomputation performed) if an identical plan is not already cached.
+    Plans constructed without an explicit epsilon use the current precision policy (see `nfft_precision`).
+    """
+    def __call__(cls, *args, cache=True, **kwargs):
+        if len(args) < 3 and kwargs.get('epsilon') is None:
+            kwargs['epsilon'] = nfft_epsilon()
+
+        def _create():
+            plan = super(_PlanMeta, cls).__call__(*args, **kwargs)
+            logger.debug(f'Created {type(plan).__name__} of size {tuple(plan.sz)} with epsilon={plan.epsilon}')
+            return plan
+
+        if not (cache and plan_cache.enabled):
+            return _create()
+
+        # Plans are keyed on the class and backend requested rather than the class resolved, so that cache hits do
+        # not consult the NUFFT profile
+        key = cls._cache_key(*args, **kwargs)
+        return plan_cache.get(key, _create)
+
+
+class Plan(metaclass=_PlanMeta):
     # TODO: move common functionality up the hierarchy
+
+    # The real and complex dtypes of the plan, overridden by subclasses supporting a dtype argument
+    dtype = np.dtype('float64')
+    complex_dtype = np.dtype('complex128')
+    # The no. of threads requested by the plan (None for as many as the thread budget allows)
+    n_threads = None
+
     def __new__(cls, *args, **kwargs):
-        if cls is Plan:
-            if 'backend' in kwargs:
-                if backend_available(kwargs['backend']):
-                    return super(Plan, cls).__new__(backends[kwargs['backend']])
-                else:
-                    raise RuntimeError('Requested backend unavailable')
-            else:
-                # If a Plan was constructed as a generic Plan(), use the default (best) Plan class
-                if default_plan_class is None:
-                    check_backends(raise_errors=True)
-                return super(Plan, cls).__new__(default_plan_class)
-        else:
+        return super(Plan, cls).__new__(cls._plan_class(*args, **kwargs))
+
+    @classmethod
+    def _plan_class(cls, sz=None, fourier_pts=None, epsilon=1e-15, backend=None, dtype=np.float64, **kwargs):
+        """
+        Determine the concrete Plan subclass to instantiate.
+        Arguments are those of the Plan constructor.
+        :param backend: String representing the NFFT backend requested, or None for the default (best) backend.
+        :return: A Plan subclass.
+        """
+        if cls is not Plan:
             # If a Plan-subclass was constructed directly, invoke default behavior
-            return super(Plan, cls).__new__(cls)
+            return cls
+        if backend is not None:
+            if backend_available(backend):
+                return backends[backend]
+            else:
+                raise RuntimeError('Requested backend unavailable')
+        # If a Plan was constructed as a generic Plan(), use the fastest backend for this problem according to the
+        # NUFFT profile (see aspire.nfft.benchmark), falling back to the default (best) Plan class.
+        if default_plan_class is None:
+            check_backends(raise_errors=True)
+        if sz is not None and fourier_pts is not None:
+            from aspire.nfft.benchmark import fastest_backend
+            backend = fastest_backend(sz, fourier_pts.shape[-1], epsilon, dtype=dtype, backends=all_backends())
+            if backend is not None:
+                return backends[backend]
+        return default_plan_class
+
+    @classmethod
+    def _cache_key(cls, sz, fourier_pts, epsilon=1e-15, dtype=np.float64, n_threads=None, backend=None, **kwargs):
+        """
+        The key identifying a plan constructed through this class in the plan cache.
+        Arguments are those of the Plan constructor.
+        """
+        return cls, backend, tuple(sz), fourier_pts_digest(fourier_pts), epsilon, np.dtype(dtype).str, n_threads
+
+    def threads(self):
+        """
+        Reserve threads from the process-wide thread budget (see `aspire.nfft.threads`) to execute this plan.
+        :return: A context manager yielding the no. of threads granted, at most `self.n_threads` (if set).
+        """
+        return thread_budget.reserve(self.n_threads)
+
+    def nbytes(self):
+        """
+        :return: An estimate of the memory held by this plan, in bytes. Used for memory-based eviction from the
+            plan cache. Subclasses with significant precomputed data should override this.
+        """
+        return self.fourier_pts.nbytes + self.complex_dtype.itemsize * int(np.prod(self.sz))
+
+    def transform_many(self, signal):
+        """
+        Transform a stack of signals sharing the non-uniform points of this plan.
+        This base class implementation applies `transform` to each signal in turn, reusing this plan.
+        Subclasses should override this where the backend supports many-vector transforms natively.
+        :param signal: An array of size `self.sz`-by-n containing n signals.
+        :return: An array of size `self.num_pts`-by-n containing the transforms of the signals.
+        """
+        ensure(signal.shape[:-1] == tuple(self.sz), f'Signals to be transformed must have shape {self.sz}-by-n')
+
+        n = signal.shape[-1]
+        result = None
+        for i in range(n):
+            f = self.transform(signal[..., i])
+            if result is None:
+                result = np.zeros((self.num_pts, n), dtype=f.dtype)
+            result[:, i] = f
+        return result
+
+    def adjoint_many(self, signal):
+        """
+        Apply the adjoint transform to a stack of signals sharing the non-uniform points of this plan.
+        This base class implementation applies `adjoint` to each signal in turn, reusing this plan.
+        Subclasses should override this where the backend supports many-vector transforms natively.
+        :param signal: An array of size `self.num_pts`-by-n containing n signals.
+        :return: An array of size `self.sz`-by-n containing the adjoint transforms of the signals.
+        """
+        ensure(signal.ndim == 2 and signal.shape[0] == self.num_pts,
+               f'Signals to be transformed must have shape {self.num_pts}-by-n')
+
+        n = signal.shape[-1]
+        result = None
+        for i in range(n):
+            f = self.adjoint(signal[:, i])
+            if result is None:
+                result = np.zeros(tuple(self.sz) + (n,), dtype=f.dtype)
+            result[..., i] = f
+        return result
+
+    def adjoint_batch(self, signal, n):
+        """
+        Apply the adjoint transform separately to n equally-sized, consecutive groups of the non-uniform points of this
+        plan, such as the points of individual images in a batch.
+        This base class implementation applies the adjoint of a separate (uncached) plan to each group in turn.
+        Subclasses should override this where the backend can compute these adjoints in a single pass.
+        :param signal: An array of length `self.num_pts` containing the signal at all non-uniform points.
+        :param n: The no. of groups of points, which must divide `self.num_pts`.
+        :return: An array of size `self.sz`-by-n containing the adjoint transform of each group.
+        """
+        ensure(signal.shape == (self.num_pts,), f'Signal to be transformed must have length {self.num_pts}')
+        ensure(self.num_pts % n == 0, f'The no. of points {self.num_pts} is not divisible into {n} groups')
 
+        m = self.num_pts // n
+        result = None
+        for i in range(n):
+            plan = type(self)(self.sz, self.fourier_pts[:, i*m:(i+1)*m], epsilon=self.epsilon, dtype=self.dtype,
+                              cache=False)
+            f = plan.adjoint(signal[i*m:(i+1)*m])
+            if result is None:
+                result = np.zeros(tuple(self.sz) + (n,), dtype=f.dtype)
+            result[..., i] = f
+        return result
 
-def anufft3(vol_f, fourier_pts, sz, real=False):
-    plan = Plan(sz=sz, fourier_pts=fourier_pts)
-    adjoint = plan.adjoint(vol_f)
+
+def real_dtype(dtype):
+    """
+    Determine the real floating point dtype in which a NUFFT of data of a given dtype should be computed.
+    :param dtype: The dtype of the data (real or complex, integer types are promoted to double precision).
+    :return: A numpy dtype, either float32 or float64.
+    """
+    return np.finfo(np.result_type(dtype, np.float32)).dtype
+
+
+def anufft3(vol_f, fourier_pts, sz, real=False, epsilon=None):
+    """
+    Adjoint non-uniform FFT
+    :param vol_f: An array of length K containing values at the non-uniform points, or a K-by-n array containing
+        n such signals, all of which are transformed in a single call.
+    :param fourier_pts: The non-uniform points, arranged as a d-by-K array.
+    :param sz: A tuple indicating the geometry of the output.
+    :param real: Whether to only return the real part of the result.
+    :param epsilon: The desired precision of the NUFFT. If None, the current precision policy is used.
+    :return: An array of shape `sz` (or `sz`-by-n, for multiple signals), in the precision of `vol_f`.
+    """
+    plan = Plan(sz=sz, fourier_pts=fourier_pts, epsilon=epsilon, dtype=real_dtype(vol_f.dtype))
+    if vol_f.ndim == 2:
+        adjoint = plan.adjoint_many(vol_f)
+    else:
+        adjoint = plan.adjoint(vol_f)
     return np.real(adjoint) if real else adjoint
 
 
-def nufft3(vol_f, fourier_pts, sz, real=False):
-    plan = Plan(sz=sz, fourier_pts=fourier_pts)
-    transform = plan.transform(vol_f)
+def nufft3(vol_f, fourier_pts, sz, real=False, epsilon=None):
+    """
+    Non-uniform FFT
+    :param vol_f: An array of shape `sz`, or an array of shape `sz`-by-n containing n signals, all of which are
+        transformed in a single call.
+    :param fourier_pts: The non-uniform points, arranged as a d-by-K array.
+    :param sz: A tuple indicating the geometry of the input.
+    :param real: Whether to only return the real part of the result.
+    :param epsilon: The desired precision of the NUFFT. If None, the current precision policy is used.
+    :return: An array of length K (or a K-by-n array, for multiple signals), in the precision of `vol_f`.
+    """
+    plan = Plan(sz=sz, fourier_pts=fourier_pts, epsilon=epsilon, dtype=real_dtype(vol_f.dtype))
+    if vol_f.ndim == len(sz) + 1:
+        transform = plan.transform_many(vol_f)
+    else:
+        transform = plan.transform(vol_f)
     return np.real(transform) if real else transform
@@ -0,0 +1,245 @@
+"""
+Micro-benchmarks of the available NUFFT backends, and an autotuner that picks the fastest backend for a given problem.
+
+Timings are persisted to a JSON profile (by default, the file given by `config.nfft.profile`), which is consulted
+whenever a Plan is constructed without an explicit backend. Timings are grouped in buckets of
+(dimension, size, no. of points, precision, dtype), where sizes and no. of points are rounded up to powers of 2, and
+precisions to the nearest power of 10. A problem that does not fall into any benchmarked bucket uses the nearest
+bucket of the same dimension, preferring its own dtype and precision.
+"""
+import os
+import json
+import logging
+from time import perf_counter
+import numpy as np
+
+from aspire import config
+from aspire.nfft.utils import nextpow2
+
+logger = logging.getLogger(__name__)
+
+# Image/volume sizes benchmarked by default, per dimension
+DEFAULT_SIZES = {
+    2: (16, 32, 64, 128, 256),
+    3: (16, 32, 64)
+}
+
+# The loaded profile, along with the path and modification time of the file it was loaded from
+_profile = None
+_profile_source = None
+
+
+def profile_path():
+    """
+    :return: The path of the NUFFT profile, as given by `config.nfft.profile`, or None if profiles are disabled.
+    """
+    path = config.nfft.profile
+    return os.path.expanduser(path) if path else None
+
+
+def bucket(dim, sz, num_pts, epsilon, dtype=np.float64):
+    """
+    Determine the benchmark bucket a NUFFT problem falls into.
+    :param dim: The dimension of the problem.
+    :param sz: The size of the signal, either a tuple or an integer (for signals of equal size in all dimensions).
+    :param num_pts: The no. of non-uniform points.
+    :param epsilon: The desired precision of the NUFFT.
+    :param dtype: The real dtype of the plan.
+    :return: A 5-tuple (dim, log2 of size, log2 of no. of points, -log10 of precision, name of dtype).
+    """
+    return (
+        int(dim),
+        int(nextpow2(np.max(sz))),
+        int(nextpow2(max(num_pts, 1))),
+        int(np.round(-np.log10(epsilon))),
+        np.dtype(dtype).name
+    )
+
+
+def _bucket_str(b):
+    return ','.join(str(x) for x in b)
+
+
+def _time(f, repeat):
+    times = []
+    for _ in range(repeat):
+        tic = perf_counter()
+        f()
+        times.append(perf_counter() - tic)
+    return min(times)
+
+
+def benchmark_backend(backend, sz, num_pts, epsilon, dtype=np.float64, repeat=3):
+    """
+    Time plan creation, transform and adjoint for one backend on random non-uniform points.
+    :param backend: String representing the NFFT backend.
+    :param sz: A tuple indicating the geometry of the signal.
+    :param num_pts: The no. of non-uniform points.
+    :param epsilon: The desired precision of the NUFFT.
+    :param dtype: The real dtype of the plan.
+    :param repeat: The no. of times each operation is timed. The fastest of these times is reported.
+    :return: A dictionary of times (in seconds) for 'plan', 'transform' and 'adjoint'.
+    """
+    from aspire.nfft import Plan
+
+    fourier_pts = np.random.uniform(-np.pi, np.pi, (len(sz), num_pts))
+    complex_dtype = np.result_type(dtype, np.complex64)
+    signal = np.random.randn(*sz).astype(dtype)
+    signal_f = (np.random.randn(num_pts) + 1j * np.random.randn(num_pts)).astype(complex_dtype)
+
+    plan = None
+
+    def _plan():
+        nonlocal plan
+        plan = Plan(sz, fourier_pts, epsilon=epsilon, dtype=dtype, backend=backend, cache=False)
+
+    times = {'plan': _time(_plan, 1)}
+    times['transform'] = _time(lambda: plan.transform(signal), repeat)
+    times['adjoint'] = _time(lambda: plan.adjoint(signal_f), repeat)
+    return times
+
+
+def benchmark(dims=(2, 3), sizes=None, pts_factors=(1, 4), epsilons=(1e-6, 1e-12), dtypes=('float64', 'float32'),
+              backends=None, repeat=3, path=None):
+    """
+    Benchmark the available NUFFT backends over a grid of problems, and save the results to a JSON profile.
+    :param dims: The dimensions to benchmark.
+    :param sizes: The sizes L of signals (of shape L-by-L or L-by-L-by-L) to benchmark. If None, the sizes in
+        DEFAULT_SIZES are used for each dimension.
+    :param pts_factors: The no. of non-uniform points benchmarked, as multiples of the no. of entries in the signal.
+    :param epsilons: The precisions to benchmark.
+    :param dtypes: The real dtypes of plans to benchmark.
+    :param backends: A list of strings representing the NFFT backends to benchmark. If None, all available backends
+        are benchmarked.
+    :param repeat: The no. of times each operation is timed.
+    :param path: The path of the JSON profile to save to. If None, the path in `config.nfft.profile` is used, and if
+        that is empty, results are not saved.
+    :return: The profile, a dictionary with a list of 'results', each a dictionary of problem parameters and times,
+        and a dictionary of the 'fastest' backend in each bucket.
+    """
+    from aspire.nfft import all_backends
+
+    if backends is None:
+        backends = all_backends()
+
+    results = []
+    for dim in dims:
+        for L in (sizes or DEFAULT_SIZES[dim]):
+            for factor in pts_factors:
+                num_pts = factor * L**dim
+                for epsilon in epsilons:
+                    for dtype in dtypes:
+                        dtype = np.dtype(dtype).name
+                        for backend in backends:
+                            logger.info(f'Benchmarking NFFT backend {backend} (dim={dim}, L={L}, num_pts={num_pts}, '
+                                        f'epsilon={epsilon}, dtype={dtype})')
+                            times = benchmark_backend(backend, (L,) * dim, num_pts, epsilon, dtype=dtype,
+                                                      repeat=repeat)
+                            results.append({
+                                'backend': backend,
+                                'dim': dim,
+                                'L': L,
+                                'num_pts': num_pts,
+                                'epsilon': epsilon,
+                                'dtype': dtype,
+                                **times
+                            })
+
+    profile = {'results': results, 'fastest': fastest_by_bucket(results)}
+    path = path or profile_path()
+    if path is not None:
+        save_profile(profile, path)
+    return profile
+
+
+def fastest_by_bucket(results):
+    """
+    Determine the fastest backend in each bucket, from the total time taken by a transform and an adjoint.
+    :param results: A list of benchmark results, as returned in the 'results' of `benchmark`.
+    :return: A dictionary mapping string representations of buckets to backends.
+    """
+    best = {}
+    for result in results:
+        b = _bucket_str(bucket(result['dim'], result['L'], result['num_pts'], result['epsilon'], result['dtype']))
+        t = result['transform'] + result['adjoint']
+        if b not in best or t < best[b][1]:
+            best[b] = result['backend'], t
+    return {b: backend for b, (backend, _) in best.items()}
+
+
+def save_profile(profile, path):
+    """
+    Save a NUFFT profile to a JSON file.
+    :param profile: The profile, as returned by `benchmark`.
+    :param path: The path of the JSON file.
+    """
+    global _profile, _profile_source
+
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+    logger.info(f'Saved NUFFT profile to {path}')
+
+    _profile, _profile_source = None, None
+
+
+def load_profile(path=None):
+    """
+    Load a NUFFT profile from a JSON file. The profile is only read again if the file has changed.
+    :param path: The path of the JSON file. If None, the path in `config.nfft.profile` is used.
+    :return: The profile, or None if no profile is found.
+    """
+    global _profile, _profile_source
+
+    path = path or profile_path()
+    if path is None or not os.path.exists(path):
+        return None
+
+    source = path, os.path.getmtime(path)
+    if source != _profile_source:
+        try:
+            with open(path) as f:
+                _profile = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Ignoring unreadable NUFFT profile {path}: {e}')
+            _profile = None
+        _profile_source = source
+    return _profile
+
+
+def fastest_backend(sz, num_pts, epsilon, dtype=np.float64, backends=None, profile=None):
+    """
+    Look up the fastest backend for a NUFFT problem in a profile.
+    :param sz: A tuple indicating the geometry of the signal.
+    :param num_pts: The no. of non-uniform points.
+    :param epsilon: The desired precision of the NUFFT.
+    :param dtype: The real dtype of the plan.
+    :param backends: A list of strings representing usable backends. Backends not in this list are never returned.
+        If None, all backends in the profile are considered.
+    :param profile: The profile to consult. If None, the profile given by `config.nfft.profile` is loaded.
+    :return: A string representing the fastest backend, or None if the profile has no usable information.
+    """
+    if profile is None:
+        profile = load_profile()
+    if not profile:
+        return None
+
+    dim, log_sz, log_pts, digits, dtype = bucket(len(sz), sz, num_pts, epsilon, dtype)
+    candidates = []
+    for b, backend in profile.get('fastest', {}).items():
+        fields = b.split(',')
+        if len(fields) != 5:
+            # A bucket of a profile saved before buckets included dtypes
+            continue
+        b_dim, b_log_sz, b_log_pts, b_digits = (int(x) for x in fields[:4])
+        if b_dim != dim or (backends is not None and backend not in backends):
+            continue
+        # Prefer buckets of the same dtype and precision, then the nearest in size and no. of points
+        distance = (fields[4] != dtype, abs(b_digits - digits), abs(b_log_sz - log_sz) + abs(b_log_pts - log_pts))
+        candidates.append((distance, backend))
+
+    if not candidates:
+        return None
+    return min(candidates)[1]
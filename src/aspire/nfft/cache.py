@@ -0,0 +1,119 @@
+import logging
+import hashlib
+from collections import OrderedDict
+from threading import RLock
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def fourier_pts_digest(fourier_pts):
+    """
+    Compute a digest of an array of non-uniform points, suitable for use in a plan cache key.
+    :param fourier_pts: An ndarray of Fourier points.
+    :return: A string digest that depends on the shape, dtype and contents of `fourier_pts`.
+    """
+    fourier_pts = np.ascontiguousarray(fourier_pts)
+    h = hashlib.sha1()
+    h.update(str((fourier_pts.shape, fourier_pts.dtype.str)).encode())
+    h.update(fourier_pts.data)
+    return h.hexdigest()
+
+
+class PlanCache:
+    """
+    A thread-safe LRU cache of NUFFT Plan objects, bounded both by the number of plans and by their estimated memory.
+    Plans are keyed by their backend, geometry, a digest of their non-uniform points, precision and dtype, so that
+    repeated transforms on identical points (as in iterative solvers) only pay for plan creation/precomputation once.
+    """
+    def __init__(self, max_entries=32, max_memory=1024):
+        """
+        :param max_entries: The maximum no. of plans to keep in the cache. If 0, caching is disabled.
+        :param max_memory: The maximum estimated memory (in MB) of all cached plans.
+        """
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+
+        self._plans = OrderedDict()
+        self._nbytes = {}
+        self._lock = RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._plans)
+
+    def __contains__(self, key):
+        return key in self._plans
+
+    def __str__(self):
+        return f'PlanCache ({len(self)} plans, {self.nbytes / 2**20:.1f} MB, {self.hits} hits, {self.misses} misses)'
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @property
+    def nbytes(self):
+        return sum(self._nbytes.values())
+
+    def get(self, key, factory):
+        """
+        Get a plan from the cache, creating it (and caching it) if not found.
+        :param key: A hashable key identifying the plan.
+        :param factory: A callable, taking no arguments, that creates the plan on a cache miss.
+        :return: The cached or newly created plan.
+        """
+        with self._lock:
+            if key in self._plans:
+                self.hits += 1
+                self._plans.move_to_end(key)
+                return self._plans[key]
+            self.misses += 1
+
+        # Create the plan outside the lock so that slow precomputations don't serialize unrelated callers.
+        plan = factory()
+
+        if self.enabled:
+            with self._lock:
+                self._plans[key] = plan
+                self._nbytes[key] = plan.nbytes()
+                self._plans.move_to_end(key)
+                self._evict()
+
+        return plan
+
+    def _evict(self):
+        max_nbytes = self.max_memory * 2**20
+        # The most recently used plan is never evicted, even if it alone exceeds the memory budget
+        while len(self._plans) > 1 and (len(self._plans) > self.max_entries or self.nbytes > max_nbytes):
+            key, _ = self._plans.popitem(last=False)
+            del self._nbytes[key]
+            self.evictions += 1
+            logger.debug(f'Evicted NUFFT plan from cache ({len(self._plans)} plans remaining)')
+
+    def clear(self):
+        """
+        Remove all plans from the cache and reset counters.
+        """
+        with self._lock:
+            self._plans.clear()
+            self._nbytes.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        """
+        :return: A dictionary of cache statistics.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._plans),
+                'nbytes': self.nbytes,
+                'max_entries': self.max_entries,
+                'max_memory': self.max_memory
+            }
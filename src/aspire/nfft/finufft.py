@@ -1,25 +1,33 @@
 import numpy as np
 import finufftpy
 from aspire.nfft import Plan
+from aspire.nfft.threads import openmp_threads
 from aspire.utils import ensure
 
 
 class FINufftPlan(Plan):
 
-    def __init__(self, sz, fourier_pts, epsilon=1e-15, **kwargs):
+    def __init__(self, sz, fourier_pts, epsilon=1e-15, dtype=np.float64, n_threads=None, **kwargs):
         """
         A plan for non-uniform FFT (3D)
         :param sz: A tuple indicating the geometry of the signal
         :param fourier_pts: The points in Fourier space where the Fourier transform is to be calculated,
             arranged as a 3-by-K array. These need to be in the range [-pi, pi] in each dimension.
         :param epsilon: The desired precision of the NUFFT
+        :param dtype: The real dtype of the plan. finufftpy always computes in double precision, but outputs of
+            single precision plans are returned as complex64, and their precision is floored accordingly.
+        :param n_threads: The max. no. of (OpenMP) threads used by transforms, subject to the process-wide thread
+            budget. If None, as many threads as the budget allows are used.
         """
         self.sz = sz
         self.dim = len(sz)
         # TODO: Things get messed up unless we ensure a 'C' ordering here - investigate why
-        self.fourier_pts = np.asarray(np.mod(fourier_pts + np.pi, 2 * np.pi) - np.pi, order='C')
+        self.fourier_pts = np.asarray(np.mod(fourier_pts + np.pi, 2 * np.pi) - np.pi, order='C', dtype='float64')
         self.num_pts = fourier_pts.shape[1]
-        self.epsilon = epsilon
+        self.dtype = np.dtype(dtype)
+        self.complex_dtype = np.result_type(self.dtype, np.complex64)
+        self.epsilon = max(epsilon, np.finfo(self.dtype).eps)
+        self.n_threads = n_threads
 
         # Get a handle on the appropriate 1d/2d/3d forward transform function in finufftpy
         self.transform_function = getattr(finufftpy, {1: 'nufft1d2', 2: 'nufft2d2', 3: 'nufft3d2'}[self.dim])
@@ -29,8 +37,6 @@ class FINufftPlan(Plan):
     def transform(self, signal):
         ensure(signal.shape == self.sz, f'Signal to be transformed must have shape {self.sz}')
 
-        epsilon = max(self.epsilon, np.finfo(signal.dtype).eps)
-
         # Forward transform functions in finufftpy have signatures of the form:
         # (x, y, z, c, isign, eps, f, ...)
         # (x, y     c, isign, eps, f, ...)
@@ -38,25 +44,24 @@ class FINufftPlan(Plan):
         # Where f is a Fortran-order ndarray of the appropriate dimensions
         # We form these function signatures here by tuple-unpacking
 
-        result = np.zeros(self.num_pts).astype('complex128')
+        result = np.zeros(self.num_pts, dtype='complex128')
 
-        result_code = self.transform_function(
-            *self.fourier_pts,
-            result,
-            -1,
-            epsilon,
-            signal
-        )
+        with self.threads() as n_threads, openmp_threads(n_threads):
+            result_code = self.transform_function(
+                *self.fourier_pts,
+                result,
+                -1,
+                self.epsilon,
+                signal
+            )
 
         if result_code != 0:
             raise RuntimeError(f'FINufft transform failed. Result code {result_code}')
 
-        return result
+        return result.astype(self.complex_dtype, copy=False)
 
     def adjoint(self, signal):
 
-        epsilon = max(self.epsilon, np.finfo(signal.dtype).eps)
-
         # Adjoint functions in finufftpy have signatures of the form:
         # (x, y, z, c, isign, eps, ms, mt, mu, f, ...)
         # (x, y     c, isign, eps, ms, mt      f, ...)
@@ -65,17 +70,93 @@ class FINufftPlan(Plan):
         # We form these function signatures here by tuple-unpacking
 
         # Note: Important to have order='F' here!
-        result = np.zeros(self.sz, order='F').astype('complex128')
-
-        result_code = self.adjoint_function(
-            *self.fourier_pts,
-            signal,
-            1,
-            epsilon,
-            *self.sz,
-            result
-        )
+        result = np.zeros(self.sz, dtype='complex128', order='F')
+
+        with self.threads() as n_threads, openmp_threads(n_threads):
+            result_code = self.adjoint_function(
+                *self.fourier_pts,
+                signal,
+                1,
+                self.epsilon,
+                *self.sz,
+                result
+            )
+        if result_code != 0:
+            raise RuntimeError(f'FINufft adjoint failed. Result code {result_code}')
+
+        return result.astype(self.complex_dtype, copy=False)
+
+    def transform_many(self, signal):
+        if self.dim != 2:
+            # finufftpy only provides many-vector entry points in 2D
+            return super().transform_many(signal)
+
+        ensure(signal.shape[:-1] == tuple(self.sz), f'Signals to be transformed must have shape {self.sz}-by-n')
+        # nufft2d2many has the signature (x, y, c, isign, eps, f, ...)
+        # where c and f are Fortran-order ndarrays with the signal index along the last dimension.
+        # Note: Important to have order='F' here, otherwise finufftpy writes to a temporary copy!
+        result = np.zeros((self.num_pts, signal.shape[-1]), dtype='complex128', order='F')
+
+        with self.threads() as n_threads, openmp_threads(n_threads):
+            result_code = finufftpy.nufft2d2many(
+                *self.fourier_pts,
+                result,
+                -1,
+                self.epsilon,
+                signal
+            )
+        if result_code != 0:
+            raise RuntimeError(f'FINufft transform failed. Result code {result_code}')
+
+        return result.astype(self.complex_dtype, copy=False)
+
+    def adjoint_many(self, signal):
+        if self.dim != 2:
+            # finufftpy only provides many-vector entry points in 2D
+            return super().adjoint_many(signal)
+
+        # nufft2d1many has the signature (x, y, c, isign, eps, ms, mt, f, ...)
+        # Note: Important to have order='F' here!
+        result = np.zeros(tuple(self.sz) + (signal.shape[-1],), dtype='complex128', order='F')
+
+        with self.threads() as n_threads, openmp_threads(n_threads):
+            result_code = finufftpy.nufft2d1many(
+                *self.fourier_pts,
+                signal,
+                1,
+                self.epsilon,
+                *self.sz,
+                result
+            )
         if result_code != 0:
             raise RuntimeError(f'FINufft adjoint failed. Result code {result_code}')
 
-        return result
+        return result.astype(self.complex_dtype, copy=False)
+
+    def adjoint_batch(self, signal, n):
+        ensure(signal.shape == (self.num_pts,), f'Signal to be transformed must have length {self.num_pts}')
+        ensure(self.num_pts % n == 0, f'The no. of points {self.num_pts} is not divisible into {n} groups')
+
+        # finufftpy has no many-vector entry points for separate sets of points, but its functions take the points
+        # with each call, so each group is transformed directly, without a plan of its own, under one reservation of
+        # threads.
+        m = self.num_pts // n
+        signal = np.ascontiguousarray(signal, dtype='complex128')
+        result = np.zeros(tuple(self.sz) + (n,), dtype='complex128', order='F')
+        f = np.zeros(self.sz, dtype='complex128', order='F')
+
+        with self.threads() as n_threads, openmp_threads(n_threads):
+            for i in range(n):
+                result_code = self.adjoint_function(
+                    *self.fourier_pts[:, i*m:(i+1)*m],
+                    signal[i*m:(i+1)*m],
+                    1,
+                    self.epsilon,
+                    *self.sz,
+                    f
+                )
+                if result_code != 0:
+                    raise RuntimeError(f'FINufft adjoint failed. Result code {result_code}')
+                result[..., i] = f
+
+        return result.astype(self.complex_dtype, copy=False)
@@ -0,0 +1,236 @@
+import numpy as np
+from numpy.polynomial.legendre import leggauss
+import scipy.fftpack
+import pyfftw.interfaces.scipy_fftpack
+from scipy.sparse import csr_matrix
+
+from aspire import config
+from aspire.utils import ensure
+from aspire.nfft import Plan
+
+
+class GriddingPlan(Plan):
+    """
+    A pure NumPy/SciPy implementation of the non-uniform FFT, by gridding with an "exponential of semicircle" kernel
+    on a 2x oversampled grid, as described in:
+    A. H. Barnett, J. Magland, L. af Klinteberg, A Parallel Non-uniform Fast Fourier Transform Library Based on an
+    "Exponential of Semicircle" Kernel, SIAM J. Sci. Comput. 41 (5), pp. C479-C504 (2019).
+
+    The spreading of non-uniform points onto the oversampled grid is precomputed as a sparse matrix, so that each
+    transform is a single FFT and a single sparse matrix product. For very large numbers of points, the sparse matrix
+    is instead built (and applied) in chunks of points on each call, to keep memory bounded.
+    """
+
+    # Upsampling factor of the fine grid
+    upsampling = 2
+
+    @staticmethod
+    def epsilon_to_kernel_width(epsilon):
+        # The error of the ES kernel with an upsampling factor of 2 decays roughly as 10^-(w-1) for a kernel of width w
+        return int(np.clip(np.ceil(-np.log10(epsilon / 10)), 2, 16))
+
+    def __init__(self, sz, fourier_pts, epsilon=1e-15, dtype=np.float64, n_threads=None, **kwargs):
+        """
+        A plan for non-uniform FFT (1D/2D/3D)
+        :param sz: A tuple indicating the geometry of the signal
+        :param fourier_pts: The points in Fourier space where the Fourier transform is to be calculated,
+            arranged as a dimension-by-K array. These need to be in the range [-pi, pi] in each dimension.
+        :param epsilon: The desired precision of the NUFFT
+        :param dtype: The real dtype of the plan. Single precision plans spread, FFT and return in single precision.
+        :param n_threads: The max. no. of threads used by the FFTs of transforms, subject to the process-wide thread
+            budget. If None, as many threads as the budget allows are used.
+        """
+        self.sz = tuple(sz)
+        self.dim = len(sz)
+        ensure(self.dim in (1, 2, 3), 'Only 1D, 2D and 3D transforms are supported.')
+        self.fourier_pts = np.asarray(fourier_pts).reshape((self.dim, -1))
+        self.num_pts = self.fourier_pts.shape[1]
+        self.dtype = np.dtype(dtype)
+        self.complex_dtype = np.result_type(self.dtype, np.complex64)
+        self.epsilon = max(epsilon, np.finfo(self.dtype).eps)
+        self.n_threads = n_threads
+
+        # Kernel width (in grid points), shape parameter and size of the oversampled grid
+        self.width = w = self.epsilon_to_kernel_width(self.epsilon)
+        self.beta = 2.30 * w
+        self.grid_sz = tuple(max(self.upsampling * N, 2 * w) for N in self.sz)
+
+        # Positions of the modes -N/2, ..., N/2-1 of the signal (in 'centered' order) on the oversampled grid
+        self._mode_idx = np.ix_(*[np.mod(np.arange(N) - N // 2, n) for N, n in zip(self.sz, self.grid_sz)])
+
+        # The deconvolution factors, including the grid spacing of the quadrature rule implicit in spreading
+        correction = 1
+        for d, (N, n) in enumerate(zip(self.sz, self.grid_sz)):
+            shape = [1] * self.dim
+            shape[d] = N
+            correction = correction * (2 * np.pi / n / self._kernel_fourier(N, n)).reshape(shape)
+        self._correction = correction.astype(self.dtype)
+
+        # Per-dimension kernel values and (wrapped) grid indices for all points, each of size K-by-w
+        self._idx = []
+        self._vals = []
+        for d, n in enumerate(self.grid_sz):
+            idx, vals = self._spread_1d(self.fourier_pts[d], n)
+            self._idx.append(idx)
+            self._vals.append(vals.astype(self.dtype))
+
+        # Precompute the full sparse spreading matrix if it fits in our budget, else build it in chunks on each call
+        self._chunk_size = max(1, config.nfft.gridding_max_nnz // w**self.dim)
+        self._spread_matrix = None
+        if self.num_pts <= self._chunk_size:
+            self._spread_matrix = self._build_spread_matrix(0, self.num_pts)
+
+    def _kernel(self, z):
+        return np.exp(self.beta * (np.sqrt(1 - z**2) - 1))
+
+    def _kernel_fourier(self, N, n):
+        """
+        Fourier transform of the (1D) spreading kernel, evaluated at the modes -N/2, ..., N/2-1
+        :param N: The number of modes.
+        :param n: The size of the oversampled grid.
+        :return: An array of length N.
+        """
+        alpha = np.pi * self.width / n
+        z, wts = leggauss(2 * self.width + 20)
+        m = np.arange(N) - N // 2
+        return alpha * (np.cos(alpha * np.outer(m, z)) @ (wts * self._kernel(z)))
+
+    def _spread_1d(self, x, n):
+        """
+        Determine the grid points, and kernel values at those points, to which each non-uniform point spreads.
+        :param x: The coordinates of the non-uniform points along one dimension.
+        :param n: The size of the oversampled grid along this dimension.
+        :return: A 2-tuple of K-by-w arrays of grid indices and kernel values.
+        """
+        h = 2 * np.pi / n
+        x = np.mod(x, 2 * np.pi)
+        start = np.ceil(x / h - self.width / 2).astype('int')
+        idx = start[:, np.newaxis] + np.arange(self.width)
+        z = (x[:, np.newaxis] - idx * h) / (self.width * h / 2)
+        vals = self._kernel(np.clip(z, -1, 1))
+        return np.mod(idx, n), vals
+
+    def _build_spread_matrix(self, start, end):
+        """
+        Build the sparse spreading matrix for non-uniform points in the range [start, end)
+        :return: A sparse matrix of size (end-start)-by-prod(self.grid_sz).
+        """
+        n_pts = end - start
+        idx = 0
+        vals = 1
+        for d, n in enumerate(self.grid_sz):
+            shape = [n_pts] + [1] * self.dim
+            shape[d+1] = self.width
+            idx = idx * n + self._idx[d][start:end].reshape(shape)
+            vals = vals * self._vals[d][start:end].reshape(shape)
+
+        nnz_row = self.width ** self.dim
+        indptr = np.arange(0, n_pts * nnz_row + 1, nnz_row)
+        return csr_matrix(
+            (vals.reshape(-1), idx.reshape(-1).astype('int32'), indptr),
+            shape=(n_pts, int(np.prod(self.grid_sz)))
+        )
+
+    def _spread_matrix_rows(self, start, end):
+        """
+        The rows of the sparse spreading matrix for non-uniform points in the range [start, end)
+        """
+        if self._spread_matrix is not None:
+            return self._spread_matrix[start:end]
+        return self._build_spread_matrix(start, end)
+
+    def _spread_matrices(self):
+        """
+        Generate sparse spreading matrices covering all non-uniform points, as (start, end, matrix) tuples.
+        """
+        if self._spread_matrix is not None:
+            yield 0, self.num_pts, self._spread_matrix
+        else:
+            for start in range(0, self.num_pts, self._chunk_size):
+                end = min(start + self._chunk_size, self.num_pts)
+                yield start, end, self._build_spread_matrix(start, end)
+
+    def _fftn(self, x, inverse=False):
+        """
+        (Inverse) FFT of a stack of signals on the oversampled grid, in place if possible.
+        Multithreaded FFTs are computed by FFTW, when more than one thread is granted from the thread budget.
+        """
+        with self.threads() as n_threads:
+            if n_threads > 1:
+                f = pyfftw.interfaces.scipy_fftpack.ifftn if inverse else pyfftw.interfaces.scipy_fftpack.fftn
+                return f(x, axes=range(self.dim), overwrite_x=True, threads=n_threads)
+            else:
+                f = scipy.fftpack.ifftn if inverse else scipy.fftpack.fftn
+                return f(x, axes=range(self.dim), overwrite_x=True)
+
+    def nbytes(self):
+        nbytes = self.fourier_pts.nbytes + sum(a.nbytes for a in self._idx + self._vals)
+        if self._spread_matrix is not None:
+            nbytes += self._spread_matrix.data.nbytes + self._spread_matrix.indices.nbytes
+        return nbytes + self.complex_dtype.itemsize * int(np.prod(self.grid_sz))
+
+    def transform_many(self, signal):
+        ensure(signal.shape[:self.dim] == self.sz, f'Signals to be transformed must have shape {self.sz}-by-n')
+        n = signal.shape[-1]
+
+        grid = np.zeros(self.grid_sz + (n,), dtype=self.complex_dtype)
+        grid[self._mode_idx] = signal * self._correction[..., np.newaxis]
+        grid = self._fftn(grid)
+        grid = grid.reshape((-1, n))
+
+        result = np.zeros((self.num_pts, n), dtype=self.complex_dtype)
+        for start, end, spread_matrix in self._spread_matrices():
+            result[start:end] = spread_matrix @ grid
+        return result
+
+    def adjoint_many(self, signal):
+        ensure(signal.ndim == 2 and signal.shape[0] == self.num_pts,
+               f'Signals to be transformed must have shape {self.num_pts}-by-n')
+        n = signal.shape[-1]
+
+        signal = signal.astype(self.complex_dtype, copy=False)
+        grid = np.zeros((int(np.prod(self.grid_sz)), n), dtype=self.complex_dtype)
+        for start, end, spread_matrix in self._spread_matrices():
+            grid += spread_matrix.T @ signal[start:end]
+        grid = grid.reshape(self.grid_sz + (n,))
+        grid = self._fftn(grid, inverse=True) * self.dtype.type(np.prod(self.grid_sz))
+
+        return grid[self._mode_idx] * self._correction[..., np.newaxis]
+
+    def adjoint_batch(self, signal, n):
+        ensure(signal.shape == (self.num_pts,), f'Signal to be transformed must have length {self.num_pts}')
+        ensure(self.num_pts % n == 0, f'The no. of points {self.num_pts} is not divisible into {n} groups')
+
+        m = self.num_pts // n
+        grid_len = int(np.prod(self.grid_sz))
+        nnz_row = self.width ** self.dim
+        signal = signal.astype(self.complex_dtype, copy=False)
+        result = np.zeros(self.sz + (n,), dtype=self.complex_dtype)
+
+        # Groups are spread onto their own oversampled grids, as many at a time as fit in our budget
+        batch_size = max(1, min(n, config.nfft.gridding_max_nnz // max(grid_len, m * nnz_row)))
+        for i in range(0, n, batch_size):
+            j = min(i + batch_size, n)
+            spread_matrix = self._spread_matrix_rows(i * m, j * m)
+            # Offset the grid indices of each group of points, so that a single sparse product spreads each group
+            # onto a separate grid.
+            offsets = np.repeat(np.arange(j - i) * grid_len, m * nnz_row)
+            index_dtype = 'int32' if (j - i) * grid_len < 2**31 else 'int64'
+            spread_matrix = csr_matrix(
+                (spread_matrix.data, spread_matrix.indices.astype(index_dtype) + offsets, spread_matrix.indptr),
+                shape=((j - i) * m, (j - i) * grid_len)
+            )
+
+            grid = (spread_matrix.T @ signal[i * m:j * m]).reshape((j - i,) + self.grid_sz)
+            grid = np.moveaxis(grid, 0, -1)
+            grid = self._fftn(grid, inverse=True) * self.dtype.type(grid_len)
+            result[..., i:j] = grid[self._mode_idx] * self._correction[..., np.newaxis]
+
+        return result
+
+    def transform(self, signal):
+        ensure(signal.shape == self.sz, f'Signal to be transformed must have shape {self.sz}')
+        return self.transform_many(signal[..., np.newaxis])[:, 0]
+
+    def adjoint(self, signal):
+        return self.adjoint_many(signal.reshape((-1, 1)))[..., 0]
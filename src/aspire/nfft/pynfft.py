@@ -1,7 +1,9 @@
+from threading import Lock
 import numpy as np
 from pynfft.nfft import NFFT
 from aspire.utils import ensure
 from aspire.nfft import Plan
+from aspire.nfft.threads import openmp_threads
 from aspire.nfft.utils import nextpow2
 
 
@@ -13,52 +15,115 @@ class PyNfftPlan(Plan):
         rel_errs = [6e-2, 2e-3, 2e-5, 2e-7, 3e-9, 4e-11, 4e-13, 0]
         return list(filter(lambda i_err: i_err[1] < epsilon, enumerate(rel_errs, start=1)))[0][0]
 
-    def __init__(self, sz, fourier_pts, epsilon=1e-15, **kwargs):
+    def __init__(self, sz, fourier_pts, epsilon=1e-15, dtype=np.float64, n_threads=None, **kwargs):
         """
         A plan for non-uniform FFT (3D)
         :param sz: A tuple indicating the geometry of the signal
         :param fourier_pts: The points in Fourier space where the Fourier transform is to be calculated,
             arranged as a 3-by-K array. These need to be in the range [-pi, pi] in each dimension.
         :param epsilon: The desired precision of the NUFFT
+        :param dtype: The real dtype of the plan. The NFFT library always computes in double precision, but
+            outputs of single precision plans are returned as complex64.
+        :param n_threads: The max. no. of (OpenMP) threads used by transforms, subject to the process-wide thread
+            budget. If None, as many threads as the budget allows are used.
         """
         self.sz = sz
         self.dim = len(sz)
         self.fourier_pts = fourier_pts
         self.num_pts = fourier_pts.shape[1]
-        self.epsilon = epsilon
+        self.dtype = np.dtype(dtype)
+        self.complex_dtype = np.result_type(self.dtype, np.complex64)
+        self.epsilon = max(epsilon, np.finfo(self.dtype).eps)
+        self.n_threads = n_threads
 
-        self.cutoff = PyNfftPlan.epsilon_to_nfft_cutoff(epsilon)
+        self.cutoff = PyNfftPlan.epsilon_to_nfft_cutoff(self.epsilon)
         self.multi_bandwith = tuple(2 * 2**nextpow2(self.sz))
         # TODO - no other flags used in the MATLAB code other than these 2 are supported by the PyNFFT wrapper
         self._flags = ('PRE_PHI_HUT', 'PRE_PSI')
 
-        self._plan = NFFT(
+        # The NFFT plan is created and its window precomputed on first use, since a plan whose points are only
+        # transformed in groups (see `adjoint_batch`) never needs them
+        self._plan = None
+
+        # The NFFT plan holds the input and output of transforms, and cached plans are shared by all threads, so each
+        # transform sets its input, executes and copies out its output under this lock
+        self._lock = Lock()
+
+    def _nfft(self, num_pts):
+        """
+        Create an NFFT plan for the geometry of this plan.
+        :param num_pts: The no. of non-uniform points of the NFFT plan.
+        :return: A pynfft NFFT object, whose points are to be set with `_set_points`.
+        """
+        return NFFT(
             N=self.sz,
-            M=self.num_pts,
+            M=num_pts,
             n=self.multi_bandwith,
             m=self.cutoff,
             flags=self._flags
         )
 
-        self._plan.x = ((1./(2*np.pi)) * self.fourier_pts).T
-        self._plan.precompute()
+    @staticmethod
+    def _set_points(plan, fourier_pts):
+        """
+        Set the non-uniform points of an NFFT plan, and precompute its window at these points.
+        :param plan: A pynfft NFFT object.
+        :param fourier_pts: The non-uniform points, arranged as a d-by-M array, where M is the no. of points of `plan`.
+        """
+        plan.x = ((1./(2*np.pi)) * fourier_pts).T
+        plan.precompute()
+
+    def _get_plan(self):
+        # Callers hold self._lock
+        if self._plan is None:
+            plan = self._nfft(self.num_pts)
+            self._set_points(plan, self.fourier_pts)
+            self._plan = plan
+        return self._plan
+
+    def nbytes(self):
+        # The oversampled grid, plus the PRE_PSI window values of (2m+2)^d entries for each non-uniform point
+        grid_nbytes = 16 * int(np.prod(self.multi_bandwith))
+        psi_nbytes = 8 * (2 * self.cutoff + 2)**self.dim * self.num_pts
+        return self.fourier_pts.nbytes + grid_nbytes + psi_nbytes
 
     def transform(self, signal):
         ensure(signal.shape == self.sz, f'Signal to be transformed must have shape {self.sz}')
 
-        self._plan.f_hat = signal.astype('complex64')
-        f = self._plan.trafo()
+        signal = signal.astype('complex128')
+        with self._lock, self.threads() as n_threads:
+            plan = self._get_plan()
+            plan.f_hat = signal
+            with openmp_threads(n_threads):
+                f = plan.trafo()
+            # Note that astype() copies the output out of the plan, which is reused by subsequent calls
+            return f.astype(self.complex_dtype)
 
-        if signal.dtype == np.float32:
-            f = f.astype('complex64')
+    def adjoint(self, signal):
+        signal = signal.astype('complex128')
+        with self._lock, self.threads() as n_threads:
+            plan = self._get_plan()
+            plan.f = signal
+            with openmp_threads(n_threads):
+                f_hat = plan.adjoint()
+            return f_hat.astype(self.complex_dtype)
 
-        return f
+    def adjoint_batch(self, signal, n):
+        ensure(signal.shape == (self.num_pts,), f'Signal to be transformed must have length {self.num_pts}')
+        ensure(self.num_pts % n == 0, f'The no. of points {self.num_pts} is not divisible into {n} groups')
 
-    def adjoint(self, signal):
-        self._plan.f = signal.astype('complex64')
-        f_hat = self._plan.adjoint()
+        # pynfft has no entry points for separate sets of points, so a single NFFT plan is moved to the points of each
+        # group in turn. Its window must be precomputed for each group in any case, but the window at all points of
+        # this plan never is.
+        m = self.num_pts // n
+        signal = signal.astype('complex128')
+        result = np.zeros(tuple(self.sz) + (n,), dtype=self.complex_dtype)
 
-        if signal.dtype == np.float32:
-            f_hat = f_hat.astype('complex64')
+        plan = self._nfft(m)
+        with self.threads() as n_threads, openmp_threads(n_threads):
+            for i in range(n):
+                self._set_points(plan, self.fourier_pts[:, i*m:(i+1)*m])
+                plan.f = signal[i*m:(i+1)*m]
+                result[..., i] = plan.adjoint()
 
-        return f_hat
+        return result
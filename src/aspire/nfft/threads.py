@@ -0,0 +1,111 @@
+import os
+import logging
+from contextlib import contextmanager
+from threading import Lock, local
+
+from aspire import config
+
+try:
+    from threadpoolctl import ThreadpoolController
+except ImportError:
+    ThreadpoolController = None
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadBudget:
+    """
+    A process-wide budget of threads, handed out to concurrently executing NUFFTs (and to thread pools running
+    alongside them), so that nested parallelism does not oversubscribe the available cores.
+    The budget is a soft limit. Reservations never block: once the budget is exhausted, further reservations are
+    still granted a single thread each, so that up to one thread per concurrent reservation may run beyond the budget.
+    """
+    def __init__(self, total=0):
+        """
+        :param total: The total no. of threads in the budget. If 0, the no. of cores on this machine is used.
+        """
+        self.total = total
+        self.in_use = 0
+        self._lock = Lock()
+
+    @property
+    def total(self):
+        return self._total
+
+    @total.setter
+    def total(self, total):
+        self._total = total if total > 0 else (os.cpu_count() or 1)
+
+    @property
+    def available(self):
+        return max(self.total - self.in_use, 0)
+
+    @contextmanager
+    def reserve(self, n=None):
+        """
+        Reserve threads from the budget for the duration of a block.
+        :param n: The no. of threads requested. If None, all available threads are requested.
+        :return: A context manager yielding the no. of threads granted, between 1 and `n` (1 if the budget is
+            exhausted).
+        """
+        with self._lock:
+            granted = max(1, min(n or self.total, self.available))
+            self.in_use += granted
+        try:
+            yield granted
+        finally:
+            with self._lock:
+                self.in_use -= granted
+
+
+# Process-wide thread budget shared by all NUFFT plans
+thread_budget = ThreadBudget(config.nfft.threads)
+
+
+def set_thread_budget(total):
+    """
+    Set the total no. of threads in this process' budget.
+    Suitable as an `initializer` for process pools, to divide the cores of a machine between worker processes.
+    :param total: The total no. of threads. If 0, the no. of cores on this machine is used.
+    """
+    thread_budget.total = total
+    logger.debug(f'NUFFT thread budget set to {thread_budget.total}')
+
+
+def process_thread_budget(n_processes):
+    """
+    :param n_processes: The no. of processes sharing the thread budget of this process.
+    :return: The no. of threads each of these processes should be allowed.
+    """
+    return max(1, thread_budget.total // max(n_processes, 1))
+
+
+# The threadpoolctl controller of the OpenMP libraries loaded in this process, created on first use, since
+# inspecting the loaded libraries is costly
+_openmp_controller = None
+_openmp_controller_lock = Lock()
+# The OpenMP thread limit last applied in each thread (OpenMP limits apply to the thread that sets them)
+_openmp_limit = local()
+
+
+def _get_openmp_controller():
+    global _openmp_controller
+    with _openmp_controller_lock:
+        if _openmp_controller is None:
+            _openmp_controller = ThreadpoolController().select(user_api='openmp')
+        return _openmp_controller
+
+
+@contextmanager
+def openmp_threads(n):
+    """
+    Limit the no. of threads used by OpenMP-parallelized libraries (such as FINUFFT or NFFT) for the duration of a
+    block. This requires the optional `threadpoolctl` package, without which the limit is not applied.
+    Since setting the limit is costly compared to a small transform, it is only set when it differs from the limit
+    last set in the calling thread, and is left in place after the block.
+    :param n: The maximum no. of threads.
+    """
+    if ThreadpoolController is not None and getattr(_openmp_limit, 'n', None) != n:
+        _get_openmp_controller().limit(limits=n)
+        _openmp_limit.n = n
+    yield
@@ -1,14 +1,29 @@
+import os
+import copy
 import logging
+from collections import OrderedDict, deque
+from concurrent import futures
+from threading import Lock
 import numpy as np
+import pandas as pd
 
+from aspire import config
 from aspire.image import im_filter, im_translate
-from aspire.volume import im_backproject, vol_project
-from aspire.utils.filters import IdentityFilter, ScalarFilter
+from aspire.volume import im_backproject, vol_project, rotated_grids
+from aspire.utils.filters import AbsFilter, CTFFilterBank, IdentityFilter, ScalarFilter
 from aspire.estimation.noise import WhiteNoiseEstimator
 from aspire.image import ImageStack
+from aspire.io.image_cache import DiskImageCache, content_digest
+from aspire.io.mrcs import MrcsStackWriter
+from aspire.io.starfile import write_star
+from aspire.nfft import nfft_epsilon, nfft_precision
+from aspire.source.xform import Downsample, Mask, NormalizeBackground, PhaseFlip, Whiten, apply_xforms
 from aspire.utils import ensure
 from aspire.utils.coor_trans import grid_2d
+from aspire.utils.fft import centered_fft2, centered_ifft2
 from aspire.utils.matlab_compat import m_reshape, randn, randi
+from aspire.utils.random import indexed_randn
+from aspire.utils.rotation import Rotations
 
 logger = logging.getLogger(__name__)
 
@@ -21,13 +36,17 @@ class SourceFilter:
     """
     def __init__(self, filters, indices=None, n=None):
         """
-        :param filters: An iterable of Filter objects.
+        :param filters: An iterable of Filter objects, or a CTFFilterBank. Lists of CTFFilter objects are converted to
+            a CTFFilterBank, so that all of them are evaluated at once.
         :param indices: An iterable of indices representing the 0-indexed indices of an image stack
             on which to apply the filters. If unspecified, `n` must be supplied, and individual filters are applied
             randomly.
         :param n: An integer representing the depth of the image stack on which this SourceFilter is applied.
             Not needed if `indices` are supplied.
         """
+        if not isinstance(filters, CTFFilterBank) and CTFFilterBank.supports(filters):
+            filters = CTFFilterBank.from_filters(filters)
+
         if indices is None:
             ensure(n is not None, "Either indices or n must be supplied for a SourceFilter")
             # Assign filters randomly.
@@ -44,24 +63,62 @@ class SourceFilter:
     def __str__(self):
         return f'SourceFilter ({len(self.filters)} filters, {self.n} images)'
 
+    def __mul__(self, other):
+        """
+        :param other: A Filter object.
+        :return: A SourceFilter, with the same assignments of filters to images, whose filters are multiplied by `other`.
+        """
+        if isinstance(self.filters, CTFFilterBank):
+            filters = self.filters * other
+        else:
+            filters = [f * other for f in self.filters]
+        return SourceFilter(filters, indices=self.indices)
+
+    def __abs__(self):
+        """
+        :return: A SourceFilter, with the same assignments of filters to images, whose filters are the absolute values
+            of the filters of this SourceFilter.
+        """
+        if isinstance(self.filters, CTFFilterBank):
+            filters = abs(self.filters)
+        else:
+            filters = [AbsFilter(f) for f in self.filters]
+        return SourceFilter(filters, indices=self.indices)
+
+    def image_grids(self, L, start=0, num=None):
+        """
+        Evaluate the filters of a range of images on the centered L-by-L grid of frequencies.
+        Each distinct filter is only evaluated once.
+        :param L: The resolution of the grid.
+        :param start: The index of the first image.
+        :param num: The no. of images. If None, all images from `start` onwards are included.
+        :return: An L-by-L-by-num array, whose slice [:, :, i] is the filter of image start+i.
+        """
+        end = self.n if num is None else min(start + num, self.n)
+        unique_filters, idx = np.unique(np.asarray(self.indices[start:end]).astype('int'), return_inverse=True)
+
+        if isinstance(self.filters, CTFFilterBank):
+            grids = self.filters.evaluate_grid(L, unique_filters)
+        else:
+            grids = np.stack([self.filters[k].evaluate_grid(L) for k in unique_filters], axis=2)
+        return grids[:, :, idx]
+
     def __call__(self, im, start=0, num=None):
         ensure(im.ndim == 3, "A SourceFilter can only be called for a 3d volume representing a stack of images")
 
-        end = self.n
-        if num is not None:
-            end = min(start + num, self.n)
-        all_idx = np.arange(start, end)
-
-        unique_filters = np.unique(self.indices[all_idx]).astype('int')
-        for k in unique_filters:
-            idx_k = np.where(self.indices[all_idx] == k)[0]
-            im[:, :, idx_k] = im_filter(im[:, :, idx_k], self.filters[k])
-        return im
+        grids = self.image_grids(im.shape[0], start, im.shape[2] if num is None else num)
+        im_f = centered_fft2(im) * grids
+        return np.real(centered_ifft2(im_f)).astype(im.dtype, copy=False)
 
     def evaluate(self, omega, *args, **kwargs):
+        if isinstance(self.filters, CTFFilterBank):
+            return self.filters.evaluate(omega)
         return np.column_stack([f.evaluate(omega, *args, **kwargs) for f in self.filters])
 
     def evaluate_grid(self, L, *args, **kwargs):
+        if isinstance(self.filters, CTFFilterBank):
+            return self.filters.evaluate_grid(L)
+
         # Todo: remove redundancy wrt a single Filter's evaluate_grid
         grid2d = grid_2d(L)
         omega = np.pi * np.vstack((grid2d['x'].flatten('F'), grid2d['y'].flatten('F')))
@@ -73,8 +130,11 @@ class SourceFilter:
 
     def scale(self, c):
         logger.info(f'Scaling SourceFilter by factor {c}')
-        for f in self.filters:
-            f.scale(c)
+        if isinstance(self.filters, CTFFilterBank):
+            self.filters.scale(c)
+        else:
+            for f in self.filters:
+                f.scale(c)
 
 
 class ImageSource:
@@ -106,6 +166,14 @@ class ImageSource:
 
         # The private attribute '_im' can be cached by calling this object's cache() method explicitly
         self._im = None
+        # Transforms (such as whitening) applied lazily to images as they are requested, in order
+        self._xforms = []
+        # Descriptions of the transforms already applied to the cached images '_im', which together with the
+        # definition of the source and the pending transforms determine the images, and hence their on-disk cache
+        self._ops = []
+        # Rotated Fourier grids of blocks of images, keyed by resolution and rotations, least recently used first
+        self._rotated_grids = OrderedDict()
+        self._rotated_grids_lock = Lock()
 
     def _images(self, start=0, num=None):
         """
@@ -118,28 +186,185 @@ class ImageSource:
         """
         raise NotImplementedError('Subclasses should implement this and return an ImageStack.')
 
-    def cache(self, im=None):
+    def _fingerprint(self):
+        """
+        A description of the (unprocessed) images of this source, such that sources with equal fingerprints supply
+        identical images. Subclasses that can be cached on disk should override this.
+        :return: A picklable object, or None if the images of this source cannot be identified (the default).
+        """
+        return None
+
+    def cache_key(self, *ops):
+        """
+        A content hash of the images of this source, after its transforms and the given further operations.
+        :param ops: Picklable descriptions of further operations to be applied to the images.
+        :return: A string digest, or None if this source cannot be identified (see `_fingerprint`).
+        """
+        fingerprint = self._fingerprint()
+        if fingerprint is None or None in self._ops:
+            return None
+        # Transforms determine the images alike whether they have been applied to cached images or not
+        xforms = self._ops + [xform.key() for xform in self._xforms]
+        return content_digest((type(self).__name__, self.L, self.n, str(self.dtype), fingerprint, xforms, ops))
+
+    def _cache_path(self, cache_dir, *ops):
+        """
+        :return: The directory of the on-disk cache of the images of this source after operations `ops`, or None if
+            images are not to be cached on disk.
+        """
+        cache_dir = cache_dir or config.source.cache_dir
+        if not cache_dir:
+            return None
+        key = self.cache_key(*ops)
+        if key is None:
+            logger.debug(f'{self} cannot be identified and is not cached on disk')
+            return None
+        return os.path.join(os.path.expanduser(cache_dir), key)
+
+    def _build_disk_cache(self, path, metadata=None):
+        """
+        Stream the (transformed) images of this source to an on-disk cache, in batches of
+        `config.source.cache_chunk_size` images.
+        :param path: The directory of the cache.
+        :param metadata: A picklable object stored alongside the images.
+        :return: A DiskImageCache object.
+        """
+        chunk_size = config.source.cache_chunk_size
+        return DiskImageCache.build(path, self.L, self.n, self.iter_batches(chunk_size), chunk_size=chunk_size,
+                                    metadata=metadata)
+
+    def _set_cached(self, im):
+        """
+        Replace the cached images of this source with images that have all pending transforms applied.
+        """
+        self._im = im
+        self._ops.extend(xform.key() for xform in self._xforms)
+        self._xforms = []
+
+    def add_xform(self, xform):
+        """
+        Add a transform to the images of this source. Transforms are applied lazily, to each batch of images
+        requested from `images`, and consecutive Fourier-space transforms share a single FFT/iFFT pair.
+        :param xform: An Xform object.
+        """
+        logger.debug(f'Adding transform {xform} to {self}')
+        self._xforms.append(xform)
+
+    def cache(self, im=None, cache_dir=None):
+        """
+        Cache the (transformed) images of this source, so that subsequent calls to `images` do not recompute them.
+        :param im: An L-by-L-by-n array of the images to cache. If None, the images of this source are cached.
+        :param cache_dir: A directory in which images are cached on disk (rather than in memory), streaming them in
+            batches, and where they are found again by later runs on the same source. If None,
+            `config.source.cache_dir` is used, and if that is empty, images are cached in memory.
+            Sources that cannot be identified (see `_fingerprint`) and explicitly given images are cached in memory.
+        """
+        path = self._cache_path(cache_dir) if im is None else None
+        if path is not None:
+            cached = DiskImageCache.load(path)
+            if cached is None:
+                logger.info(f'Caching source images at {path}')
+                cached = self._build_disk_cache(path)
+            else:
+                logger.info(f'Using cached source images at {path}')
+            self._set_cached(cached)
+            return
+
         logger.info('Caching source images')
         if im is None:
             im = self.images()
-        self._im = ImageStack(im)
+        else:
+            # Explicitly given images can no longer be identified from the definition of this source
+            self._ops.append(None)
+        self._set_cached(ImageStack(im[:, :, :]))
 
     def images(self, start=0, num=None, apply_noise=False):
+        end = self.n
+        if num is not None:
+            end = min(start + num, self.n)
+
         if self._im is not None:
-            end = self.n
-            if num is not None:
-                end = min(start + num, self.n)
             im = self._im[:, :, start:end]
         else:
             im = self._images(start, num)
 
+        if self._xforms:
+            im_xformed = apply_xforms(self._xforms, im[:, :, :], np.arange(start, end))
+            im = ImageStack(im_xformed) if isinstance(im, ImageStack) else im_xformed
+
         if apply_noise:
-            im += self._noise_images(start, num)
+            # Note that cached images must not be modified in place
+            im = im[:, :, :] + self._noise_images(start, num)
         return im
 
-    def _noise_images(self, start=0, num=None, noise_seed=0, noise_filter=None):
-        # Generate noisy images in interval [start, start+num-1] (a total of 'num' images)
+    def iter_batches(self, batch_size=512, prefetch=None, workers=None, apply_noise=False):
+        """
+        Iterate over all images of this source in consecutive batches, loading (and preprocessing) upcoming batches in
+        background threads while the caller processes the current one, so that I/O overlaps with computation.
+        Note that with more than one worker, batches are loaded concurrently, so `images` must be thread-safe.
+        :param batch_size: The no. of images in each batch.
+        :param prefetch: The max. no. of batches loaded ahead of the one being processed. If 0, batches are loaded
+            in the calling thread when needed. If None, `config.source.prefetch` is used.
+        :param workers: The no. of background threads loading batches. If None, `config.source.prefetch_workers`
+            is used.
+        :param apply_noise: Whether to add noise to the images, as in `images`.
+        :return: A generator of (start, images) tuples, where images is an L-by-L-by-num array of the images with
+            indices start, ..., start+num-1.
+        """
+        if prefetch is None:
+            prefetch = config.source.prefetch
+        if workers is None:
+            workers = config.source.prefetch_workers
+
+        # The NUFFT precision is set per thread, so batches loaded by workers use the precision of the caller
+        epsilon = nfft_epsilon()
+
+        def _load(start):
+            with nfft_precision(epsilon):
+                im = self.images(start, batch_size, apply_noise=apply_noise)
+            if isinstance(im, ImageStack):
+                im = im[:, :, :]
+            return im
+
+        starts = range(0, self.n, batch_size)
+        if prefetch <= 0:
+            for start in starts:
+                yield start, _load(start)
+            return
+
+        executor = futures.ThreadPoolExecutor(max(workers, 1))
+        pending = deque()
+        try:
+            for start in starts:
+                pending.append((start, executor.submit(_load, start)))
+                # Keep at most 'prefetch' batches loading ahead of the batch we're about to yield
+                if len(pending) > prefetch:
+                    start, future = pending.popleft()
+                    yield start, future.result()
+            while pending:
+                start, future = pending.popleft()
+                yield start, future.result()
+        finally:
+            # If the caller stops iterating early, don't load batches nobody will ask for
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
 
+    def _noise_images(self, start=0, num=None, noise_seed=0, noise_filter=None):
+        """
+        Generate noise images in interval [start, start+num-1] (a total of 'num' images).
+        The random generator is chosen by `config.source.noise_rng`:
+            'matlab': Noise is drawn image by image from the global generator seeded for each image, compatible with
+                MATLAB (and with results of earlier versions).
+            'philox': Noise is drawn for all images at once from a counter-based generator keyed by image index (see
+                `aspire.utils.random.indexed_randn`), and filtered as a single stack. The noise of each image is
+                independent of batching, so batches may be generated in any order, or in parallel workers.
+        :param start: start index of image
+        :param num: number of images to return
+        :param noise_seed: The random seed of the noise.
+        :param noise_filter: A Filter object by which white noise is filtered (default a scalar filter of value 1).
+        :return: An L-by-L-by-num array of noise images.
+        """
         end = self.n
         if num is not None:
             end = min(start + num, self.n)
@@ -148,6 +373,17 @@ class ImageSource:
         if noise_filter is None:
             noise_filter = ScalarFilter(value=1, power=0.5)
 
+        noise_rng = config.source.noise_rng
+        ensure(noise_rng in ('matlab', 'philox'), f'Unknown noise generator {noise_rng}')
+        if noise_rng == 'philox':
+            im_s = indexed_randn((2*self.L, 2*self.L), all_idx, seed=noise_seed)
+            h = noise_filter.evaluate_grid(2*self.L)
+            if np.all(h == h.flat[0]):
+                # White noise needs no filtering in Fourier space
+                return (h.flat[0] * im_s[:self.L, :self.L]).astype(self.dtype)
+            im_s = im_filter(im_s, noise_filter)
+            return im_s[:self.L, :self.L].astype(self.dtype)
+
         im = np.zeros((self.L, self.L, len(all_idx)), dtype=self.dtype)
 
         for idx in all_idx:
@@ -160,55 +396,195 @@ class ImageSource:
 
         return im
 
+    def _starfile_metadata(self):
+        """
+        The metadata of the images of this source, as the RELION columns understood by `RelionStarfileStack`.
+        CTF parameters are included if the filters of this source are CTFs (see `CTFFilterBank`), though filters other
+            than CTFs applied to the images (such as whitening) cannot be represented.
+        :return: A pandas DataFrame with one row per image.
+        """
+        df = pd.DataFrame(index=np.arange(self.n))
+
+        if isinstance(self.filters.filters, CTFFilterBank):
+            params = {k: v[self.filters.indices] for k, v in self.filters.filters.parameters().items()}
+            df['rlnVoltage'] = params['voltage']
+            df['rlnDefocusU'] = params['defocus_u']
+            df['rlnDefocusV'] = params['defocus_v']
+            df['rlnDefocusAngle'] = params['defocus_ang'] * 180 / np.pi
+            df['rlnSphericalAberration'] = params['Cs']
+            df['rlnAmplitudeContrast'] = params['alpha']
+            # RELION pixel sizes (in Angstrom) are detector pixel sizes (in microns) over magnifications
+            df['rlnDetectorPixelSize'] = params['pixel_size']
+            df['rlnMagnification'] = 1e4
+
+        if self.rots is not None:
+            angles = Rotations.from_legacy(self.rots).to_euler() * 180 / np.pi
+            df['rlnAngleRot'], df['rlnAngleTilt'], df['rlnAnglePsi'] = angles
+        if self.offsets is not None:
+            df['rlnOriginX'], df['rlnOriginY'] = self.offsets
+        if self.states is not None:
+            df['rlnClassNumber'] = np.asarray(self.states).astype('int')
+
+        return df
+
+    def save(self, star_path, mrcs_prefix=None, batch_size=512, images_per_file=10000, overwrite=False):
+        """
+        Save the (transformed) images of this source, with their metadata, as a RELION star file and a set of .mrcs
+        stacks, which can be loaded by `RelionStarfileStack`. Images are streamed to disk in batches, loaded (and
+        preprocessed) ahead in the background by `iter_batches` while earlier batches are written, so that saving
+        takes constant memory. The star file is written last, once all images have been written.
+        :param star_path: The path of the .star file.
+        :param mrcs_prefix: The path of the .mrcs files, without extension. Files are named `<mrcs_prefix>_00000.mrcs`,
+            ... If None, the path of the .star file without its extension is used.
+        :param batch_size: The no. of images in each batch.
+        :param images_per_file: The max. no. of images in each .mrcs file.
+        :param overwrite: Whether to overwrite existing .mrcs files.
+        """
+        if mrcs_prefix is None:
+            mrcs_prefix = os.path.splitext(star_path)[0]
+        star_dir = os.path.dirname(os.path.abspath(star_path))
+
+        logger.info(f'Saving {self} to {star_path}')
+        with MrcsStackWriter(mrcs_prefix, self.L, self.n, images_per_file, overwrite=overwrite) as writer:
+            for start, im in self.iter_batches(batch_size):
+                writer.write(start, im)
+
+        # Paths of stacks are relative to the star file, as RELION expects
+        relpaths = {f: os.path.relpath(os.path.abspath(f), star_dir) for f in writer.filepaths}
+        locations = (writer.location(i) for i in range(self.n))
+        df = self._starfile_metadata()
+        df.insert(0, 'rlnImageName', [f'{k + 1:06d}@{relpaths[f]}' for f, k in locations])
+        write_star(star_path, df)
+
+    def subset(self, indices):
+        """
+        A lazy view of a subset of the images of this source (such as a class selection, or a half-set), which reads
+        only the selected images from this source, as they are requested, and shares its metadata.
+        Also available as `src[indices]`.
+        :param indices: The (0-indexed) indices of the selected images, in the order in which the subset supplies them,
+            as an array of indices, a boolean mask or a slice.
+        :return: A SubsetSource object.
+        """
+        return SubsetSource(self, indices)
+
+    def __getitem__(self, indices):
+        return self.subset(indices)
+
     def set_max_resolution(self, max_L):
+        """
+        Downsample the images of this source (lazily, see `add_xform`), adjusting its filters and offsets accordingly.
+        :param max_L: The resolution of the downsampled images.
+        """
         ensure(max_L <= self.L, "Max desired resolution should be less than the current resolution")
-        self.L = max_L
 
-        ds_factor = self._L / max_L
+        ds_factor = self.L / max_L
         self.filters.scale(ds_factor)
         self.offsets /= ds_factor
 
-        # Invalidate images
-        self._im = None
+        self.add_xform(Downsample(max_L))
+        self.L = max_L
 
-    def whiten(self, whiten_filter=None):
+    def whiten(self, whiten_filter=None, cache_dir=None):
         """
-        Modify the Source object in place by whitening + caching all images, and adding the appropriate whitening
-            filter to all available filters.
+        Modify the Source object in place by whitening all images (lazily, see `add_xform`), and adding the
+            appropriate whitening filter to all available filters.
         :param whiten_filter: Whitening filter to apply. If None, determined automatically.
+        :param cache_dir: A directory in which whitened images are cached on disk, as in `cache`. If the whitened
+            images of this source are already found there, neither the images nor the whitening filter are recomputed.
+            If None, `config.source.cache_dir` is used, and if that is empty, whitened images are not cached.
         :return: On return, the Source object has been modified in place.
         """
         logger.debug("Whitening source object")
-        if whiten_filter is None:
+        filter_digest = None if whiten_filter is None else content_digest(whiten_filter)
+        path = self._cache_path(cache_dir, 'whiten', filter_digest)
+        cached = path and DiskImageCache.load(path)
+
+        if cached:
+            logger.info(f'Using cached whitened images at {path}')
+            whiten_filter = cached.metadata['whiten_filter']
+        elif whiten_filter is None:
             logger.info('Determining Whitening Filter')
             whiten_filter = WhiteNoiseEstimator(self).filter
             whiten_filter.power = -0.5
 
-        # Create a whitening SourceFilter object that applies to all available images
-        whiten_source_filter = SourceFilter(
-            [whiten_filter],
-            indices=np.zeros(self.n).astype('int')
-        )
-        # Get source images and cache the whitened images
-        logger.debug("Getting all images")
-        images = self.images()
-        logger.debug("Applying whitening filter to all images and caching")
-        whitened_images = whiten_source_filter(images[:, :, :])
-        self.cache(whitened_images)
+        self.add_xform(Whiten(whiten_filter))
+        if cached:
+            self._set_cached(cached)
+        elif path:
+            logger.info(f'Whitening images and caching them at {path}')
+            self._set_cached(self._build_disk_cache(path, metadata={'whiten_filter': whiten_filter}))
 
         # Modify this Source's SourceFilter
-        # TODO: Add ability to multiply a SourceFilter object with a Filter object to avoid attribute access below
-        self.filters = SourceFilter(
-            [f * whiten_filter for f in self.filters.filters],
-            indices=self.filters.indices
-        )
+        self.filters = self.filters * whiten_filter
+
+    def phase_flip(self):
+        """
+        Modify the Source object in place by correcting the phases of all images for their CTFs (lazily, see
+            `add_xform`), and replacing all filters by their absolute values.
+        """
+        logger.debug("Phase flipping source object")
+        self.add_xform(PhaseFlip(self.filters))
+        self.filters = abs(self.filters)
+
+    def normalize_background(self, bg_radius=1):
+        """
+        Modify the Source object in place by normalizing all images (lazily, see `add_xform`), so that their
+            background has zero mean and unit variance.
+        :param bg_radius: The radius (relative to half the image size) of the disk whose complement is the background.
+        """
+        self.add_xform(NormalizeBackground(bg_radius))
+
+    def mask(self, radius=1):
+        """
+        Modify the Source object in place by zeroing out all pixels outside a disk (lazily, see `add_xform`).
+        :param radius: The radius (relative to half the image size) of the disk.
+        """
+        self.add_xform(Mask(radius))
+
+    def rotated_grids(self, start=0, num=None, L=None):
+        """
+        Rotated Fourier grids of a block of images, cached so that repeated projections and backprojections of the
+        same images (by estimators and their iterative solvers) do not recompute them.
+        The cache is bounded by `config.source.rotated_grids_cache_memory`, evicting the least recently used grids.
+        :param start: Start index of image to consider
+        :param num: No. of images to consider
+        :param L: The resolution of the grids (None for the resolution `self.L` of the images of this source)
+        :return: A 3-by-L-by-L-by-num array of rotated Fourier grids, as returned by `aspire.volume.rotated_grids`.
+            This array is read-only, since it may be shared by other callers.
+        """
+        end = self.n
+        if num is not None:
+            end = min(start + num, self.n)
+        rots = self.rots[:, :, start:end]
+        L = self.L if L is None else L
+
+        # Keying on the rotations themselves keeps the cache valid if rotations are modified or reassigned
+        key = L, rots.tobytes()
+        with self._rotated_grids_lock:
+            if key in self._rotated_grids:
+                self._rotated_grids.move_to_end(key)
+                return self._rotated_grids[key]
+
+        pts_rot = rotated_grids(L, rots)
+        pts_rot.setflags(write=False)
 
-    def im_backward(self, im, start):
+        max_nbytes = config.source.rotated_grids_cache_memory * 2**20
+        if pts_rot.nbytes <= max_nbytes:
+            with self._rotated_grids_lock:
+                self._rotated_grids[key] = pts_rot
+                while sum(v.nbytes for v in self._rotated_grids.values()) > max_nbytes:
+                    self._rotated_grids.popitem(last=False)
+
+        return pts_rot
+
+    def im_backward(self, im, start, individual=False):
         """
         Apply adjoint mapping to set of images
         :param im: An L-by-L-by-n array of images to which we wish to apply the adjoint of the forward model.
         :param start: Start index of image to consider
-        :return: An L-by-L-by-L volume containing the sum of the adjoint mappings applied to the start+num-1 images.
+        :param individual: If True, return the adjoint mapping of each image separately, instead of their sum.
+        :return: An L-by-L-by-L volume containing the sum of the adjoint mappings applied to the start+num-1 images
+            (or an L-by-L-by-L-by-n array of the adjoint mappings of each image, if `individual` is True).
         """
         if im.ndim < 3:
             im = im[:, :, np.newaxis]
@@ -221,21 +597,36 @@ class ImageSource:
 
         im = self.filters(im, start=start, num=num)
 
-        vol = im_backproject(im, self.rots[:, :, start:start+num])
+        vol = im_backproject(im, self.rots[:, :, start:start+num], pts_rot=self.rotated_grids(start, num),
+                             individual=individual)
 
         return vol
 
     def vol_forward(self, vol, start, num):
         """
         Apply forward image model to volume
-        :param vol: A volume of size L-by-L-by-L.
+        :param vol: A volume of size L-by-L-by-L, or an array of size L-by-L-by-L-by-K containing K volumes, all of
+            which are projected in a single NUFFT pass.
         :param start: Start index of image to consider
         :param num: No. of images to consider
         :return: The images obtained from volume by projecting, applying CTFs, translating, and multiplying by the
-            amplitude.
+            amplitude, as an L-by-L-by-num array (or an L-by-L-by-num-by-K array, for K volumes).
+        """
+        all_idx = np.arange(start, min(start + num, self.n))
+        im = vol_project(vol, self.rots[:, :, all_idx], pts_rot=self.rotated_grids(start, num))
+
+        if vol.ndim == 4:
+            for k in range(vol.shape[-1]):
+                im[:, :, :, k] = self._forward_image_model(im[:, :, :, k], start, num)
+            return im
+
+        return self._forward_image_model(im, start, num)
+
+    def _forward_image_model(self, im, start, num):
+        """
+        Apply CTFs, translations and amplitudes to a stack of projections of a single volume.
         """
         all_idx = np.arange(start, min(start + num, self.n))
-        im = vol_project(vol, self.rots[:, :, all_idx])
 
         im = self.filters(im, start, num)
 
@@ -243,3 +634,122 @@ class ImageSource:
         im *= np.broadcast_to(self.amplitudes[all_idx], (self.L, self.L, len(all_idx)))
 
         return im
+
+
+class SubsetSource(ImageSource):
+    """
+    A lazy view of a subset of the images of another (parent) source.
+    Images are read from the parent as they are requested, reading runs of nearby images in single blocks, with the
+    transforms of the parent at the time the subset is created applied. The metadata of the subset is mapped from the
+    parent's: for subsets selected by a slice (such as `src[:1000]` or `src[::2]`), rotations, amplitudes and states
+    are views of the parent's arrays, and otherwise only the selected entries are copied. Offsets and filters, which
+    transforms such as `set_max_resolution` modify in place, are always copied.
+    Later transforms of the parent do not affect the subset, and transforms of the subset itself (such as whitening)
+    apply to the subset only.
+    """
+    def __init__(self, src, indices):
+        """
+        :param src: The parent ImageSource object.
+        :param indices: The (0-indexed) indices of the selected images, as an array of indices, a boolean mask or a
+            slice.
+        """
+        indices = np.arange(src.n)[indices]
+        ensure(indices.ndim == 1, 'Subsets must be selected by a 1D array of indices, a boolean mask or a slice')
+
+        self.parent = src
+        self.indices = indices
+        self._slice = self._as_slice(indices)
+
+        # The images of the parent as of now: its cached images (which later transforms of the parent replace rather
+        # than modify) and the transforms still pending on them
+        self._parent_im = src._im
+        self._parent_xforms = list(src._xforms)
+        self._parent_ops = src._ops + [xform.key() for xform in src._xforms]
+        self._parent_L = src.L
+
+        super().__init__(
+            L=src.L,
+            n=len(indices),
+            states=self._take(src.states),
+            filters=SourceFilter(copy.deepcopy(src.filters.filters),
+                                 indices=np.array(self._take(np.asarray(src.filters.indices)))),
+            offsets=np.array(self._take(src.offsets)),
+            amplitudes=self._take(src.amplitudes),
+            rots=self._take(src.rots),
+            dtype=src.dtype
+        )
+
+    def __str__(self):
+        return f'SubsetSource ({self.n} of {self.parent.n} images of {self.parent})'
+
+    @staticmethod
+    def _as_slice(indices):
+        """
+        :return: A slice equivalent to an array of indices, or None if there is no such slice.
+        """
+        if len(indices) == 0:
+            return slice(0, 0)
+        step = indices[1] - indices[0] if len(indices) > 1 else 1
+        if step <= 0 or np.any(np.diff(indices) != step):
+            return None
+        return slice(int(indices[0]), int(indices[-1]) + 1, int(step))
+
+    def _take(self, x):
+        """
+        Map an array of metadata of the parent (indexed by image along its last axis) to this subset.
+        """
+        if x is None:
+            return None
+        if self._slice is not None:
+            return x[..., self._slice]
+        return x[..., self.indices]
+
+    def _fingerprint(self):
+        parent_fingerprint = self.parent._fingerprint()
+        if parent_fingerprint is None or None in self._parent_ops:
+            return None
+        return (type(self.parent).__name__, self._parent_L, self.parent.n, str(self.parent.dtype), parent_fingerprint,
+                self._parent_ops, self.indices)
+
+    def _read_parent(self, start, num):
+        """
+        Read a range of the images of the parent, as they were when this subset was created.
+        """
+        if self._parent_im is not None:
+            im = self._parent_im[:, :, start:start+num]
+        else:
+            im = self.parent._images(start, num)
+        if self._parent_xforms:
+            im = apply_xforms(self._parent_xforms, im[:, :, :], np.arange(start, start + im.shape[-1]))
+        return im
+
+    def _gather(self, read, start=0, num=None):
+        """
+        Read the images of a range of this subset from the parent.
+        :param read: A function of (start, num) returning the L-by-L-by-num images of a range of the parent.
+        :return: An L-by-L-by-num array of images.
+        """
+        end = self.n if num is None else min(start + num, self.n)
+        unique_idx, inverse = np.unique(self.indices[start:end], return_inverse=True)
+        if len(unique_idx) == 0:
+            return np.zeros((self._parent_L, self._parent_L, 0), dtype=self.dtype)
+
+        # Nearby images are read in a single block, at the cost of reading (a few) unneeded images in between
+        breaks = np.flatnonzero(np.diff(unique_idx) > config.source.subset_max_gap) + 1
+        blocks = []
+        for block_idx in np.split(unique_idx, breaks):
+            first = int(block_idx[0])
+            im = read(first, int(block_idx[-1]) - first + 1)
+            blocks.append(im[:, :, block_idx - first])
+        return np.concatenate(blocks, axis=2)[:, :, inverse]
+
+    def _images(self, start=0, num=None):
+        return self._gather(lambda s, k: self._read_parent(s, k)[:, :, :], start, num)
+
+    def _noise_images(self, start=0, num=None, **kwargs):
+        if self.L != self.parent.L:
+            # Noise of the parent's images is of the wrong size for a subset downsampled on its own (or whose parent
+            # has been downsampled since)
+            return super()._noise_images(start, num, **kwargs)
+        return self._gather(lambda s, k: self.parent._noise_images(s, k, **kwargs), start, num)
+
@@ -1,8 +1,8 @@
 import numpy as np
 from aspire.source import ImageSource
 from aspire.source.starfile import StarfileStack
-from aspire.utils.coor_trans import angles_to_rots
-from aspire.utils.filters import CTFFilter
+from aspire.utils.rotation import Rotations
+from aspire.utils.filters import CTFFilterBank
 from aspire.source import SourceFilter
 
 
@@ -40,7 +40,11 @@ class RelionStarfileStack(StarfileStack):
         'rlnOriginalParticleName': str,
         'rlnNrOfSignificantSamples': float,
         'rlnNrOfFrames': int,
-        'rlnMaxValueProbDistribution': float
+        'rlnMaxValueProbDistribution': float,
+        'rlnOpticsGroup': int,
+        'rlnImagePixelSize': float,
+        'rlnOriginXAngst': float,
+        'rlnOriginYAngst': float
     }
 
     def add_metadata(self):
@@ -58,6 +62,11 @@ class RelionStarfileStack(StarfileStack):
             df['rlnAngleTilt'] = np.nan
             df['rlnAnglePsi'] = np.nan
 
+        if 'rlnOriginX' not in df and 'rlnOriginXAngst' in df and 'rlnImagePixelSize' in df:
+            # RELION 3.1 origins are in Angstrom rather than pixels
+            df['rlnOriginX'] = df['rlnOriginXAngst'] / df['rlnImagePixelSize']
+            df['rlnOriginY'] = df['rlnOriginYAngst'] / df['rlnImagePixelSize']
+
         if 'rlnOriginX' not in df:
             df['rlnOriginX'] = np.nan
             df['rlnOriginY'] = np.nan
@@ -94,9 +103,9 @@ class RelionStarfileStack(StarfileStack):
         self.pixel_size = pixel_size
         self.B = B
 
-        rots = angles_to_rots(
+        rots = Rotations.from_euler(
             self.df[['_rlnAngleRot_radians', '_rlnAngleTilt_radians', '_rlnAnglePsi_radians']].values.T
-        )
+        ).legacy
 
         filter_params, filter_indices = np.unique(
             self.df[[
@@ -111,20 +120,17 @@ class RelionStarfileStack(StarfileStack):
             axis=0
         )
 
-        filters = []
-        for row in filter_params:
-            filters.append(
-                CTFFilter(
-                    pixel_size=self.pixel_size,
-                    voltage=row[0],
-                    defocus_u=row[1],
-                    defocus_v=row[2],
-                    defocus_ang=row[3],
-                    Cs=row[4],
-                    alpha=row[5],
-                    B=self.B
-                )
-            )
+        # All distinct CTFs are held in a single bank, evaluated together
+        filters = CTFFilterBank(
+            pixel_size=self.pixel_size,
+            voltage=filter_params[:, 0],
+            defocus_u=filter_params[:, 1],
+            defocus_v=filter_params[:, 2],
+            defocus_ang=filter_params[:, 3],
+            Cs=filter_params[:, 4],
+            alpha=filter_params[:, 5],
+            B=self.B
+        )
         filters = SourceFilter(filters, indices=filter_indices)
 
         offsets = self.df[['rlnOriginX', 'rlnOriginY']].values.T
@@ -1,3 +1,4 @@
+import copy
 import numpy as np
 from scipy.linalg import qr, eigh
 
@@ -5,29 +6,34 @@ from aspire.source import ImageSource
 from aspire.image import im_translate
 from aspire.volume import vol_project
 from aspire.utils import ensure
-from aspire.utils.matlab_compat import Random, m_reshape
-from aspire.utils.coor_trans import grid_3d, angles_to_rots
+from aspire.utils.matlab_compat import m_reshape
+from aspire.utils.random import random_stream
+from aspire.utils.coor_trans import grid_3d
+from aspire.utils.rotation import Rotations
 from aspire.utils.matlab_compat import rand, randi, randn
 from aspire.utils.matrix import anorm, acorr, ainner, vol_to_vec, vec_to_vol, vecmat_to_volmat, make_symmat
 
 
 class Simulation(ImageSource):
     def __init__(self, L=8, n=1024, states=None, filters=None, offsets=None, amplitudes=None, dtype='single', C=2,
-                 rots=None):
+                 rots=None, seed=0):
         """
         A Cryo-EM simulation
         Other than the base class attributes, it has:
 
         :param C: The no. of distinct volumes
         :param rots: A 3-by-3-by-n array of rotation matrices corresponding to viewing directions
+        :param seed: The random seed of the simulation. All random parameters (and volumes) not given are drawn from
+            MATLAB-compatible random streams seeded with it, without touching the global random state, so that
+            simulations can safely be created concurrently.
         """
 
-        offsets = offsets or L / 16 * randn(2, n, seed=0)
+        offsets = offsets or L / 16 * randn(2, n, seed=seed)
         if amplitudes is None:
             min_, max_ = 2./3, 3./2
-            amplitudes = min_ + rand(n, seed=0) * (max_ - min_)
-        states = states or randi(C, n, seed=0)
-        rots = rots or self._uniform_random_rotations(n, seed=0)
+            amplitudes = min_ + rand(n, seed=seed) * (max_ - min_)
+        states = states or randi(C, n, seed=seed)
+        rots = rots or self._uniform_random_rotations(n, seed=seed)
 
         super().__init__(
             L=L,
@@ -41,16 +47,26 @@ class Simulation(ImageSource):
         )
 
         self.C = C
-        self.vols = self._gaussian_blob_vols(L=self.L, C=self.C, seed=0)
+        self.seed = seed
+        self.vols = self._gaussian_blob_vols(L=self.L, C=self.C, seed=seed)
+        # The resolution, filters and offsets with which images are simulated. Transforms of this source (such as
+        # whitening or downsampling) change its 'L', 'filters' and 'offsets' to model their effect, but do not change
+        # the simulated images they are applied to.
+        self._sim_L = self.L
+        self.sim_filters = copy.deepcopy(self.filters)
+        self.sim_offsets = self.offsets.copy()
+
+    def _fingerprint(self):
+        return self.C, self.vols, self.states, self.rots, self.sim_offsets, self.amplitudes, self.sim_filters
 
     def _uniform_random_rotations(self, n, seed=None):
-        with Random(seed):
-            angles = np.vstack((
-                np.random.random((1, n)) * 2 * np.pi,
-                np.arccos(2 * np.random.random((1, n)) - 1),
-                np.random.random((1, n)) * 2 * np.pi
-            ))
-        return angles_to_rots(angles)
+        stream = random_stream(seed, matlab=True)
+        angles = np.vstack((
+            stream.random((1, n)) * 2 * np.pi,
+            np.arccos(2 * stream.random((1, n)) - 1),
+            stream.random((1, n)) * 2 * np.pi
+        ))
+        return Rotations.from_euler(angles).legacy
 
     def _gaussian_blob_vols(self, L=8, C=2, K=16, alpha=1, seed=None):
         """
@@ -59,29 +75,31 @@ class Simulation(ImageSource):
         :param C: The number of volumes to generate
         :param K: The number of blobs
         :param alpha: A scale factor of the blob widths
+        :param seed: A random seed or stream (see `aspire.utils.random.random_stream`)
 
         :return: A volume array of size L x L x L x C containing the C Gaussian blob volumes.
         """
 
+        stream = random_stream(seed, matlab=True)
+
         def gaussian_blobs(K, alpha):
             Q = np.zeros(shape=(3, 3, K)).astype(self.dtype)
             D = np.zeros(shape=(3, 3, K)).astype(self.dtype)
             mu = np.zeros(shape=(3, K)).astype(self.dtype)
 
             for k in range(K):
-                V = randn(3, 3).astype(self.dtype) / np.sqrt(3)
+                V = randn(3, 3, seed=stream).astype(self.dtype) / np.sqrt(3)
                 Q[:, :, k] = qr(V)[0]
                 D[:, :, k] = alpha ** 2 / 16 * np.diag(np.sum(abs(V) ** 2, axis=0))
-                mu[:, k] = 0.5 * randn(3) / np.sqrt(3)
+                mu[:, k] = 0.5 * randn(3, seed=stream) / np.sqrt(3)
 
             return Q, D, mu
 
-        with Random(seed):
-            vols = np.zeros(shape=(L, L, L, C)).astype(self.dtype)
-            for k in range(C):
-                Q, D, mu = gaussian_blobs(K, alpha)
-                vols[:, :, :, k] = self.eval_gaussian_blobs(L, Q, D, mu)
-            return vols
+        vols = np.zeros(shape=(L, L, L, C)).astype(self.dtype)
+        for k in range(C):
+            Q, D, mu = gaussian_blobs(K, alpha)
+            vols[:, :, :, k] = self.eval_gaussian_blobs(L, Q, D, mu)
+        return vols
 
     def eval_gaussian_blobs(self, L, Q, D, mu):
         g = grid_3d(L)
@@ -103,16 +121,16 @@ class Simulation(ImageSource):
 
     def clean_images(self, start=0, num=None):
         all_idx = np.arange(start, min(start+num, self.n))
-        im = np.zeros((self.L, self.L, len(all_idx)))
-
-        unique_states = np.unique(self.states[all_idx])
-        for k in unique_states:
-            vol_k = self.vols[:, :, :, k-1]
-            idx_k = np.where(self.states[all_idx] == k)[0]
-            rot = self.rots[:, :, all_idx[idx_k]]
-
-            im_k = vol_project(vol_k, rot)
-            im[:, :, idx_k] = im_k
+        states = self.states[all_idx]
+
+        # Project the volume of each state only along the rotations of its own images (with one NUFFT plan per
+        # state), and scatter the projections back into the order of the images
+        pts_rot = self.rotated_grids(start, num, L=self._sim_L)
+        im = np.empty((self._sim_L, self._sim_L, len(all_idx)), dtype=self.vols.dtype)
+        for state in np.unique(states):
+            idx = np.flatnonzero(states == state)
+            im[:, :, idx] = vol_project(self.vols[:, :, :, state-1], self.rots[:, :, all_idx[idx]],
+                                        pts_rot=pts_rot[..., idx])
         return im
 
     def _images(self, start=0, num=None):
@@ -128,13 +146,13 @@ class Simulation(ImageSource):
         all_idx = np.arange(start, end)
 
         im = self.clean_images(start, num)
-        im = self.filters(im, start, num)
+        im = self.sim_filters(im, start, num)
 
         # Translations
-        im = im_translate(im, self.offsets[:, all_idx])
+        im = im_translate(im, self.sim_offsets[:, all_idx])
 
         # Amplitudes
-        im *= np.broadcast_to(self.amplitudes[all_idx], (self.L, self.L, len(all_idx)))
+        im *= np.broadcast_to(self.amplitudes[all_idx], (self._sim_L, self._sim_L, len(all_idx)))
 
         return im
 
@@ -1,9 +1,7 @@
-from collections import OrderedDict
 import os.path
 import logging
 import pandas as pd
 import numpy as np
-import mrcfile
 from tqdm import tqdm
 from concurrent import futures
 from multiprocessing import cpu_count
@@ -11,7 +9,9 @@ from multiprocessing import cpu_count
 from aspire.utils import ensure
 from aspire.source import ImageSource
 from aspire.image import ImageStack
-from aspire.image import im_downsample
+from aspire.nfft.threads import thread_budget
+from aspire.io.mrcs import mrcs_pool, read_mrcs_images
+from aspire.io.starfile import load_parsed, parse_star, save_parsed
 
 logger = logging.getLogger(__name__)
 
@@ -26,33 +26,30 @@ class StarfileStack(ImageSource):
 
     @staticmethod
     def star2df(filepath, column_mappings):
-        dirpath = os.path.dirname(filepath)
-        columns = OrderedDict()
-        skiprows = 0
-        with open(filepath, 'r') as f:
-            for line in f.readlines():
-                if line.startswith('_rln'):
-                    name = line.split(' ')[0][1:]
-                    columns[name] = column_mappings.get(name, str)
-                    skiprows += 1
-                elif len(columns) > 0:
-                    break
-                else:
-                    skiprows += 1
-
-        if 'rlnImageName' not in columns:
-            raise RuntimeError('Valid starfiles at least need a _rlnImageName column specified')
-
-        df = pd.read_csv(filepath, delim_whitespace=True, skiprows=skiprows, names=columns, dtype=columns)
-
-        # TODO: Check behavior if this is a single mrc file (no '@')
-        _index, df['_mrc_filename'] = df['rlnImageName'].str.split('@', 1).str
-        df['_mrc_index'] = pd.to_numeric(_index)
+        """
+        Read the table of images of a star file: the first data block with an rlnImageName column, such as the
+        'data_particles' block of RELION 3.1 star files. Columns of the 'data_optics' block, if any, are added to each
+        image by its optics group. Star files are re-opened from their parsed copies while unchanged (see
+        `aspire.io.starfile.load_parsed`).
+        :param filepath: The path of the .star file.
+        :param column_mappings: A dict mapping column names (without their leading underscore) to data types.
+        :return: A pandas DataFrame with one row per image.
+        """
+        key = 'star2df', column_mappings
+        df = load_parsed(filepath, key)
+        if df is None:
+            df = StarfileStack._parse_images(filepath, column_mappings)
+            save_parsed(filepath, df, key)
 
         # Adding a full-filepath field to the Dataframe helps us save time later
         # Note that os.path.join works as expected when the second argument is an absolute path itself
-        df['_mrc_filepath'] = df['_mrc_filename'].apply(lambda filename: os.path.join(dirpath, filename))
-        df['_mrc_found'] = df['_mrc_filepath'].apply(lambda filepath: os.path.exists(filepath))
+        # Paths are joined, and checked for existence, once per distinct file
+        dirpath = os.path.dirname(filepath)
+        filenames = df['_mrc_filename'].unique()
+        filepaths = {filename: os.path.join(dirpath, filename) for filename in filenames}
+        found = {filename: os.path.exists(filepath) for filename, filepath in filepaths.items()}
+        df['_mrc_filepath'] = df['_mrc_filename'].map(filepaths)
+        df['_mrc_found'] = df['_mrc_filename'].map(found)
 
         msg = f'Read starfile with {len(df)} records'
         n_missing = sum(df['_mrc_found'] == False)  # nopep8
@@ -64,6 +61,28 @@ class StarfileStack(ImageSource):
 
         return df
 
+    @staticmethod
+    def _parse_images(filepath, column_mappings):
+        blocks = parse_star(filepath, column_mappings)
+        images = [df for df in blocks.values() if 'rlnImageName' in df]
+        if not images:
+            raise RuntimeError('Valid starfiles at least need a _rlnImageName column specified')
+        df = images[0]
+
+        optics = blocks.get('optics')
+        if optics is not None and 'rlnOpticsGroup' in df and 'rlnOpticsGroup' in optics:
+            optics = optics.set_index('rlnOpticsGroup')
+            for column in optics.columns:
+                if column not in df:
+                    df[column] = df['rlnOpticsGroup'].map(optics[column])
+
+        # TODO: Check behavior if this is a single mrc file (no '@')
+        image_names = df['rlnImageName'].str.partition('@')
+        df['_mrc_index'] = pd.to_numeric(image_names[0])
+        df['_mrc_filename'] = image_names[2]
+
+        return df
+
     def __init__(self, filepath, n_workers=-1, ignore_missing_files=False, max_rows=None):
         """
         Load starfile at given filepath
@@ -78,6 +97,7 @@ class StarfileStack(ImageSource):
         """
         logger.debug(f'Loading starfile at path {filepath}')
 
+        self.filepath = filepath
         self.n_workers = n_workers
         self.df = StarfileStack.star2df(filepath, self.column_mappings)
         self.df = self.add_metadata()
@@ -100,15 +120,15 @@ class StarfileStack(ImageSource):
 
         # Peek into the first image and populate some attributes
         first_mrc_filepath = self.df.iloc[0]._mrc_filepath
-        mrc = mrcfile.open(first_mrc_filepath)
+        with mrcs_pool.open(first_mrc_filepath) as mrc:
+            # Get the 'mode' (data type) - TODO: There's probably a more direct way to do this.
+            mode = int(mrc.header.mode)
+            shape = mrc.data.shape
 
-        # Get the 'mode' (data type) - TODO: There's probably a more direct way to do this.
-        mode = int(mrc.header.mode)
         dtypes = {0: 'int8', 1: 'int16', 2: 'float32', 6: 'uint16'}
         ensure(mode in dtypes, f'Only modes={list(dtypes.keys())} in MRC files are supported for now.')
         dtype = dtypes[mode]
 
-        shape = mrc.data.shape
         ensure(shape[1] == shape[2], "Only square images are supported")
         L = shape[1]
 
@@ -122,6 +142,13 @@ class StarfileStack(ImageSource):
     def __str__(self):
         return f'Starfile ({self.n} images of size {self.L}x{self.L})'
 
+    def _fingerprint(self):
+        # The star file and the .mrcs files it refers to, identified by their paths, sizes and modification times,
+        # along with the images selected from them
+        filepaths = [self.filepath] + sorted(self.df['_mrc_filepath'].unique())
+        files = [(os.path.abspath(f), os.path.getsize(f), os.path.getmtime(f)) for f in filepaths]
+        return files, self._L, self.df['rlnImageName'].values.tolist()
+
     def add_metadata(self):
         """
         Modify the self.df DataFrame to add any calculated columns/change data types.
@@ -134,13 +161,9 @@ class StarfileStack(ImageSource):
     def _images(self, start=0, num=None):
 
         def load_single_mrcs(filepath, df):
-            arr = mrcfile.open(filepath).data
-            data = arr[df['_mrc_index'] - 1, :, :].T
-
-            if self.L < self._L:
-                data = im_downsample(data, self.L)
-
-            return df.index, data
+            # Only the requested images are read from the (memory-mapped) file
+            data = read_mrcs_images(filepath, df['_mrc_index'].values - 1).T
+            return df['_batch_index'].values, data
 
         n_workers = self.n_workers
         if n_workers < 0:
@@ -151,14 +174,16 @@ class StarfileStack(ImageSource):
         else:
             num = min(self.n - start, num)
 
-        df = self.df[start:num]
-        im = np.empty((self.L, self.L, num))
+        df = self.df.iloc[start:start+num].assign(_batch_index=np.arange(num))
+        # Images are read at their original resolution, and downsampled by the transforms of this source if needed
+        im = np.empty((self._L, self._L, num))
 
         groups = df.groupby('_mrc_filepath')
         n_workers = min(n_workers, len(groups))
 
-        pbar = tqdm(total=self.n)
-        with futures.ThreadPoolExecutor(n_workers) as executor:
+        pbar = tqdm(total=num)
+        # Reserve threads for the workers, so that NUFFTs running concurrently in this process use the remaining cores
+        with thread_budget.reserve(n_workers) as n_workers, futures.ThreadPoolExecutor(n_workers) as executor:
             to_do = []
             for filepath, _df in groups:
                 future = executor.submit(load_single_mrcs, filepath, _df)
@@ -0,0 +1,199 @@
+"""
+Transforms of the images of an ImageSource (such as whitening or downsampling), which are recorded on the source and
+applied lazily to each batch of images as it is requested, so that preprocessing never holds more than a batch of
+images in memory.
+
+Transforms that act on the centered 2D Fourier transforms of images are marked as `fourier`. Consecutive such
+transforms are fused by `apply_xforms`, so that a chain of them costs a single FFT/iFFT pair.
+"""
+import copy
+import numpy as np
+
+from aspire.image import im_downsample
+from aspire.utils import ensure
+from aspire.utils.coor_trans import grid_2d
+from aspire.utils.fft import centered_fft2, centered_ifft2
+from aspire.io.image_cache import content_digest
+
+
+class Xform:
+    """
+    A transform of batches of images.
+    """
+    # Whether this transform acts on centered Fourier transforms of images (through `apply_fourier`)
+    fourier = False
+
+    def key(self):
+        """
+        :return: A picklable description of this transform, which determines its output, for use in cache keys.
+        """
+        raise NotImplementedError('Subclasses should implement this method')
+
+    def apply(self, im, indices):
+        """
+        Apply this transform to a batch of images.
+        :param im: An L-by-L-by-n array of images.
+        :param indices: An array of the n (0-indexed) indices of these images in their source.
+        :return: An array of the transformed images.
+        """
+        return apply_xforms([self], im, indices)
+
+    def apply_fourier(self, im_f, indices):
+        """
+        Apply this transform to the centered Fourier transforms of a batch of images (for `fourier` transforms only).
+        :param im_f: An L-by-L-by-n array of centered 2D Fourier transforms of images.
+        :param indices: An array of the n (0-indexed) indices of these images in their source.
+        :return: An array of the transformed Fourier transforms, of size L'-by-L'-by-n, where L' may differ from L.
+        """
+        raise NotImplementedError(f'{self} is not a Fourier transform')
+
+
+class FilterXform(Xform):
+    """
+    Multiply images by a Filter in Fourier space (as in whitening).
+    """
+    fourier = True
+
+    def __init__(self, filt):
+        """
+        :param filt: A Filter object. A copy is kept, so that later modifications of `filt` do not affect this
+            transform.
+        """
+        self.filter = copy.deepcopy(filt)
+
+    def __str__(self):
+        return f'FilterXform ({self.filter.__class__.__name__})'
+
+    def key(self):
+        return 'filter', content_digest(self.filter)
+
+    def apply_fourier(self, im_f, indices):
+        return im_f * self.filter.evaluate_grid(im_f.shape[0])[:, :, np.newaxis]
+
+
+class Whiten(FilterXform):
+    """
+    Whiten images by multiplying them with a whitening filter in Fourier space.
+    """
+    def __str__(self):
+        return 'Whiten'
+
+    def key(self):
+        return 'whiten', content_digest(self.filter)
+
+
+class PhaseFlip(Xform):
+    """
+    Correct the phases of images for their CTFs, by flipping the sign of all Fourier coefficients where the CTF is
+    negative.
+    """
+    fourier = True
+
+    def __init__(self, source_filter):
+        """
+        :param source_filter: A SourceFilter object assigning a CTF to each image. A copy is kept.
+        """
+        self.source_filter = copy.deepcopy(source_filter)
+
+    def __str__(self):
+        return 'PhaseFlip'
+
+    def key(self):
+        return 'phase_flip', content_digest(self.source_filter)
+
+    def apply_fourier(self, im_f, indices):
+        signs = np.sign(self.source_filter.evaluate_grid(im_f.shape[0]))
+        return im_f * signs[:, :, self.source_filter.indices[indices]]
+
+
+class Downsample(Xform):
+    """
+    Downsample images by low-pass filtering them and interpolating them on a coarser grid (see `im_downsample`).
+    """
+    def __init__(self, L):
+        """
+        :param L: The resolution of the downsampled images.
+        """
+        self.L = L
+
+    def __str__(self):
+        return f'Downsample (L={self.L})'
+
+    def key(self):
+        return 'downsample', self.L
+
+    def apply(self, im, indices):
+        ensure(self.L <= im.shape[0], 'Images can only be downsampled to a lower resolution')
+        if self.L == im.shape[0]:
+            return im
+        return im_downsample(im, self.L)
+
+
+class NormalizeBackground(Xform):
+    """
+    Normalize images so that the pixels in their background have zero mean and unit variance.
+    """
+    def __init__(self, bg_radius=1):
+        """
+        :param bg_radius: The radius (relative to half the image size) of the disk whose complement is the background.
+        """
+        self.bg_radius = bg_radius
+
+    def __str__(self):
+        return f'NormalizeBackground (bg_radius={self.bg_radius})'
+
+    def key(self):
+        return 'normalize_background', self.bg_radius
+
+    def apply(self, im, indices):
+        mask = grid_2d(im.shape[0])['r'] > self.bg_radius
+        background = im[mask]
+        mean = np.mean(background, axis=0)
+        std = np.std(background, axis=0)
+        return (im - mean) / std
+
+
+class Mask(Xform):
+    """
+    Zero out the pixels of images outside a disk.
+    """
+    def __init__(self, radius=1):
+        """
+        :param radius: The radius (relative to half the image size) of the disk.
+        """
+        self.radius = radius
+
+    def __str__(self):
+        return f'Mask (radius={self.radius})'
+
+    def key(self):
+        return 'mask', self.radius
+
+    def apply(self, im, indices):
+        mask = grid_2d(im.shape[0])['r'] <= self.radius
+        return im * mask[:, :, np.newaxis]
+
+
+def apply_xforms(xforms, im, indices):
+    """
+    Apply a chain of transforms to a batch of images. Consecutive Fourier transforms are applied between a single
+    FFT/iFFT pair.
+    :param xforms: A list of Xform objects, applied in order.
+    :param im: An L-by-L-by-n array of images.
+    :param indices: An array of the n (0-indexed) indices of these images in their source.
+    :return: An array of the transformed images.
+    """
+    i = 0
+    while i < len(xforms):
+        if not xforms[i].fourier:
+            im = xforms[i].apply(im, indices)
+            i += 1
+            continue
+
+        im_f = centered_fft2(im)
+        while i < len(xforms) and xforms[i].fourier:
+            im_f = xforms[i].apply_fourier(im_f, indices)
+            i += 1
+        im = np.real(centered_ifft2(im_f))
+
+    return im
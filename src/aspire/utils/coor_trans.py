@@ -4,6 +4,8 @@ General purpose math functions, mostly geometric in nature.
 
 import numpy as np
 
+from aspire.utils.rotation import Rotations
+
 
 def cart2pol(x, y):
     """
@@ -80,12 +82,12 @@ def grid_3d(n):
 
 
 def angles_to_rots(angles):
-    n_angles = angles.shape[-1]
-    rots = np.zeros(shape=(3, 3, n_angles))
-
-    for i in range(n_angles):
-        rots[:, :, i] = erot(angles[:, i])
-    return rots
+    """
+    Convert Euler angles to rotation matrices
+    :param angles: A 3-by-n array of Euler angles (in radians) in the ZYZ convention.
+    :return: A 3-by-3-by-n array of rotation matrices, as a view of a `aspire.utils.rotation.Rotations` object.
+    """
+    return Rotations.from_euler(angles).legacy
 
 
 def erot(angles):
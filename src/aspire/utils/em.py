@@ -3,15 +3,16 @@ Utility functions for Electron-Microscopy
 """
 
 import math
+import numpy as np
 
 
 def voltage_to_wavelength(voltage):
     """
     Convert from electron voltage to wavelength.
-    :param voltage: float, The electron voltage in kV.
-    :return: float, The electron wavelength in nm.
+    :param voltage: float (or array of floats), The electron voltage in kV.
+    :return: float (or array of floats), The electron wavelength in nm.
     """
-    return 12.2643247 / math.sqrt(voltage*1e3 + 0.978466*voltage**2)
+    return 12.2643247 / np.sqrt(voltage*1e3 + 0.978466*voltage**2)
 
 
 def wavelength_to_voltage(wavelength):
@@ -1,6 +1,9 @@
+import copy
+from threading import Lock
 import numpy as np
 from scipy.interpolate import RegularGridInterpolator
 
+from aspire import config
 from aspire.utils import ensure
 from aspire.utils.em import voltage_to_wavelength
 from aspire.utils.coor_trans import grid_2d
@@ -79,6 +82,24 @@ class MultiplicativeFilter(Filter):
         return res
 
 
+class AbsFilter(Filter):
+    """
+    A Filter object that returns the absolute value of the evaluation of another filter (as for phase-flipped images)
+    """
+    def __init__(self, component):
+        super().__init__(
+            dim=component.dim,
+            radial=component.radial
+        )
+        self._component = component
+
+    def _evaluate(self, omega):
+        return np.abs(self._component.evaluate(omega))
+
+    def scale(self, c):
+        self._component.scale(c)
+
+
 class ArrayFilter(Filter):
     def __init__(self, xfer_fn_array):
         """
@@ -217,3 +238,211 @@ class RadialCTFFilter(CTFFilter):
     def __init__(self, pixel_size=None, voltage=None, defocus=None, Cs=None, alpha=None, B=None, power=1):
         super().__init__(pixel_size=pixel_size, voltage=voltage, defocus_u=defocus, defocus_v=defocus, defocus_ang=0,
                          Cs=Cs, alpha=alpha, B=B, power=power)
+
+
+class CTFFilterBank:
+    """
+    A bank of K CTF filters, with their parameters held in arrays, so that all of them are evaluated in a single
+    broadcasted pass (rather than filter by filter, as a list of CTFFilter objects would be).
+    Frequency grids are computed once per resolution, and evaluated L-by-L-by-K grids are cached per resolution and
+    scale, up to a total of `config.filters.ctf_grid_cache_memory` MB per bank.
+
+    A bank may also carry filters common to all its CTFs (as for whitened images, see `__mul__`), and represent the
+    absolute values of its CTFs (as for phase flipped images, see `__abs__`). Individual filters, as Filter objects, are
+    available by indexing or iterating over the bank.
+    """
+    def __init__(self, pixel_size=10, voltage=200, defocus_u=1.5e4, defocus_v=1.5e4, defocus_ang=0, Cs=2.26,
+                 alpha=0.07, B=0, power=1):
+        """
+        All parameters are as for CTFFilter, and can be scalars (shared by all filters) or arrays of length K.
+        """
+        params = np.broadcast_arrays(*(
+            np.atleast_1d(np.asarray(p, dtype='float64'))
+            for p in (pixel_size, voltage, defocus_u, defocus_v, defocus_ang, Cs, alpha, B)
+        ))
+        ensure(params[0].ndim == 1, 'CTF parameters must be scalars or 1D arrays')
+        (self.pixel_size, self.voltage, self.defocus_u, self.defocus_v, self.defocus_ang, self.Cs, self.alpha,
+         self.B) = (p.copy() for p in params)
+        self.power = power
+        self.wavelength = voltage_to_wavelength(self.voltage)
+
+        self._scale = 1
+        self._multipliers = []
+        self._abs = False
+
+        self._freqs = {}
+        self._grids = {}
+        self._lock = Lock()
+
+    @classmethod
+    def from_filters(cls, filters):
+        """
+        :param filters: A list of CTFFilter objects, all of the same power.
+        :return: A CTFFilterBank of these filters.
+        """
+        ensure(cls.supports(filters), 'Only lists of CTFFilter objects of the same power can be combined in a bank')
+        return cls(**{
+            name: [getattr(f, name) for f in filters]
+            for name in ('pixel_size', 'voltage', 'defocus_u', 'defocus_v', 'defocus_ang', 'Cs', 'alpha', 'B')
+        }, power=filters[0].power)
+
+    @staticmethod
+    def supports(filters):
+        """
+        :return: Whether a list of filters can be combined into a CTFFilterBank.
+        """
+        return (
+            len(filters) > 0
+            and all(isinstance(f, CTFFilter) for f in filters)
+            and len(set(f.power for f in filters)) == 1
+        )
+
+    def __str__(self):
+        return f'CTFFilterBank ({len(self)} filters)'
+
+    def __len__(self):
+        return len(self.pixel_size)
+
+    def __getitem__(self, k):
+        f = CTFFilter(
+            pixel_size=self.pixel_size[k] * self._scale,
+            voltage=self.voltage[k],
+            defocus_u=self.defocus_u[k],
+            defocus_v=self.defocus_v[k],
+            defocus_ang=self.defocus_ang[k],
+            Cs=self.Cs[k],
+            alpha=self.alpha[k],
+            B=self.B[k],
+            power=self.power
+        )
+        if self._abs:
+            f = AbsFilter(f)
+        for m in self._multipliers:
+            f = f * m
+        return f
+
+    def __iter__(self):
+        return (self[k] for k in range(len(self)))
+
+    def __getstate__(self):
+        # Cached grids are not part of the state of the bank (and would bloat its pickles)
+        state = self.__dict__.copy()
+        state.update(_freqs={}, _grids={}, _lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def _derived(self, **kwargs):
+        bank = copy.copy(self)
+        bank.__dict__.update(_freqs={}, _grids={}, _lock=Lock(), **kwargs)
+        return bank
+
+    def __mul__(self, other):
+        """
+        :param other: A Filter object.
+        :return: A CTFFilterBank whose filters are the filters of this bank multiplied by `other`.
+        """
+        return self._derived(_multipliers=self._multipliers + [other])
+
+    def __abs__(self):
+        """
+        :return: A CTFFilterBank whose filters are the absolute values of the filters of this bank.
+        """
+        return self._derived(_abs=True)
+
+    def scale(self, c):
+        """
+        Scale all filters of this bank by a constant factor, as in `Filter.scale`.
+        """
+        self._scale *= c
+        for m in self._multipliers:
+            m.scale(c)
+
+    def parameters(self):
+        """
+        :return: A dict mapping the names of the CTF parameters (as for CTFFilter) to arrays of their values for the K
+            filters of this bank, with pixel sizes scaled as by `scale`.
+        """
+        return {
+            'pixel_size': self.pixel_size * self._scale,
+            'voltage': self.voltage,
+            'defocus_u': self.defocus_u,
+            'defocus_v': self.defocus_v,
+            'defocus_ang': self.defocus_ang,
+            'Cs': self.Cs,
+            'alpha': self.alpha,
+            'B': self.B
+        }
+
+    def _ctf(self, omega, ks):
+        # Angles (and radii, up to pixel size) of frequencies are shared by all filters
+        om_x, om_y = omega / (2 * np.pi)
+        angles = np.arctan2(om_y, om_x)[:, np.newaxis]
+        r2 = (om_x**2 + om_y**2)[:, np.newaxis] / (self.pixel_size[ks] * self._scale)**2
+
+        defocus_mean = 0.5 * (self.defocus_u[ks] + self.defocus_v[ks])
+        defocus_diff = 0.5 * (self.defocus_u[ks] - self.defocus_v[ks])
+        defocus = defocus_mean + defocus_diff * np.cos(2 * (angles - self.defocus_ang[ks]))
+
+        wavelength = self.wavelength[ks]
+        c2 = -np.pi * wavelength * defocus
+        c4 = 0.5 * np.pi * (self.Cs[ks] * 1e7) * wavelength**3
+        gamma = c2*r2 + c4*r2**2
+
+        alpha = self.alpha[ks]
+        h = np.sqrt(1 - alpha**2) * np.sin(gamma) - alpha * np.cos(gamma)
+        if np.any(self.B[ks]):
+            h *= np.exp(-self.B[ks] * r2)
+
+        if self.power != 1:
+            h = h ** self.power
+        if self._abs:
+            h = np.abs(h)
+        return h
+
+    def evaluate(self, omega, ks=None):
+        """
+        Evaluate the filters of this bank at specified frequencies.
+        :param omega: An array of size 2-by-n representing the spatial frequencies at which the filters are to be
+            evaluated, as in `Filter.evaluate`.
+        :param ks: The indices of the filters to evaluate. If None, all filters are evaluated.
+        :return: An array of size n-by-K (or n-by-len(ks)) of the values of the filters.
+        """
+        if ks is None:
+            ks = np.arange(len(self))
+        h = self._ctf(omega, ks)
+        for m in self._multipliers:
+            h *= m.evaluate(omega)[:, np.newaxis]
+        return h
+
+    def evaluate_grid(self, L, ks=None):
+        """
+        Evaluate the filters of this bank on the centered L-by-L grid of frequencies, as in `Filter.evaluate_grid`.
+        :param L: The resolution of the grid.
+        :param ks: The indices of the filters to evaluate. If None, all filters are evaluated.
+        :return: An array of size L-by-L-by-K (or L-by-L-by-len(ks)) of the values of the filters. This array may be
+            shared with other callers, and must not be modified.
+        """
+        with self._lock:
+            if L not in self._freqs:
+                grid2d = grid_2d(L)
+                self._freqs[L] = np.pi * np.vstack((grid2d['x'].flatten('F'), grid2d['y'].flatten('F')))
+            omega = self._freqs[L]
+
+            key = L, self._scale
+            if key not in self._grids:
+                nbytes = L * L * len(self) * 8
+                cached_nbytes = sum(grid.nbytes for grid in self._grids.values())
+                if nbytes + cached_nbytes <= config.filters.ctf_grid_cache_memory * 2**20:
+                    grid = self.evaluate(omega).reshape((L, L, len(self)), order='F')
+                    grid.setflags(write=False)
+                    self._grids[key] = grid
+            grid = self._grids.get(key)
+
+        if grid is not None:
+            return grid if ks is None else grid[:, :, ks]
+        if ks is None:
+            ks = np.arange(len(self))
+        return self.evaluate(omega, ks).reshape((L, L, len(ks)), order='F')
@@ -5,13 +5,19 @@ can be changed to 'C', and subsequently, this package deprecated altogether (i.e
 directly by the caller).
 """
 
+from threading import RLock
 import numpy as np
 from scipy.special import erfinv
 
+from aspire.utils import ensure
+from aspire.utils.random import random_stream
+
 SQRT2 = np.sqrt(2)
 
 # A list of random states, used as a stack
 random_states = []
+# Held by threads while they have seeded the global random state
+_random_lock = RLock()
 
 
 def m_reshape(x, new_shape):
@@ -34,6 +40,17 @@ def m_flatten(x):
     return x.T.flatten()
 
 
+def _stream(seed):
+    """
+    :param seed: A random seed, None, or a random stream.
+    :return: A MATLAB-compatible stream seeded with `seed`, the stream `seed` itself, or the global NumPy random state
+        if `seed` is None.
+    """
+    if seed is None:
+        return np.random
+    return random_stream(seed, matlab=True)
+
+
 def randi(i_max, size, seed=None):
     """
     A MATLAB compatible randi implementation that returns numbers from a discrete uniform distribution.
@@ -42,55 +59,60 @@ def randi(i_max, size, seed=None):
 
     :param iMax: TODO
     :param size: size of the resulting np array
-    :param seed: Random seed to use (None to apply no seed)
+    :param seed: Random seed to use (None to use the global random state), or a random stream to draw from
+        (see `aspire.utils.random.random_stream`)
     :return: A np array
     """
-    with Random(seed):
-        return np.ceil(i_max * np.random.random(size=size)).astype('int')
+    return np.ceil(i_max * _stream(seed).random(size=size)).astype('int')
 
 
 def randn(*args, **kwargs):
     """
     Calls rand and applies inverse transform sampling to the output.
+    A random seed or stream may be passed as the keyword argument `seed`, as in `randi`.
     """
     seed = None
     if 'seed' in kwargs:
         seed = kwargs.pop('seed')
 
-    with Random(seed):
-        uniform = np.random.rand(*args, **kwargs)
-        result = SQRT2 * erfinv(2 * uniform - 1)
-        # TODO: Rearranging elements to get consistent behavior with MATLAB 'randn2'
-        result = m_reshape(result.flatten(), args)
-        return result
+    uniform = _stream(seed).random(args, **kwargs)
+    result = SQRT2 * erfinv(2 * uniform - 1)
+    # TODO: Rearranging elements to get consistent behavior with MATLAB 'randn2'
+    result = m_reshape(result.flatten(), args)
+    return result
 
 
 def rand(size, seed=None):
-    with Random(seed):
-        return m_reshape(np.random.random(np.prod(size)), size)
+    """
+    A random seed or stream may be passed as `seed`, as in `randi`.
+    """
+    return m_reshape(_stream(seed).random(np.prod(size)), size)
 
 
 class Random:
     """
     A context manager that pushes a random seed to the stack for reproducible results,
     and pops it on exit.
+    Since this seeds the global NumPy random state, blocks using it in different threads are serialized. New code
+    should draw from explicit random streams instead (see `aspire.utils.random`).
     """
     def __init__(self, seed=None):
+        """
+        :param seed: An integer seed, or None to leave the global random state unchanged. Unlike the functions above,
+            this does not accept random streams, since the global random state can only be seeded with integers.
+        """
+        ensure(seed is None or isinstance(seed, (int, np.integer)),
+               f'Random can only be seeded with an integer seed, not {type(seed).__name__}')
         self.seed = seed
 
     def __enter__(self):
         if self.seed is not None:
+            _random_lock.acquire()
             # Push current state on stack
             random_states.append(np.random.get_state())
-
-            seed = self.seed
-            # 5489 is the default seed used by MATLAB for seed 0 !
-            if seed == 0:
-                seed = 5489
-
-            new_state = np.random.RandomState(seed)
-            np.random.set_state(new_state.get_state())
+            np.random.set_state(random_stream(self.seed, matlab=True).get_state())
 
     def __exit__(self, *args):
         if self.seed is not None:
             np.random.set_state(random_states.pop())
+            _random_lock.release()
@@ -37,8 +37,7 @@ def src_wiener_coords(sim, mean_vol, eig_vols, lambdas=None, noise_var=0, batch_
     coords = np.zeros((k, sim.n))
     covar_noise = noise_var * np.eye(k)
 
-    for i in range(0, sim.n, batch_size):
-        ims = sim.images(i, batch_size)
+    for i, ims in sim.iter_batches(batch_size):
         batch_n = ims.shape[-1]
         ims -= sim.vol_forward(mean_vol, i, batch_n)
 
@@ -68,9 +67,7 @@ def qr_vols_forward(sim, s, n, vols, k):
     :param k:
     :return:
     """
-    ims = np.zeros((sim.L, sim.L, n, k), dtype=vols.dtype)
-    for ell in range(k):
-        ims[:, :, :, ell] = sim.vol_forward(vols[:, :, :, ell], s, n)
+    ims = sim.vol_forward(vols[:, :, :, :k], s, n).astype(vols.dtype, copy=False)
 
     ims = np.swapaxes(ims, 2, 3)
     Q_vecs = np.zeros((sim.L**2, k, n), dtype=vols.dtype)
@@ -123,3 +123,59 @@ def conj_grad(a_fun, b, cg_opt=None, init=None):
     #     raise Warning('Conjugate gradient reached maximum number of iterations!')
     return x, obj, info
 
+
+def block_cg(a_fun, b, x0=None, tol=1e-5, max_iter=None):
+    """
+    Solve a symmetric positive definite linear system A x = b for many right-hand sides at once, by running the
+    conjugate gradient method on all columns of b together. Each iteration applies A once, to the search directions of
+    all columns that have not converged yet, so that a batched implementation of A is applied to whole blocks of
+    vectors rather than to one vector at a time.
+    :param a_fun: A function applying the (real) matrix A to an n-by-m array of m vectors, for any m.
+    :param b: An array of n-by-m right-hand sides (or a single right-hand side of length n).
+    :param x0: An initial guess of the solutions, of the same shape as b (None for zeros).
+    :param tol: The relative tolerance of the solutions. The iterations for each column stop once the norm of its
+        residual is at most `tol` times the norm of its right-hand side.
+    :param max_iter: The maximum no. of iterations (None for 10*n, as for `scipy.sparse.linalg.cg`).
+    :return: A tuple (x, info), where x is an array of the solutions, of the same shape as b, and info is the no. of
+        columns that have not converged within `max_iter` iterations (0 on success).
+    """
+    shape = b.shape
+    b = b.reshape((shape[0], -1))
+    if max_iter is None:
+        max_iter = 10 * shape[0]
+
+    if x0 is None:
+        x = np.zeros_like(b)
+        r = b.copy()
+    else:
+        x = np.array(x0, dtype=b.dtype).reshape(b.shape)
+        r = b - a_fun(x)
+
+    # Columns of b that are zero have zero solutions
+    threshold = tol * np.linalg.norm(b, axis=0)
+    x[:, threshold == 0] = 0
+    r[:, threshold == 0] = 0
+
+    p = r.copy()
+    rho = np.sum(r * r, axis=0)
+    active = np.sqrt(rho) > threshold
+
+    for _ in range(max_iter):
+        if not np.any(active):
+            break
+
+        # Only iterate on the columns that have not converged yet (all columns, without copies, while there are any)
+        idx = slice(None) if np.all(active) else np.flatnonzero(active)
+        p_active = p[:, idx]
+        a_p = a_fun(p_active).reshape(p_active.shape)
+        alpha = rho[idx] / np.sum(p_active * a_p, axis=0)
+
+        x[:, idx] += alpha * p_active
+        r[:, idx] -= alpha * a_p
+        rho_new = np.sum(r[:, idx] ** 2, axis=0)
+        p[:, idx] = r[:, idx] + rho_new / rho[idx] * p_active
+        rho[idx] = rho_new
+
+        active[idx] = np.sqrt(rho_new) > threshold[idx]
+
+    return x.reshape(shape), int(np.sum(active))
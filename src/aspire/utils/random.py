@@ -0,0 +1,91 @@
+"""
+Reproducible random number generation from explicit random streams.
+
+Rather than seeding the global NumPy generator, code that needs random numbers should accept a seed or a stream,
+turn it into a stream with `random_stream`, and draw from that stream only. Parallel workers should each be given
+their own child stream, spawned deterministically with `spawn_streams`, so that results do not depend on how work is
+scheduled between them.
+
+For values tied to indexed objects (such as images), `indexed_randn` draws from Philox generators whose counters are
+derived from the indices, so that the values drawn for any index do not depend on which other indices are drawn with
+it, or in which order, process or thread.
+"""
+import numpy as np
+from numpy.random import Generator, Philox, RandomState, SeedSequence
+
+from aspire.utils import ensure
+
+
+def random_stream(seed=None, matlab=False):
+    """
+    Create a random stream.
+    :param seed: An integer seed, None (to seed from fresh entropy), or an existing stream, which is returned as is.
+    :param matlab: If True, create a MATLAB-compatible stream, a Mersenne Twister seeded as by MATLAB's `rng(seed)`,
+        whose uniform values (drawn with `random`) are identical to those of MATLAB's `rand`.
+    :return: A numpy.random.Generator, or a numpy.random.RandomState for MATLAB-compatible streams.
+    """
+    if isinstance(seed, (Generator, RandomState)):
+        return seed
+    if matlab:
+        # 5489 is the default seed used by MATLAB for seed 0 !
+        return RandomState(5489 if seed == 0 else seed)
+    return np.random.default_rng(seed)
+
+
+def spawn_streams(seed, n):
+    """
+    Deterministically create independent child streams, one for each of several parallel workers.
+    :param seed: An integer seed, or a stream (as returned by `random_stream`) from which the children are seeded.
+    :param n: The no. of child streams.
+    :return: A list of n numpy.random.Generator objects.
+    """
+    if isinstance(seed, Generator):
+        seed = int(seed.integers(2**63))
+    elif isinstance(seed, RandomState):
+        seed = int(seed.randint(2**63 - 1, dtype='int64'))
+    return [Generator(Philox(child)) for child in SeedSequence(seed).spawn(n)]
+
+
+def _runs(indices):
+    """
+    Split an array of indices into runs of consecutive indices.
+    :return: A list of (first index, position in `indices`, length) tuples.
+    """
+    if len(indices) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(indices)]))
+    return [(int(indices[s]), s, e - s) for s, e in zip(starts, ends)]
+
+
+def indexed_randn(sz, indices, seed=0, dtype='float64'):
+    """
+    Draw an array of standard normal values for each of a set of indices.
+    The values for index i are drawn from a block of the stream of a Philox generator keyed by `seed`, starting at a
+    counter determined by i, and are transformed to normal values by the Box-Muller transform (which, unlike NumPy's
+    own normal sampling, consumes a fixed number of random values per array). Values for consecutive indices are drawn
+    in a single call.
+    :param sz: A tuple, the shape of the array drawn for each index.
+    :param indices: An array of non-negative integer indices.
+    :param seed: The key of the Philox generator.
+    :param dtype: The dtype of the returned array.
+    :return: An array of size sz-by-len(indices), where the array [..., k] depends only on `indices[k]` and `seed`.
+    """
+    indices = np.asarray(indices, dtype='int64').reshape(-1)
+    ensure(np.all(indices >= 0), 'Indices must be non-negative')
+
+    m = int(np.prod(sz))
+    # Philox generates 4 values per counter increment, so blocks of a multiple of 4 values start at a fresh counter
+    block = 4 * int(np.ceil(m / 4))
+
+    z = np.empty((len(indices), block), dtype=dtype)
+    for first, pos, length in _runs(indices):
+        gen = Generator(Philox(key=seed, counter=first * (block // 4)))
+        u = gen.random((length, block))
+        r = np.sqrt(-2 * np.log1p(-u[:, 0::2]))
+        theta = 2 * np.pi * u[:, 1::2]
+        z[pos:pos+length, 0::2] = r * np.cos(theta)
+        z[pos:pos+length, 1::2] = r * np.sin(theta)
+
+    return z[:, :m].T.reshape(tuple(sz) + (len(indices),), order='F')
@@ -0,0 +1,180 @@
+"""
+A compact, vectorized representation of a batch of 3D rotations.
+"""
+
+import numpy as np
+
+from aspire.utils import ensure
+
+
+def _zrots(theta):
+    """
+    :param theta: An array of n angles (in radians).
+    :return: An n-by-3-by-3 array of rotations about the z axis by these angles.
+    """
+    sin, cos = np.sin(theta), np.cos(theta)
+    rots = np.zeros((len(theta), 3, 3))
+    rots[:, 0, 0] = cos
+    rots[:, 0, 1] = -sin
+    rots[:, 1, 0] = sin
+    rots[:, 1, 1] = cos
+    rots[:, 2, 2] = 1
+    return rots
+
+
+def _yrots(theta):
+    """
+    :param theta: An array of n angles (in radians).
+    :return: An n-by-3-by-3 array of rotations about the y axis by these angles.
+    """
+    sin, cos = np.sin(theta), np.cos(theta)
+    rots = np.zeros((len(theta), 3, 3))
+    rots[:, 0, 0] = cos
+    rots[:, 0, 2] = sin
+    rots[:, 1, 1] = 1
+    rots[:, 2, 0] = -sin
+    rots[:, 2, 2] = cos
+    return rots
+
+
+class Rotations:
+    """
+    A batch of n rotations in 3D, stored as a contiguous n-by-3-by-3 array of rotation matrices.
+    All conversions and operations are vectorized over the batch.
+
+    Most of ASPIRE stores rotations in the (MATLAB-compatible) 3-by-3-by-n layout, where rotation i is `rots[:, :, i]`.
+    The `legacy` attribute gives a view of the rotations in this layout, without copying.
+    """
+    def __init__(self, matrices):
+        """
+        :param matrices: An n-by-3-by-3 array of rotation matrices.
+        """
+        matrices = np.ascontiguousarray(matrices, dtype='float64')
+        ensure(matrices.ndim == 3 and matrices.shape[1:] == (3, 3), 'Rotation matrices must be of size n-by-3-by-3')
+        self.matrices = matrices
+
+    def __len__(self):
+        return self.matrices.shape[0]
+
+    def __str__(self):
+        return f'Rotations ({len(self)} rotations)'
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            item = slice(item, item + 1 or None)
+        return Rotations(self.matrices[item])
+
+    def __matmul__(self, other):
+        """
+        Compose rotations, i.e. `(self @ other)[i]` rotates by `other[i]` followed by `self[i]`.
+        Either batch may consist of a single rotation, in which case it is composed with all rotations of the other.
+        """
+        return Rotations(np.matmul(self.matrices, other.matrices))
+
+    @property
+    def legacy(self):
+        """
+        :return: A 3-by-3-by-n view of the rotation matrices, where rotation i is `legacy[:, :, i]`.
+        """
+        return self.matrices.transpose((1, 2, 0))
+
+    @classmethod
+    def from_legacy(cls, rots):
+        """
+        :param rots: A 3-by-3-by-n array of rotation matrices.
+        :return: A Rotations object.
+        """
+        ensure(rots.ndim == 3 and rots.shape[:2] == (3, 3), 'Rotation matrices must be of size 3-by-3-by-n')
+        return cls(rots.transpose((2, 0, 1)))
+
+    @classmethod
+    def from_euler(cls, angles):
+        """
+        :param angles: A 3-by-n array of Euler angles (in radians), in the ZYZ convention (as used by RELION), so that
+            angles (a, b, c) correspond to the rotation zrot(a) @ yrot(b) @ zrot(c).
+        :return: A Rotations object.
+        """
+        angles = np.asarray(angles, dtype='float64').reshape((3, -1))
+        return cls(_zrots(angles[0]) @ _yrots(angles[1]) @ _zrots(angles[2]))
+
+    def to_euler(self):
+        """
+        :return: A 3-by-n array of Euler angles (in radians) in the ZYZ convention, with the second angle in [0, pi].
+            Where the first and third angles are not unique (for a second angle of 0 or pi), the third angle is 0.
+        """
+        R = self.matrices
+        b = np.arccos(np.clip(R[:, 2, 2], -1, 1))
+        a = np.arctan2(R[:, 1, 2], R[:, 0, 2])
+        c = np.arctan2(R[:, 2, 1], -R[:, 2, 0])
+
+        # Gimbal lock, where R is a rotation about the z axis by a+c (for b=0) or a-c (for b=pi) composed with yrot(b)
+        locked = np.abs(np.sin(b)) < 1e-8
+        flip = np.where(R[:, 2, 2] < 0, -1, 1)[locked]
+        a[locked] = np.arctan2(flip * R[locked, 1, 0], flip * R[locked, 0, 0])
+        c[locked] = 0
+
+        return np.vstack((a, b, c))
+
+    @classmethod
+    def from_quaternions(cls, quaternions):
+        """
+        :param quaternions: An n-by-4 array of quaternions (w, x, y, z). These need not be normalized.
+        :return: A Rotations object.
+        """
+        q = np.asarray(quaternions, dtype='float64').reshape((-1, 4))
+        q = q / np.linalg.norm(q, axis=1, keepdims=True)
+        w, x, y, z = q.T
+
+        matrices = np.empty((len(q), 3, 3))
+        matrices[:, 0, 0] = 1 - 2 * (y**2 + z**2)
+        matrices[:, 0, 1] = 2 * (x * y - z * w)
+        matrices[:, 0, 2] = 2 * (x * z + y * w)
+        matrices[:, 1, 0] = 2 * (x * y + z * w)
+        matrices[:, 1, 1] = 1 - 2 * (x**2 + z**2)
+        matrices[:, 1, 2] = 2 * (y * z - x * w)
+        matrices[:, 2, 0] = 2 * (x * z - y * w)
+        matrices[:, 2, 1] = 2 * (y * z + x * w)
+        matrices[:, 2, 2] = 1 - 2 * (x**2 + y**2)
+        return cls(matrices)
+
+    def to_quaternions(self):
+        """
+        :return: An n-by-4 array of unit quaternions (w, x, y, z), with w >= 0.
+        """
+        R = self.matrices
+        trace = np.trace(R, axis1=1, axis2=2)
+
+        # For numerical stability, each quaternion is recovered from the largest of 4 (scaled) components
+        # (Shepperd's method), which are |2w|, |2x|, |2y| and |2z| respectively.
+        candidates = np.stack((
+            1 + trace,
+            1 + 2 * R[:, 0, 0] - trace,
+            1 + 2 * R[:, 1, 1] - trace,
+            1 + 2 * R[:, 2, 2] - trace
+        ), axis=1)
+        largest = np.argmax(candidates, axis=1)
+        s = np.sqrt(np.maximum(candidates[np.arange(len(R)), largest], 0))
+
+        # Products 4*q_i*q_j of pairs of components, from which the others follow once one is known
+        wx = R[:, 2, 1] - R[:, 1, 2]
+        wy = R[:, 0, 2] - R[:, 2, 0]
+        wz = R[:, 1, 0] - R[:, 0, 1]
+        xy = R[:, 0, 1] + R[:, 1, 0]
+        xz = R[:, 0, 2] + R[:, 2, 0]
+        yz = R[:, 1, 2] + R[:, 2, 1]
+
+        q = np.empty((len(R), 4))
+        q[:, 0] = np.choose(largest, (s, wx / s, wy / s, wz / s))
+        q[:, 1] = np.choose(largest, (wx / s, s, xy / s, xz / s))
+        q[:, 2] = np.choose(largest, (wy / s, xy / s, s, yz / s))
+        q[:, 3] = np.choose(largest, (wz / s, xz / s, yz / s, s))
+        q /= 2
+
+        q *= np.where(q[:, :1] < 0, -1, 1)
+        return q
+
+    def inv(self):
+        """
+        :return: The inverse rotations, as a Rotations object.
+        """
+        return Rotations(self.matrices.transpose((0, 2, 1)))
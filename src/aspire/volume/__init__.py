@@ -4,7 +4,7 @@ from aspire.utils import ensure
 from aspire.utils.coor_trans import grid_2d
 from aspire.utils.fft import centered_ifft2, centered_fft2
 from aspire.utils.matlab_compat import m_reshape, m_flatten
-from aspire.nfft import Plan
+from aspire.nfft import Plan, real_dtype
 
 
 class VolumeStack:
@@ -39,20 +39,35 @@ class FBBasisVolumeStack(BasisVolumeStack):
 
 
 # TODO: The following functions likely all need to be moved inside the Volume class
-def vol_project(vol, rot_matrices):
+def vol_project(vol, rot_matrices, pts_rot=None):
+    """
+    Project a volume along rotations
+    :param vol: An L-by-L-by-L volume, or an L-by-L-by-L-by-K array of K volumes. All volumes are projected with a
+        single NUFFT plan.
+    :param rot_matrices: An 3-by-3-by-n array of rotation matrices corresponding to viewing directions.
+    :param pts_rot: The rotated Fourier grids of `rot_matrices`, as returned by `rotated_grids`. If None, these are
+        computed here.
+    :return: An L-by-L-by-n array of projections (or an L-by-L-by-n-by-K array, for K volumes).
+    """
     L = vol.shape[0]
     n = rot_matrices.shape[-1]
-    pts_rot = rotated_grids(L, rot_matrices)
+    if pts_rot is None:
+        pts_rot = rotated_grids(L, rot_matrices)
 
     # TODO: rotated_grids might as well give us correctly shaped array in the first place
     pts_rot = m_reshape(pts_rot, (3, L**2*n))
 
-    im_f = 1./L * Plan(vol.shape, pts_rot).transform(vol)
-    im_f = m_reshape(im_f, (L, L, -1))
+    plan = Plan(vol.shape[:3], pts_rot, dtype=real_dtype(vol.dtype))
+    if vol.ndim == 4:
+        im_f = 1./L * plan.transform_many(vol)
+        im_f = m_reshape(im_f, (L, L, n, -1))
+    else:
+        im_f = 1./L * plan.transform(vol)
+        im_f = m_reshape(im_f, (L, L, -1))
 
     if L % 2 == 0:
-        im_f[0, :, :] = 0
-        im_f[:, 0, :] = 0
+        im_f[0, :, ...] = 0
+        im_f[:, 0, ...] = 0
 
     im = centered_ifft2(im_f)
 
@@ -64,34 +79,33 @@ def rotated_grids(L, rot_matrices):
     Generate rotated Fourier grids in 3D from rotation matrices
     :param L: The resolution of the desired grids.
     :param rot_matrices: An array of size 3-by-3-by-K containing K rotation matrices
-    :return: A set of rotated Fourier grids in three dimensions as specified by the rotation matrices.
-        Frequencies are in the range [-pi, pi].
+    :return: A set of rotated Fourier grids in three dimensions as specified by the rotation matrices, as an array of
+        size 3-by-L-by-L-by-K. Frequencies are in the range [-pi, pi].
     """
-    # TODO: Flattening and reshaping at end may not be necessary!
     grid2d = grid_2d(L)
-    num_pts = L**2
-    num_rots = rot_matrices.shape[-1]
-    pts = np.pi * np.vstack([grid2d['x'].flatten('F'), grid2d['y'].flatten('F'), np.zeros(num_pts)])
-    pts_rot = np.zeros((3, num_pts, num_rots))
-    for i in range(num_rots):
-        pts_rot[:, :, i] = rot_matrices[:, :, i] @ pts
-
-    pts_rot = m_reshape(pts_rot, (3, L, L, num_rots))
-    return pts_rot
+    # The unrotated grid lies in the z=0 plane, so only the first two columns of the rotation matrices are needed
+    pts = np.pi * np.stack([grid2d['x'], grid2d['y']])
+    return np.einsum('ijk,jlm->ilmk', rot_matrices[:, :2, :], pts)
 
 
-def im_backproject(im, rot_matrices):
+def im_backproject(im, rot_matrices, pts_rot=None, individual=False):
     """
     Backproject images along rotation
     :param im: An L-by-L-by-n array of images to backproject.
     :param rot_matrices: An 3-by-3-by-n array of rotation matrices corresponding to viewing directions.
-    :return: An L-by-L-by-L volumes corresponding to the sum of the backprojected images.
+    :param pts_rot: The rotated Fourier grids of `rot_matrices`, as returned by `rotated_grids`. If None, these are
+        computed here.
+    :param individual: If True, return the backprojection of each image separately (from a single batched
+        adjoint NUFFT), instead of their sum.
+    :return: An L-by-L-by-L volumes corresponding to the sum of the backprojected images (or an L-by-L-by-L-by-n
+        array of the backprojections of each image, if `individual` is True).
     """
     L, _, n = im.shape
     ensure(L == im.shape[1], "im must be LxLxK")
     ensure(n == rot_matrices.shape[2], "No. of rotation matrices must match the number of images")
 
-    pts_rot = rotated_grids(L, rot_matrices)
+    if pts_rot is None:
+        pts_rot = rotated_grids(L, rot_matrices)
     pts_rot = m_reshape(pts_rot, (3, -1))
 
     im_f = centered_fft2(im) / (L**2)
@@ -102,8 +116,12 @@ def im_backproject(im, rot_matrices):
 
     plan = Plan(
         sz=(L, L, L),
-        fourier_pts=pts_rot
+        fourier_pts=pts_rot,
+        dtype=real_dtype(im.dtype)
     )
-    vol = np.real(plan.adjoint(im_f)) / L
+    if individual:
+        vol = np.real(plan.adjoint_batch(im_f, n)) / L
+    else:
+        vol = np.real(plan.adjoint(im_f)) / L
 
     return vol
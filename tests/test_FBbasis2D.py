@@ -1,6 +1,8 @@
 import numpy as np
+import tempfile
 from unittest import TestCase
 
+from aspire import config
 from aspire.basis.fb_2d import FBBasis2D
 
 import os.path
@@ -130,4 +132,39 @@ class FBBasis2DTestCase(TestCase):
                     [0.00000000,  0.00000000,  0.00799977, -0.01398406, -0.01052898, -0.01299636, -0.01446617,  0.00000000]
                 ]
             )
-        ))
\ No newline at end of file
+        ))
+
+    def testFBBasis2DPrecompCache(self):
+        cache_dir = config.basis.cache_dir
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config.basis.cache_dir = tmpdir
+            try:
+                built = FBBasis2D((64, 64))
+                loaded = FBBasis2D((64, 64))
+            finally:
+                config.basis.cache_dir = cache_dir
+
+            # Large tables are memory-mapped, read-only, from the cache
+            self.assertIsInstance(loaded._precomp['radial'], np.memmap)
+            self.assertFalse(loaded._precomp['radial'].flags.writeable)
+            self.assertEqual(loaded.basis_count, built.basis_count)
+            self.assertTrue(np.allclose(loaded.r0, built.r0))
+
+            v = np.random.randn(built.basis_count)
+            self.assertTrue(np.allclose(loaded.evaluate(v), built.evaluate(v)))
+
+    def testFBBasis2DNoPrecompCache(self):
+        # Precomputations are only cached when a cache directory is configured
+        cache_dir = config.basis.cache_dir
+        config.basis.cache_dir = ''
+        try:
+            basis = FBBasis2D((8, 8))
+        finally:
+            config.basis.cache_dir = cache_dir
+        self.assertNotIsInstance(basis._precomp['radial'], np.memmap)
+        self.assertTrue(basis._precomp['radial'].flags.writeable)
+
+    def testFBBasis2DShared(self):
+        self.assertIs(FBBasis2D.shared((8, 8)), FBBasis2D.shared((8, 8)))
+        self.assertIsNot(FBBasis2D.shared((8, 8)), FBBasis2D.shared((8, 8), ell_max=2))
+
@@ -93,3 +93,22 @@ class FFBBasis2DTestCase(TestCase):
             np.load(os.path.join(DATA_DIR, 'ffbbasis2d_vcoeff_out_exp_8_8.npy'))
         ))
 
+    def testFFBBasis2DSinglePrecision(self):
+        x = np.load(os.path.join(DATA_DIR, 'ffbbasis2d_xcoeff_in_8_8.npy'))[..., np.newaxis]
+        v = self.basis.evaluate_t(x)
+
+        v_single = self.basis.evaluate_t(x.astype(np.float32))
+        self.assertEqual(v_single.dtype, np.float32)
+        self.assertTrue(np.allclose(v_single, v, atol=1e-5))
+
+        x_single = self.basis.evaluate(v.astype(np.float32))
+        self.assertEqual(x_single.dtype, np.float32)
+        self.assertTrue(np.allclose(x_single, self.basis.evaluate(v), atol=1e-5))
+
+    def testFFBBasis2DExpandMany(self):
+        x = np.random.randn(8, 8, 6)
+        v = self.basis.expand(x)
+        self.assertEqual(v.shape, (self.basis.basis_count, 6))
+        for i in range(6):
+            self.assertTrue(np.allclose(v[:, i:i+1], self.basis.expand(x[..., i:i+1])))
+        self.assertTrue(np.allclose(self.basis.expand(x, warm_start=True), v))
@@ -1,7 +1,7 @@
 import numpy as np
 from unittest import TestCase
 
-from aspire.basis.basis_func import besselj_zeros, num_besselj_zeros, sph_bessel, real_sph_harmonic
+from aspire.basis.basis_func import besselj_zeros, besselj_zeros_table, num_besselj_zeros, sph_bessel, real_sph_harmonic
 from aspire.basis.basis_func import norm_assoc_legendre, unique_coords_nd, lgwt
 
 
@@ -30,6 +30,25 @@ class BesselTestCase(TestCase):
             ]
         ))
 
+    def testBesselJZerosTable(self):
+        for nu0 in (0, 0.5):
+            k_max, zeros = besselj_zeros_table(nu0, 50)
+            # J_nu has no zeros below 50 for nu >= 42.5 or so
+            self.assertTrue(40 < len(k_max) < 50)
+            self.assertEqual(zeros.shape, (max(k_max), len(k_max)))
+            for ell, k in enumerate(k_max):
+                z = besselj_zeros(nu0 + ell, max(k + 1, 3))
+                self.assertTrue(z[k - 1] < 50 <= z[k])
+                self.assertTrue(np.allclose(zeros[:k, ell], z[:k], rtol=1e-13))
+                self.assertTrue(np.all(zeros[k:, ell] == 0))
+
+        # Tables are cached, and truncated to the requested no. of orders
+        self.assertIs(besselj_zeros_table(0.5, 50)[1], zeros)
+        k_max_5, zeros_5 = besselj_zeros_table(0.5, 50, n_orders=5)
+        self.assertTrue(np.array_equal(k_max_5, k_max[:5]))
+        self.assertTrue(np.array_equal(zeros_5, zeros[:k_max[0], :5]))
+        self.assertFalse(zeros.flags.writeable)
+
     def testSphBesselj(self):
         r = np.array([
             0, 0.785398163397448, 1.11072073453959, 1.36034952317566, 1.57079632679490, 1.75620368276018,
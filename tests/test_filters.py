@@ -1,8 +1,9 @@
 import numpy as np
 from unittest import TestCase
 
+from aspire.image import im_filter
 from aspire.source import SourceFilter
-from aspire.utils.filters import RadialCTFFilter
+from aspire.utils.filters import AbsFilter, CTFFilter, CTFFilterBank, RadialCTFFilter, ScalarFilter
 
 import os.path
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'saved_test_data')
@@ -76,4 +77,50 @@ class SimTestCase(TestCase):
             ])
         ))
 
+    def testCTFFilterBank(self):
+        filters = [
+            CTFFilter(defocus_u=1.5e4, defocus_v=1.8e4, defocus_ang=0.3),
+            CTFFilter(voltage=300, defocus_u=2.2e4, defocus_v=2.0e4, defocus_ang=-1.1, B=50),
+            RadialCTFFilter(pixel_size=5, defocus=2.5e4, alpha=0.1, Cs=2.0)
+        ]
+        bank = CTFFilterBank.from_filters(filters)
+        for L in (8, 9):
+            result = bank.evaluate_grid(L)
+            self.assertEqual(result.shape, (L, L, 3))
+            for k, f in enumerate(filters):
+                self.assertTrue(np.allclose(result[:, :, k], f.evaluate_grid(L)))
+                self.assertTrue(np.allclose(bank[k].evaluate_grid(L), f.evaluate_grid(L)))
+            self.assertTrue(np.allclose(bank.evaluate_grid(L, [2, 0]), result[:, :, [2, 0]]))
+
+        # Evaluated grids are cached (and read-only)
+        self.assertIs(bank.evaluate_grid(8), bank.evaluate_grid(8))
+        self.assertFalse(bank.evaluate_grid(8).flags.writeable)
+
+    def testCTFFilterBankOps(self):
+        filters = [RadialCTFFilter(defocus=d) for d in np.linspace(1.5e4, 2.5e4, 3)]
+        bank = CTFFilterBank.from_filters(filters)
+        multiplier = ScalarFilter(value=2)
+
+        result = (abs(bank) * multiplier).evaluate_grid(8)
+        for k, f in enumerate(filters):
+            self.assertTrue(np.allclose(result[:, :, k], (AbsFilter(f) * multiplier).evaluate_grid(8)))
+
+        bank.evaluate_grid(8)
+        bank.scale(2)
+        for f in filters:
+            f.scale(2)
+        result = bank.evaluate_grid(8)
+        for k, f in enumerate(filters):
+            self.assertTrue(np.allclose(result[:, :, k], f.evaluate_grid(8)))
+
+    def testCTFSourceFilter(self):
+        filters = [RadialCTFFilter(defocus=d) for d in np.linspace(1.5e4, 2.5e4, 7)]
+        source_filter = SourceFilter(filters, n=42)
+        self.assertIsInstance(source_filter.filters, CTFFilterBank)
+
+        im = np.random.randn(8, 8, 10)
+        result = source_filter(im.copy(), start=5, num=10)
+        for i in range(10):
+            f = filters[source_filter.indices[5 + i]]
+            self.assertTrue(np.allclose(result[:, :, i], im_filter(im[:, :, i], f)))
 
@@ -1,12 +1,55 @@
 import numpy as np
+from concurrent import futures
 from unittest import TestCase, skipUnless
 
-from aspire.nfft import Plan, backend_available
+from aspire import config
+
+from aspire.nfft import Plan, backend_available, plan_cache, anufft3, nufft3, nfft_epsilon, nfft_precision
+from aspire.nfft.benchmark import benchmark, bucket, fastest_backend, load_profile
+from aspire.nfft.cache import PlanCache
+from aspire.nfft import threads
+from aspire.nfft.threads import ThreadBudget, openmp_threads, thread_budget
+from aspire.nfft.gridding import GriddingPlan
 
 import os.path
+import tempfile
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'saved_test_data')
 
 
+class CountingPlan(Plan):
+    """
+    A backend-less Plan used to check plan caching behavior.
+    """
+    n_created = 0
+
+    def __init__(self, sz, fourier_pts, epsilon=1e-15, **kwargs):
+        CountingPlan.n_created += 1
+        self.sz = sz
+        self.fourier_pts = fourier_pts
+        self.epsilon = epsilon
+
+
+class DirectPlan(Plan):
+    """
+    A (slow) non-uniform discrete Fourier transform, used as a reference in tests.
+    """
+    def __init__(self, sz, fourier_pts, epsilon=1e-15, **kwargs):
+        self.sz = tuple(sz)
+        self.dim = len(sz)
+        self.fourier_pts = fourier_pts
+        self.num_pts = fourier_pts.shape[1]
+        self.epsilon = epsilon
+        grids = np.meshgrid(*[np.arange(-(n // 2), n - n // 2) for n in sz], indexing='ij')
+        grid = np.vstack([g.flatten('F') for g in grids])
+        self._mat = np.exp(-1j * fourier_pts.T @ grid)
+
+    def transform(self, signal):
+        return self._mat @ signal.flatten('F')
+
+    def adjoint(self, signal):
+        return (self._mat.conj().T @ signal).reshape(self.sz, order='F')
+
+
 class SimTestCase(TestCase):
     def setUp(self):
         pass
@@ -46,4 +89,308 @@ class SimTestCase(TestCase):
         self.assertTrue(np.allclose(
             result,
             [-0.05646675 + 1.503746j, 1.677600 + 0.6610926j, 0.9124417 - 0.7394574j, -0.9136836 - 0.5491410j]
-        ))
\ No newline at end of file
+        ))
+
+    @skipUnless(backend_available('pynfft'), 'unsupported backend')
+    def testPyNfftConcurrent(self):
+        # Cached pynfft plans are shared by all threads, which must not overwrite each other's inputs
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (2, 100))
+        signals = np.random.randn(16, 16, 32)
+        plan = Plan((16, 16), fourier_pts, backend='pynfft')
+        expected = [plan.transform(signals[:, :, i]) for i in range(32)]
+        with futures.ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda i: plan.transform(signals[:, :, i]), range(32)))
+        self.assertTrue(all(np.allclose(r, e) for r, e in zip(results, expected)))
+
+    @skipUnless(backend_available('finufft'), 'unsupported backend')
+    def testFINufftManySizeList(self):
+        # Sizes may be given as lists
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (2, 50))
+        signals = np.random.randn(8, 8, 3)
+        signals_f = np.random.randn(50, 3) + 1j * np.random.randn(50, 3)
+        plan = Plan([8, 8], fourier_pts, epsilon=1e-10, backend='finufft', cache=False)
+        reference = DirectPlan((8, 8), fourier_pts)
+        self.assertTrue(np.allclose(plan.transform_many(signals), reference.transform_many(signals)))
+        self.assertTrue(np.allclose(plan.adjoint_many(signals_f), reference.adjoint_many(signals_f)))
+
+    @skipUnless(backend_available('finufft'), 'unsupported backend')
+    def testFINufftAdjointBatch(self):
+        self._testAdjointBatch('finufft')
+
+    @skipUnless(backend_available('pynfft'), 'unsupported backend')
+    def testPyNfftAdjointBatch(self):
+        self._testAdjointBatch('pynfft')
+
+    def _testAdjointBatch(self, backend):
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (3, 5 * 20))
+        signal_f = np.random.randn(5 * 20) + 1j * np.random.randn(5 * 20)
+        expected = np.stack([DirectPlan((8, 8, 8), fourier_pts[:, 20*i:20*(i+1)]).adjoint(signal_f[20*i:20*(i+1)])
+                             for i in range(5)], axis=-1)
+
+        plan = Plan((8, 8, 8), fourier_pts, epsilon=1e-10, backend=backend, cache=False)
+        self.assertTrue(np.allclose(plan.adjoint_batch(signal_f, 5), expected))
+
+    def testPlanCacheHit(self):
+        plan_cache.clear()
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (3, 100))
+        n_created = CountingPlan.n_created
+
+        plan1 = CountingPlan((8, 8, 8), fourier_pts)
+        plan2 = CountingPlan((8, 8, 8), fourier_pts.copy())
+        self.assertIs(plan1, plan2)
+        self.assertEqual(CountingPlan.n_created, n_created + 1)
+        self.assertEqual((plan_cache.hits, plan_cache.misses), (1, 1))
+
+        # Different geometry, points or precision give a different plan
+        self.assertIsNot(plan1, CountingPlan((16, 16, 16), fourier_pts))
+        self.assertIsNot(plan1, CountingPlan((8, 8, 8), fourier_pts[:, :50]))
+        self.assertIsNot(plan1, CountingPlan((8, 8, 8), fourier_pts, epsilon=1e-6))
+        # Caching can be bypassed explicitly
+        self.assertIsNot(plan1, CountingPlan((8, 8, 8), fourier_pts, cache=False))
+        self.assertEqual(CountingPlan.n_created, n_created + 5)
+
+    def testPlanCacheEviction(self):
+        cache = PlanCache(max_entries=2, max_memory=1)
+        plans = [CountingPlan((8, 8, 8), np.zeros((3, k+1)), cache=False) for k in range(3)]
+        for k, plan in enumerate(plans):
+            self.assertIs(plan, cache.get(k, lambda: plan))
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn(0, cache)
+        self.assertEqual(cache.evictions, 1)
+
+        # A large plan pushes everything else out of a 1 MB cache
+        big_plan = CountingPlan((64, 64, 64), np.zeros((3, 1)), cache=False)
+        cache.get('big', lambda: big_plan)
+        self.assertEqual(len(cache), 1)
+        self.assertIn('big', cache)
+
+    def testTransformMany(self):
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (2, 50))
+        signals = np.random.randn(8, 8, 3)
+        plan = DirectPlan((8, 8), fourier_pts)
+
+        result = plan.transform_many(signals)
+        self.assertEqual(result.shape, (50, 3))
+        for i in range(3):
+            self.assertTrue(np.allclose(result[:, i], plan.transform(signals[..., i])))
+
+    def testAdjointMany(self):
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (2, 50))
+        signals = np.random.randn(50, 3) + 1j * np.random.randn(50, 3)
+        plan = DirectPlan((8, 8), fourier_pts)
+
+        result = plan.adjoint_many(signals)
+        self.assertEqual(result.shape, (8, 8, 3))
+        for i in range(3):
+            self.assertTrue(np.allclose(result[..., i], plan.adjoint(signals[:, i])))
+
+    def testNufft3Many(self):
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (2, 50))
+        signals = np.random.randn(8, 8, 3)
+        reference = DirectPlan((8, 8), fourier_pts, cache=False)
+
+        result = nufft3(signals, fourier_pts, (8, 8))
+        self.assertTrue(np.allclose(result, reference.transform_many(signals), atol=1e-4))
+
+        result = anufft3(result, fourier_pts, (8, 8))
+        self.assertTrue(np.allclose(result, reference.adjoint_many(reference.transform_many(signals)), atol=1e-3))
+
+    def testTransform3(self):
+        vol = np.load(os.path.join(DATA_DIR, 'nfft_volume.npy'))
+        fourier_pts = np.array([
+            [ 0.88952655922411,  0.35922344760724, -0.17107966400962, -0.70138277562649],
+            [ 1.87089316522016,  1.99362869011803,  2.11636421501590,  2.23909973991377],
+            [-3.93035749861843, -3.36417300942290, -2.79798852022738, -2.23180403103185]
+        ])
+
+        plan = Plan(vol.shape, fourier_pts, backend='gridding')
+        result = plan.transform(vol)
+
+        self.assertTrue(np.allclose(
+            result,
+            [-0.05646675 + 1.503746j, 1.677600 + 0.6610926j, 0.9124417 - 0.7394574j, -0.9136836 - 0.5491410j]
+        ))
+
+    def testGridding(self):
+        for sz in [(16,), (8, 8), (9, 7), (7, 9, 8)]:
+            fourier_pts = np.random.uniform(-np.pi, np.pi, (len(sz), 100))
+            reference = DirectPlan(sz, fourier_pts)
+            signal = np.random.randn(*sz, 2)
+            signal_f = np.random.randn(100, 2) + 1j * np.random.randn(100, 2)
+
+            for epsilon in (1e-6, 1e-12):
+                plan = GriddingPlan(sz, fourier_pts, epsilon=epsilon)
+                result = plan.transform_many(signal)
+                expected = reference.transform_many(signal)
+                self.assertLess(np.linalg.norm(result - expected) / np.linalg.norm(expected), 10 * epsilon)
+
+                result = plan.adjoint_many(signal_f)
+                expected = reference.adjoint_many(signal_f)
+                self.assertLess(np.linalg.norm(result - expected) / np.linalg.norm(expected), 10 * epsilon)
+
+    def testGriddingChunked(self):
+        # Plans too large for a precomputed spreading matrix give the same results, chunk by chunk
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (2, 100))
+        signal = np.random.randn(8, 8)
+        signal_f = np.random.randn(100) + 1j * np.random.randn(100)
+        plan = GriddingPlan((8, 8), fourier_pts, epsilon=1e-6)
+
+        max_nnz = config.nfft.gridding_max_nnz
+        try:
+            config.nfft.gridding_max_nnz = 10 * plan.width**2
+            chunked_plan = GriddingPlan((8, 8), fourier_pts, epsilon=1e-6, cache=False)
+        finally:
+            config.nfft.gridding_max_nnz = max_nnz
+        self.assertIsNone(chunked_plan._spread_matrix)
+        self.assertTrue(np.allclose(plan.transform(signal), chunked_plan.transform(signal)))
+        self.assertTrue(np.allclose(plan.adjoint(signal_f), chunked_plan.adjoint(signal_f)))
+
+    def testSinglePrecision(self):
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (3, 100))
+        signal = np.random.randn(8, 8, 8)
+        reference = DirectPlan((8, 8, 8), fourier_pts)
+
+        # Single and double precision plans are distinct in the plan cache
+        plan = Plan((8, 8, 8), fourier_pts, backend='gridding', dtype=np.float32)
+        self.assertIsNot(plan, Plan((8, 8, 8), fourier_pts, backend='gridding'))
+        self.assertEqual(plan.epsilon, np.finfo(np.float32).eps)
+
+        result = nufft3(signal.astype(np.float32), fourier_pts, (8, 8, 8))
+        self.assertEqual(result.dtype, np.complex64)
+        expected = reference.transform(signal)
+        self.assertLess(np.linalg.norm(result - expected) / np.linalg.norm(expected), 1e-5)
+
+        result = anufft3(expected.astype(np.complex64), fourier_pts, (8, 8, 8), real=True)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertTrue(np.allclose(result, np.real(reference.adjoint(expected)), rtol=1e-4, atol=1e-4))
+
+    def testBenchmark(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'nfft_profile.json')
+            profile = benchmark(dims=(2,), sizes=(8,), pts_factors=(1,), epsilons=(1e-6,), backends=['gridding'],
+                                repeat=1, path=path)
+            self.assertEqual(len(profile['results']), 2)
+            self.assertEqual(set(profile['fastest']), {'2,3,6,6,float64', '2,3,6,6,float32'})
+            self.assertEqual(load_profile(path), profile)
+            self.assertEqual(fastest_backend((8, 8), 64, 1e-6, profile=profile), 'gridding')
+
+    def testFastestBackend(self):
+        self.assertEqual(bucket(2, (64, 64), 4096, 1e-6), (2, 6, 12, 6, 'float64'))
+        self.assertEqual(bucket(2, (64, 64), 4096, 1e-6, np.float32), (2, 6, 12, 6, 'float32'))
+        profile = {'fastest': {'2,6,12,6,float64': 'pynfft', '2,8,16,6,float64': 'gridding',
+                               '2,6,12,12,float64': 'finufft', '2,6,12,6,float32': 'gridding'}}
+
+        self.assertEqual(fastest_backend((64, 64), 4096, 1e-6, profile=profile), 'pynfft')
+        # Problems outside of benchmarked buckets use the nearest bucket of the same dimension and precision
+        self.assertEqual(fastest_backend((256, 256), 50000, 1e-6, profile=profile), 'gridding')
+        self.assertEqual(fastest_backend((32, 32), 1000, 1e-11, profile=profile), 'finufft')
+        # Single and double precision plans are benchmarked separately, preferring buckets of their own dtype
+        self.assertEqual(fastest_backend((64, 64), 4096, 1e-6, dtype=np.float32, profile=profile), 'gridding')
+        self.assertEqual(fastest_backend((32, 32), 1000, 1e-11, dtype=np.float32, profile=profile), 'gridding')
+        # Unusable backends are never picked
+        self.assertEqual(fastest_backend((64, 64), 4096, 1e-6, backends=['gridding'], profile=profile), 'gridding')
+        self.assertIsNone(fastest_backend((64, 64, 64), 4096, 1e-6, profile=profile))
+
+    def testPlanCacheSkipsProfile(self):
+        # Generic plans found in the plan cache are returned without consulting the NUFFT profile
+        plan_cache.clear()
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (2, 10))
+        plan = Plan((8, 8), fourier_pts)
+        plan_class = Plan.__dict__['_plan_class']
+        Plan._plan_class = classmethod(lambda cls, *args, **kwargs: self.fail('Backend resolved on a cache hit'))
+        try:
+            self.assertIs(Plan((8, 8), fourier_pts), plan)
+        finally:
+            Plan._plan_class = plan_class
+        # Plans requesting different backends are distinct
+        self.assertIsNot(Plan((8, 8), fourier_pts, backend='gridding'), plan)
+
+    def testPrecisionPolicy(self):
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (2, 10))
+        self.assertEqual(nfft_epsilon(), config.nfft.epsilon)
+        self.assertEqual(Plan((8, 8), fourier_pts, backend='gridding').epsilon, config.nfft.epsilon)
+
+        with nfft_precision(1e-6):
+            self.assertEqual(Plan((8, 8), fourier_pts, backend='gridding').epsilon, 1e-6)
+            with nfft_precision(1e-3):
+                self.assertEqual(nfft_epsilon(), 1e-3)
+                # An explicit epsilon overrides the policy
+                self.assertEqual(Plan((8, 8), fourier_pts, epsilon=1e-9, backend='gridding').epsilon, 1e-9)
+            with nfft_precision(None):
+                self.assertEqual(nfft_epsilon(), 1e-6)
+        self.assertEqual(nfft_epsilon(), config.nfft.epsilon)
+
+    def testPrecisionPolicyThreads(self):
+        # Precisions set in one thread do not affect plans created by other threads
+        with futures.ThreadPoolExecutor(1) as executor:
+            with nfft_precision(1e-3):
+                self.assertEqual(executor.submit(nfft_epsilon).result(), config.nfft.epsilon)
+                self.assertEqual(nfft_epsilon(), 1e-3)
+
+    def testThreadBudget(self):
+        budget = ThreadBudget(8)
+        with budget.reserve(6) as n1:
+            self.assertEqual(n1, 6)
+            with budget.reserve() as n2:
+                self.assertEqual(n2, 2)
+                # Once exhausted, reservations are granted a single thread
+                with budget.reserve(4) as n3:
+                    self.assertEqual(n3, 1)
+                self.assertEqual(budget.in_use, 8)
+        self.assertEqual(budget.in_use, 0)
+        self.assertGreater(ThreadBudget(0).total, 0)
+
+    @skipUnless(threads.ThreadpoolController is not None, 'threadpoolctl not installed')
+    def testOpenMPThreads(self):
+        # The OpenMP limit is only set again when it changes
+        applied = []
+
+        class CountingController:
+            def limit(self, limits):
+                applied.append(limits)
+
+        get_controller = threads._get_openmp_controller
+        threads._get_openmp_controller = CountingController
+        threads._openmp_limit.__dict__.clear()
+        try:
+            for n in (2, 2, 1, 1, 2):
+                with openmp_threads(n):
+                    pass
+        finally:
+            threads._get_openmp_controller = get_controller
+            threads._openmp_limit.__dict__.clear()
+        self.assertEqual(applied, [2, 1, 2])
+
+    def testGriddingThreads(self):
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (3, 100))
+        signal = np.random.randn(8, 8, 8)
+        signal_f = np.random.randn(100) + 1j * np.random.randn(100)
+        plan = GriddingPlan((8, 8, 8), fourier_pts, epsilon=1e-10, n_threads=1)
+        threaded_plan = GriddingPlan((8, 8, 8), fourier_pts, epsilon=1e-10, n_threads=2)
+        self.assertIsNot(plan, threaded_plan)
+
+        total = thread_budget.total
+        try:
+            thread_budget.total = 2
+            self.assertTrue(np.allclose(plan.transform(signal), threaded_plan.transform(signal)))
+            self.assertTrue(np.allclose(plan.adjoint(signal_f), threaded_plan.adjoint(signal_f)))
+        finally:
+            thread_budget.total = total
+
+    def testAdjointBatch(self):
+        fourier_pts = np.random.uniform(-np.pi, np.pi, (3, 5 * 20))
+        signal_f = np.random.randn(5 * 20) + 1j * np.random.randn(5 * 20)
+        expected = np.stack([DirectPlan((8, 8, 8), fourier_pts[:, 20*i:20*(i+1)]).adjoint(signal_f[20*i:20*(i+1)])
+                             for i in range(5)], axis=-1)
+
+        plan = GriddingPlan((8, 8, 8), fourier_pts, epsilon=1e-10)
+        self.assertTrue(np.allclose(plan.adjoint_batch(signal_f, 5), expected))
+        # Groups spread onto separate grids a few at a time still give the same results
+        max_nnz = config.nfft.gridding_max_nnz
+        try:
+            config.nfft.gridding_max_nnz = 2 * int(np.prod(plan.grid_sz))
+            self.assertTrue(np.allclose(plan.adjoint_batch(signal_f, 5), expected))
+        finally:
+            config.nfft.gridding_max_nnz = max_nnz
+        # The base class implementation, applying separate plans to each group
+        self.assertTrue(np.allclose(Plan.adjoint_batch(plan, signal_f, 5), expected))
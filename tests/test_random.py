@@ -1,5 +1,8 @@
+import numpy as np
 from unittest import TestCase
-from aspire.utils.matlab_compat import randi
+from concurrent import futures
+from aspire.utils.matlab_compat import Random, randi, randn
+from aspire.utils.random import indexed_randn, random_stream, spawn_streams
 
 
 class UtilsRandomTestCase(TestCase):
@@ -14,3 +17,54 @@ class UtilsRandomTestCase(TestCase):
         # This should produce identical results to MATLAB `randi(10, 1, 10)` with the same random seed (0)
         self.assertListEqual(l, [9, 10, 2, 10, 7, 1, 3, 6, 10, 10])
 
+    def testIndexedRandn(self):
+        x = indexed_randn((5, 7), np.arange(100), seed=3)
+        self.assertEqual(x.shape, (5, 7, 100))
+        self.assertAlmostEqual(np.mean(x), 0, delta=0.05)
+        self.assertAlmostEqual(np.var(x), 1, delta=0.05)
+
+        # Values only depend on the index they are drawn for
+        self.assertTrue(np.array_equal(indexed_randn((5, 7), np.arange(40, 60), seed=3), x[:, :, 40:60]))
+        self.assertTrue(np.array_equal(indexed_randn((5, 7), [99, 2, 3, 50], seed=3), x[:, :, [99, 2, 3, 50]]))
+        self.assertFalse(np.allclose(indexed_randn((5, 7), np.arange(40, 60), seed=4), x[:, :, 40:60]))
+
+    def testRandomStream(self):
+        # MATLAB-compatible streams reproduce the seeded global random state, without modifying it
+        state = np.random.get_state()
+        with Random(0):
+            expected = np.random.random(10)
+        self.assertTrue(np.array_equal(random_stream(0, matlab=True).random(10), expected))
+        self.assertTrue(np.array_equal(randi(10, 10, seed=random_stream(0, matlab=True)), randi(10, 10, seed=0)))
+        self.assertTrue(np.array_equal(np.random.get_state()[1], state[1]))
+
+        stream = random_stream(7)
+        self.assertIs(random_stream(stream), stream)
+        self.assertTrue(np.array_equal(random_stream(7).random(5), random_stream(7).random(5)))
+
+    def testRandomSeedType(self):
+        # Random only takes integer seeds, and rejects streams without taking its lock
+        with self.assertRaises(AssertionError):
+            Random(random_stream(0))
+        def _draw():
+            with Random(1):
+                return np.random.random()
+
+        with futures.ThreadPoolExecutor(1) as executor:
+            self.assertEqual(executor.submit(_draw).result(timeout=10), _draw())
+
+    def testSpawnStreams(self):
+        children = [child.random(5) for child in spawn_streams(3, 4)]
+        self.assertTrue(np.array_equal(children, [child.random(5) for child in spawn_streams(3, 4)]))
+        self.assertFalse(np.allclose(children[0], children[1]))
+        self.assertTrue(np.array_equal(
+            [child.random(5) for child in spawn_streams(random_stream(3), 2)],
+            [child.random(5) for child in spawn_streams(random_stream(3), 2)]
+        ))
+
+    def testConcurrentSeeds(self):
+        # Draws with different seeds in concurrent threads do not interfere
+        expected = [randn(50, 50, seed=seed) for seed in range(8)]
+        with futures.ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda seed: randn(50, 50, seed=seed), range(8)))
+        for result, e in zip(results, expected):
+            self.assertTrue(np.array_equal(result, e))
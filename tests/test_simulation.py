@@ -1,9 +1,16 @@
 import numpy as np
+import tempfile
 from unittest import TestCase
 
+from aspire import config
+from aspire.nfft import nfft_epsilon, nfft_precision
 from aspire.source import SourceFilter
+from aspire.source import xform
+from aspire.source.relion import RelionStarfileStack
 from aspire.source.simulation import Simulation
-from aspire.utils.filters import RadialCTFFilter
+from aspire.utils.filters import RadialCTFFilter, ScalarFilter
+from aspire.volume import rotated_grids
+from aspire.image import im_filter
 
 import os.path
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'saved_test_data')
@@ -146,3 +153,225 @@ class SimTestCase(TestCase):
             result['corr'][:10],
             [0.99390133, 0.99390133, 0.97658719, 0.99390133, 0.99390133, 0.97658719, 0.97658719, 0.99390133, 0.99390133, 0.99390133]
         ))
+
+    def testSimulationRotatedGrids(self):
+        pts_rot = self.sim.rotated_grids(100, 10)
+        self.assertEqual(pts_rot.shape, (3, 8, 8, 10))
+        self.assertTrue(np.allclose(pts_rot, rotated_grids(8, self.sim.rots[:, :, 100:110])))
+        # Repeated requests for the same block of images are served from the cache
+        self.assertIs(self.sim.rotated_grids(100, 10), pts_rot)
+        self.assertIsNot(self.sim.rotated_grids(100, 11), pts_rot)
+
+    def testSimulationVolForwardMany(self):
+        ims = self.sim.vol_forward(self.sim.vols, 100, 10)
+        self.assertEqual(ims.shape, (8, 8, 10, 2))
+        for k in range(2):
+            self.assertTrue(np.allclose(ims[:, :, :, k], self.sim.vol_forward(self.sim.vols[:, :, :, k], 100, 10),
+                                        atol=1e-6))
+
+    def testSimulationImBackwardIndividual(self):
+        ims = self.sim.images(100, 10)
+        vols = self.sim.im_backward(ims.copy(), 100, individual=True)
+        self.assertEqual(vols.shape, (8, 8, 8, 10))
+        self.assertTrue(np.allclose(vols[:, :, :, 3], self.sim.im_backward(ims[:, :, 3].copy(), 103), atol=1e-6))
+        self.assertTrue(np.allclose(np.sum(vols, axis=-1), self.sim.im_backward(ims.copy(), 100), atol=1e-5))
+
+    def testSimulationIterBatches(self):
+        for prefetch in (0, 2):
+            batches = list(self.sim.iter_batches(300, prefetch=prefetch))
+            self.assertEqual([start for start, _ in batches], [0, 300, 600, 900])
+            self.assertEqual(batches[-1][1].shape, (8, 8, 124))
+            self.assertTrue(np.allclose(batches[1][1], self.sim.images(300, 300)))
+
+    def testSimulationIterBatchesPrecision(self):
+        # Batches loaded by prefetching workers use the NUFFT precision of the caller
+        epsilons = []
+        self.sim.images = lambda start, num, apply_noise=False: epsilons.append(nfft_epsilon()) or np.zeros((8, 8, 1))
+        with nfft_precision(1e-3):
+            list(self.sim.iter_batches(300, prefetch=2))
+        self.assertEqual(epsilons, [1e-3] * 4)
+
+    def testSimulationDiskCache(self):
+        def _sim():
+            return Simulation(
+                n=1024,
+                L=8,
+                filters=SourceFilter(
+                    filters=[RadialCTFFilter(defocus=d) for d in np.linspace(1.5e4, 2.5e4, 7)],
+                    n=1024
+                )
+            )
+
+        def _no_images(start=0, num=None):
+            raise RuntimeError('Images should have been read from the cache')
+
+        chunk_size = config.source.cache_chunk_size
+        config.source.cache_chunk_size = 300
+        try:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                images = self.sim.images(0, 1024)
+                self.sim.cache(cache_dir=cache_dir)
+                # Ranges straddling chunks are read correctly
+                self.assertTrue(np.allclose(self.sim.images(250, 100), images[:, :, 250:350]))
+                self.assertTrue(np.allclose(self.sim.images(0, 1024), images))
+
+                self.sim.whiten(ScalarFilter(dim=2, value=0.02, power=-0.5), cache_dir=cache_dir)
+                whitened = self.sim.images(0, 1024)
+                self.assertTrue(np.allclose(whitened, images / np.sqrt(0.02)))
+
+                # An identical source finds its whitened images in the cache, without computing any images
+                sim = _sim()
+                sim._images = _no_images
+                sim.whiten(ScalarFilter(dim=2, value=0.02, power=-0.5), cache_dir=cache_dir)
+                self.assertTrue(np.allclose(sim.images(0, 1024), whitened))
+
+                # Automatically determined whitening filters are cached along with the images
+                sim = _sim()
+                sim.whiten(cache_dir=cache_dir)
+                sim_cached = _sim()
+                sim_cached._images = _no_images
+                sim_cached.whiten(cache_dir=cache_dir)
+                self.assertTrue(np.allclose(sim_cached.images(0, 1024), sim.images(0, 1024)))
+                self.assertTrue(np.allclose(sim_cached.filters.evaluate_grid(8), sim.filters.evaluate_grid(8)))
+
+                # A different source does not
+                sim = Simulation(n=1024, L=8)
+                sim._images = _no_images
+                with self.assertRaises(RuntimeError):
+                    sim.whiten(cache_dir=cache_dir)
+        finally:
+            config.source.cache_chunk_size = chunk_size
+
+    def testSimulationLazyWhiten(self):
+        images = self.sim.images(0, 1024)
+        whiten_filter = RadialCTFFilter(defocus=2e4)
+        self.sim.whiten(whiten_filter)
+        # Whitening is applied to each batch as requested, without caching all images
+        self.assertIsNone(self.sim._im)
+        self.assertTrue(np.allclose(self.sim.images(100, 10), im_filter(images[:, :, 100:110], whiten_filter)))
+
+    def testSimulationFusedXforms(self):
+        images = self.sim.images(0, 100)
+        xforms = [xform.Downsample(6), xform.Whiten(ScalarFilter(dim=2, value=0.02, power=-0.5)),
+                  xform.PhaseFlip(self.sim.filters)]
+
+        # Consecutive Fourier transforms (whitening and phase flipping, after downsampling) share a single FFT/iFFT pair
+        fft_calls = []
+        centered_fft2 = xform.centered_fft2
+        xform.centered_fft2 = lambda x: fft_calls.append(x.shape) or centered_fft2(x)
+        try:
+            fused = xform.apply_xforms(xforms, images, np.arange(100))
+        finally:
+            xform.centered_fft2 = centered_fft2
+        self.assertEqual(fft_calls, [(6, 6, 100)])
+
+        separate = images
+        for x in xforms:
+            separate = x.apply(separate, np.arange(100))
+        self.assertEqual(fused.shape, (6, 6, 100))
+        self.assertTrue(np.allclose(fused, separate))
+
+    def testSimulationPhaseFlip(self):
+        images = self.sim.images(0, 100)
+        h = self.sim.filters.evaluate_grid(8)
+        self.sim.phase_flip()
+        # Phase flipped images are filtered by the absolute values of their CTFs instead
+        self.assertTrue(np.allclose(self.sim.filters.evaluate_grid(8), np.abs(h)))
+        flipped = self.sim.images(0, 100)
+        self.assertTrue(np.allclose(xform.PhaseFlip(self.sim.filters).apply(flipped, np.arange(100)), flipped))
+        # Phase flipping preserves Fourier magnitudes
+        self.assertTrue(np.allclose(np.abs(np.fft.fft2(flipped, axes=(0, 1))), np.abs(np.fft.fft2(images, axes=(0, 1)))))
+
+    def testSimulationNormalizeBackground(self):
+        self.sim.normalize_background(bg_radius=0.5)
+        self.sim.mask(radius=0.9)
+        images = self.sim.images(0, 100)
+        r = xform.grid_2d(8)['r']
+        self.assertTrue(np.all(images[r > 0.9] == 0))
+        background = images[(r > 0.5) & (r <= 0.9)]
+        self.assertFalse(np.allclose(background, 0))
+
+    def testSimulationPhiloxNoise(self):
+        noise_rng = config.source.noise_rng
+        config.source.noise_rng = 'philox'
+        try:
+            noise = self.sim.images(0, 1024, apply_noise=True) - self.sim.images(0, 1024)
+            self.assertAlmostEqual(np.var(noise), 1, delta=0.05)
+            # Noise is independent of batching
+            batches = np.concatenate([im for _, im in self.sim.iter_batches(300, apply_noise=True)], axis=2)
+            self.assertTrue(np.allclose(batches - self.sim.images(0, 1024), noise, atol=1e-5))
+        finally:
+            config.source.noise_rng = noise_rng
+
+    def testSimulationSubset(self):
+        images = self.sim.images(0, 1024)
+        idx = np.random.RandomState(0).permutation(1024)[:300]
+        subset = self.sim[idx]
+        self.assertEqual(subset.n, 300)
+        self.assertTrue(np.allclose(subset.images(0, 300), images[:, :, idx]))
+        self.assertTrue(np.allclose(subset.images(100, 50), images[:, :, idx[100:150]]))
+        self.assertTrue(np.allclose(subset.rots, self.sim.rots[:, :, idx]))
+        self.assertTrue(np.allclose(subset.filters.evaluate_grid(8)[:, :, subset.filters.indices],
+                                    self.sim.filters.evaluate_grid(8)[:, :, self.sim.filters.indices[idx]]))
+        self.assertTrue(np.allclose(subset.vol_forward(self.sim.vols[:, :, :, 0], 0, 300),
+                                    self.sim.vol_forward(self.sim.vols[:, :, :, 0], 0, 1024)[:, :, idx]))
+        # Noise of subsets is the noise of the selected images of the parent
+        noise = self.sim.images(0, 1024, apply_noise=True) - images
+        self.assertTrue(np.allclose(subset.images(0, 300, apply_noise=True) - subset.images(0, 300),
+                                    noise[:, :, idx], atol=1e-5))
+
+    def testSimulationSubsetSlice(self):
+        # Half-sets selected by slices share the metadata of the parent, and can be subset further
+        half = self.sim[1::2]
+        self.assertEqual(half.n, 512)
+        self.assertTrue(np.shares_memory(half.rots, self.sim.rots))
+        self.assertTrue(np.allclose(half[:10].images(0, 10), self.sim.images(0, 20)[:, :, 1::2]))
+        mask = self.sim.states == 1
+        self.assertTrue(np.all(self.sim.subset(mask).states == 1))
+        # Transforms of a subset do not affect its parent
+        half.set_max_resolution(4)
+        self.assertEqual(half.images(0, 10).shape, (4, 4, 10))
+        self.assertEqual(self.sim.images(0, 10).shape, (8, 8, 10))
+        self.assertTrue(np.allclose(self.sim.offsets[:, 1::2], 2 * half.offsets))
+
+    def testSimulationSubsetParentTransformed(self):
+        # Transforms of a parent after a subset is created do not affect the subset
+        half = self.sim[::2]
+        images = half.images(0, 10)
+        offsets = half.offsets.copy()
+        grids = half.filters.image_grids(8, 0, 10)
+
+        self.sim.set_max_resolution(4)
+        self.assertEqual(half.L, 8)
+        self.assertTrue(np.allclose(half.images(0, 10), images))
+        self.assertTrue(np.allclose(half.offsets, offsets))
+        self.assertTrue(np.allclose(half.filters.image_grids(8, 0, 10), grids))
+
+    def testSimulationSave(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            star_path = os.path.join(tmpdir, 'sim.star')
+            self.sim.save(star_path, batch_size=100, images_per_file=300)
+            self.assertEqual(len([f for f in os.listdir(tmpdir) if f.endswith('.mrcs')]), 4)
+
+            src = RelionStarfileStack(star_path, pixel_size=10)
+            self.assertEqual((src.n, src.L), (1024, 8))
+            self.assertTrue(np.allclose(src.images(0, 1024)[:, :, :], self.sim.images(0, 1024), atol=1e-6))
+            self.assertTrue(np.allclose(src.rots, self.sim.rots))
+            self.assertTrue(np.allclose(src.offsets, self.sim.offsets))
+            self.assertTrue(np.all(src.states == self.sim.states))
+            self.assertTrue(np.allclose(src.filters.image_grids(8), self.sim.filters.image_grids(8)))
+
+    def testSimulationSetMaxResolution(self):
+        images = self.sim.images(0, 10)
+        grids = self.sim.filters.image_grids(8)
+        offsets = self.sim.offsets.copy()
+
+        self.sim.set_max_resolution(4)
+        images_ds = self.sim.images(0, 10)
+        self.assertEqual(images_ds.shape, (4, 4, 10))
+        self.assertTrue(np.allclose(images_ds, xform.Downsample(4).apply(images, np.arange(10)), atol=1e-6))
+
+        # The filters and offsets of the source are rescaled, but images are still simulated with the original ones
+        self.assertTrue(np.allclose(self.sim.sim_filters.image_grids(8), grids))
+        self.assertTrue(np.allclose(self.sim.sim_offsets, offsets))
+        self.assertTrue(np.allclose(self.sim.offsets, offsets / 2))
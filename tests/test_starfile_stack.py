@@ -1,6 +1,12 @@
 from unittest import TestCase
+import tempfile
 import numpy as np
+import mrcfile
 
+from aspire import config
+from aspire.io.mrcs import MrcsHandlePool, mrcs_pool, read_mrcs_images
+from aspire.io.starfile import load_parsed, parse_star
+from aspire.source.starfile import StarfileStack
 from aspire.source.relion import RelionStarfileStack
 from aspire.image import ImageStack
 from aspire.utils.filters import ScalarFilter
@@ -55,3 +61,109 @@ class StarfileTestCase(TestCase):
             np.load(os.path.join(DATA_DIR, 'starfile_image_0_whitened.npy')),
             atol=1e-6
         ))
+
+
+class StarfileMmapTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stacks = []
+        lines = ['', 'data_', '', 'loop_', '_rlnImageName #1']
+        for i in range(3):
+            stack = np.random.randn(10, 8, 8).astype('float32')
+            with mrcfile.new(os.path.join(self.tmpdir.name, f'stack{i}.mrcs')) as mrc:
+                mrc.set_data(stack)
+            self.stacks.append(stack)
+            # Images of different stacks are interleaved in the star file
+            lines.extend(f'{j:06d}@stack{i}.mrcs' for j in range(10, 0, -3))
+        self.filepath = os.path.join(self.tmpdir.name, 'particles.star')
+        with open(self.filepath, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def tearDown(self):
+        mrcs_pool.close()
+        self.tmpdir.cleanup()
+
+    def testImages(self):
+        src = StarfileStack(self.filepath, n_workers=2)
+        self.assertEqual(src.n, 12)
+
+        expected = np.stack([self.stacks[i][j-1].T for i in range(3) for j in range(10, 0, -3)], axis=-1)
+        self.assertTrue(np.allclose(src.images()[:, :, :], expected))
+        self.assertTrue(np.allclose(src.images(5, 4)[:, :, :], expected[:, :, 5:9]))
+
+    def testHandlePool(self):
+        pool = MrcsHandlePool(max_open=2)
+        for i in range(3):
+            with pool.open(os.path.join(self.tmpdir.name, f'stack{i}.mrcs')) as mrc:
+                self.assertEqual(mrc.data.shape, (10, 8, 8))
+        self.assertEqual(len(pool), 2)
+        pool.close()
+        self.assertEqual(len(pool), 0)
+
+        images = read_mrcs_images(os.path.join(self.tmpdir.name, 'stack1.mrcs'), [7, 2, 5])
+        self.assertTrue(np.allclose(images, self.stacks[1][[7, 2, 5]]))
+
+
+class StarfileParseTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.parsed_cache_dir = config.starfile.parsed_cache_dir
+        config.starfile.parsed_cache_dir = os.path.join(self.tmpdir.name, 'parsed')
+
+        with mrcfile.new(os.path.join(self.tmpdir.name, 'stack.mrcs')) as mrc:
+            mrc.set_data(np.random.randn(4, 8, 8).astype('float32'))
+
+        # A RELION 3.1 star file, with optics groups and particles in separate data blocks
+        self.filepath = os.path.join(self.tmpdir.name, 'particles.star')
+        with open(self.filepath, 'w') as f:
+            f.write('\n'.join([
+                '', '# version 30001', '', 'data_optics', '', 'loop_',
+                '_rlnOpticsGroupName #1', '_rlnOpticsGroup #2', '_rlnVoltage #3', '_rlnSphericalAberration #4',
+                '_rlnAmplitudeContrast #5', '_rlnImagePixelSize #6',
+                'opticsGroup1 1 300.0 2.7 0.1 2.0',
+                'opticsGroup2 2 200.0 2.0 0.07 2.0',
+                '', '', '# version 30001', '', 'data_particles', '', 'loop_',
+                '_rlnImageName #1', '_rlnDefocusU #2', '_rlnDefocusV #3', '_rlnDefocusAngle #4', '_rlnOpticsGroup #5',
+                '_rlnOriginXAngst #6', '_rlnOriginYAngst #7',
+                '000001@stack.mrcs 15000 15500 10 1 2.0 -4.0',
+                '000002@stack.mrcs 16000 16500 20 2 0.0 1.0',
+                '000004@stack.mrcs 17000 17500 30 1 -2.0 0.0',
+                ''
+            ]))
+
+    def tearDown(self):
+        config.starfile.parsed_cache_dir = self.parsed_cache_dir
+        mrcs_pool.close()
+        self.tmpdir.cleanup()
+
+    def testParseBlocks(self):
+        blocks = parse_star(self.filepath, RelionStarfileStack.column_mappings)
+        self.assertEqual(list(blocks), ['optics', 'particles'])
+        self.assertEqual(blocks['optics'].shape, (2, 6))
+        self.assertTrue(np.allclose(blocks['particles']['rlnDefocusU'], [15000, 16000, 17000]))
+
+    def testOpticsGroups(self):
+        src = RelionStarfileStack(self.filepath)
+        self.assertTrue(np.allclose(src.df['rlnVoltage'], [300, 200, 300]))
+        self.assertTrue(np.allclose(src.offsets, [[1, 0, -1], [-2, 0.5, 0]]))
+        self.assertEqual(len(src.filters.filters), 3)
+        self.assertEqual(src.images(0, 3).shape, (8, 8, 3))
+
+    def testParsedCopy(self):
+        df = StarfileStack.star2df(self.filepath, RelionStarfileStack.column_mappings)
+        parsed = load_parsed(self.filepath, ('star2df', RelionStarfileStack.column_mappings))
+        self.assertIsNotNone(parsed)
+        self.assertTrue(parsed['rlnImageName'].equals(df['rlnImageName']))
+
+        # Parsed copies of modified star files are ignored
+        with open(self.filepath, 'a') as f:
+            f.write('000003@stack.mrcs 18000 18500 40 2 0.0 0.0\n')
+        self.assertIsNone(load_parsed(self.filepath, ('star2df', RelionStarfileStack.column_mappings)))
+        self.assertEqual(len(StarfileStack.star2df(self.filepath, RelionStarfileStack.column_mappings)), 4)
+
+    def testNoParsedCopy(self):
+        # Parsed copies are only kept when a directory for them is configured
+        config.starfile.parsed_cache_dir = ''
+        StarfileStack.star2df(self.filepath, RelionStarfileStack.column_mappings)
+        self.assertIsNone(load_parsed(self.filepath, ('star2df', RelionStarfileStack.column_mappings)))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'parsed')))
@@ -1,9 +1,11 @@
 from unittest import TestCase
 import numpy as np
 
-from aspire.utils.coor_trans import grid_2d, grid_3d
+from aspire.utils.rotation import Rotations
+from aspire.utils.coor_trans import grid_2d, grid_3d, erot
 from aspire.utils.matrix import roll_dim, unroll_dim, im_to_vec, vec_to_im, vol_to_vec, vec_to_vol, \
     vecmat_to_volmat, volmat_to_vecmat, mat_to_vec, symmat_to_vec_iso, vec_to_symmat, vec_to_symmat_iso
+from aspire.utils.optimize import block_cg
 
 import os.path
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'saved_test_data')
@@ -338,3 +340,54 @@ class UtilsTestCase(TestCase):
                 ])
             )
         )
+
+    def testRotationsEuler(self):
+        angles = np.vstack((
+            np.random.uniform(0, 2 * np.pi, 100),
+            np.random.uniform(0, np.pi, 100),
+            np.random.uniform(-np.pi, np.pi, 100)
+        ))
+        angles[:, :2] = [[0.3, 1.2], [0, np.pi], [0.4, 0.5]]
+        rots = Rotations.from_euler(angles)
+        self.assertEqual(rots.legacy.shape, (3, 3, 100))
+        self.assertTrue(np.allclose(rots.legacy[:, :, 5], erot(angles[:, 5])))
+        # The legacy layout is a view of the rotations
+        self.assertIs(rots.legacy.base, rots.matrices)
+        self.assertTrue(np.allclose(Rotations.from_euler(rots.to_euler()).matrices, rots.matrices))
+
+    def testRotationsQuaternions(self):
+        q = np.random.randn(100, 4)
+        q[:4] = np.eye(4)
+        rots = Rotations.from_quaternions(q)
+        self.assertTrue(np.allclose(rots.matrices @ rots.matrices.transpose((0, 2, 1)), np.eye(3)))
+        self.assertTrue(np.allclose(np.linalg.det(rots.matrices), 1))
+        q_rec = rots.to_quaternions()
+        q = q / np.linalg.norm(q, axis=1, keepdims=True)
+        self.assertTrue(np.allclose(np.abs(np.sum(q * q_rec, axis=1)), 1))
+        self.assertTrue(np.allclose(Rotations.from_quaternions(q_rec).matrices, rots.matrices))
+
+    def testRotationsCompose(self):
+        rots = Rotations.from_quaternions(np.random.randn(10, 4))
+        self.assertTrue(np.allclose((rots @ rots.inv()).matrices, np.eye(3)))
+        composed = rots[3] @ rots
+        self.assertEqual(len(composed), 10)
+        self.assertTrue(np.allclose(composed.legacy[:, :, 7], rots.legacy[:, :, 3] @ rots.legacy[:, :, 7]))
+        self.assertTrue(np.allclose(Rotations.from_legacy(rots.legacy).matrices, rots.matrices))
+
+    def testBlockCG(self):
+        a = np.random.randn(20, 20)
+        a = a @ a.T + np.eye(20)
+        b = np.random.randn(20, 5)
+        b[:, 2] = 0
+        x, info = block_cg(lambda v: a @ v, b, tol=1e-12)
+        self.assertEqual(info, 0)
+        self.assertTrue(np.allclose(x, np.linalg.solve(a, b)))
+
+        # Single right-hand sides and warm starts
+        x, info = block_cg(lambda v: a @ v, b[:, 0], x0=b[:, 0], tol=1e-12)
+        self.assertEqual(x.shape, (20,))
+        self.assertTrue(np.allclose(x, np.linalg.solve(a, b[:, 0])))
+
+        # Columns that have not converged are reported
+        _, info = block_cg(lambda v: a @ v, b, tol=1e-12, max_iter=1)
+        self.assertEqual(info, 4)